@@ -17,19 +17,24 @@ from doctest import Example
 from lxml.doctestcompare import LXMLOutputChecker, NOPARSE_MARKUP, PARSE_XML
 
 # Zato
-from ._common import default_ns, Elem, no_value
+from ._common import default_ns, Elem, event, no_value
 from ._json import json
+from ._template import placeholder, Template
 from ._util import bunchify
-from ._xml import xml
+from ._xml import xml, xml_backend
 
 # For flake8
 bunchify = bunchify
 default_ns = default_ns
 Elem = Elem
+event = event
 json = json
 NOPARSE_MARKUP = NOPARSE_MARKUP
 no_value = no_value
+placeholder = placeholder
+Template = Template
 xml = xml
+xml_backend = xml_backend
 
 def compare_xml(expected, given, diff_format=PARSE_XML):
     checker = LXMLOutputChecker()
@@ -21,6 +21,7 @@ from six import integer_types, iteritems, PY3, string_types as basestring
 from ujson import dumps
 
 # zato-elem
+from zato.elem._json_writer import iter_json, iter_json_bytes, write_json
 from zato.elem._serial import DictSerializer, no_value
 
 # cmp function as found in https://bitbucket.org/gutworth/six/pull-requests/36/add-cmp-function-removed-in-py3/diff
@@ -41,6 +42,13 @@ else: # pragma: no cover
 top_level = '_zato_toplevel'
 ns_prefix_max_len = 11 # It's 10 characters + 1 for slice syntax
 
+# Elements cache default namespaces inherited from their ancestors. This is the value of the cache before it is computed
+# and after an ancestor, or the element itself, is given a default namespace.
+_unknown_default_ns = object()
+
+# How many results of resolve_name each NSMap caches - once there are more, the cache is cleared and starts to fill in anew.
+name_cache_max_size = 10000
+
 class default_ns:
     decr =   {'decr':'http://www.w3.org/2002/07/decrypt#'}
     dsig =   {'dsig':'http://www.w3.org/2000/09/xmldsig#'}
@@ -61,9 +69,45 @@ class default_ns:
     xsl =    {'xsl': 'http://www.w3.org/1999/XSL/Transform'}
     zato =   {'zato':'https://zato.io/ns/20130518'}
 
+class event:
+    """ Types of events that Elem.iter_events produces and Elem.from_events builds documents out of.
+    """
+    start = 'start'
+    attr = 'attr'
+    text = 'text'
+    end = 'end'
+
 # ################################################################################################################################
 
 class NSMap(dict):
+    """ Maps namespace prefixes to namespaces. Elements share their parent's map internally, until they declare namespaces
+    of their own, including through a copy of their map that the ns_map property returns.
+    """
+    __slots__ = ('name_cache',)
+
+    def __init__(self, *args, **kwargs):
+        super(NSMap, self).__init__(*args, **kwargs)
+        self.name_cache = {}
+
+    def _invalidates_cache(func):
+        def _inner(self, *args, **kwargs):
+            self.name_cache = {}
+            return func(self, *args, **kwargs)
+        return _inner
+
+    __setitem__ = _invalidates_cache(dict.__setitem__)
+    __delitem__ = _invalidates_cache(dict.__delitem__)
+    clear = _invalidates_cache(dict.clear)
+    pop = _invalidates_cache(dict.pop)
+    popitem = _invalidates_cache(dict.popitem)
+    setdefault = _invalidates_cache(dict.setdefault)
+    update = _invalidates_cache(dict.update)
+
+    # Python 3.9+ only
+    if hasattr(dict, '__ior__'):
+        __ior__ = _invalidates_cache(dict.__ior__)
+
+    del _invalidates_cache
 
     def __iadd__(self, *other):
         for maybe_dict in other:
@@ -74,11 +118,64 @@ class NSMap(dict):
                     self.update(dict_)
         return self
 
+class NSMapCopy(NSMap):
+    """ A copy of an element's namespace map, returned by the ns_map property. Reading it has no effect on the element,
+    which starts to use the copy when it is first modified, as long as the element's map has not been replaced since
+    the copy was made. Any later modifications are seen by the element too.
+    """
+    __slots__ = ('elem', 'base')
+
+    def __init__(self, elem):
+        super(NSMapCopy, self).__init__(elem._zato_ns_map)
+        self.elem = elem
+        self.base = elem._zato_ns_map
+
+    def _modifies_elem(func):
+        def _inner(self, *args, **kwargs):
+            out = func(self, *args, **kwargs)
+            if self.elem._zato_ns_map is self.base:
+                self.base = self
+                self.elem._set_ns_map(self)
+            return out
+        return _inner
+
+    __setitem__ = _modifies_elem(NSMap.__setitem__)
+    __delitem__ = _modifies_elem(NSMap.__delitem__)
+    clear = _modifies_elem(NSMap.clear)
+    pop = _modifies_elem(NSMap.pop)
+    popitem = _modifies_elem(NSMap.popitem)
+    setdefault = _modifies_elem(NSMap.setdefault)
+    update = _modifies_elem(NSMap.update)
+
+    # Python 3.9+ only
+    if hasattr(dict, '__ior__'):
+        __ior__ = _modifies_elem(NSMap.__ior__)
+
+    del _modifies_elem
+
+# ################################################################################################################################
+
+class FrozenDict(dict):
+    """ A dict that cannot be modified, used as a shared placeholder for containers that have not been allocated yet.
+    """
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('{} cannot be modified'.format(self.__class__.__name__))
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _immutable
+
+class FrozenNSMap(FrozenDict, NSMap):
+    """ An NSMap that cannot be modified in place, used by elements that have no namespaces at all.
+    """
+
 # ################################################################################################################################
 
 class NSInfo(object):
     """ Contains information about namespaces a given element or attribute is aware of and uses.
     """
+    __slots__ = ('prefix', 'value', 'map', '_map_inverted', 'is_default')
+
     # For namespaces without initial prefixes.
     ns_counter = count(0)
 
@@ -87,7 +184,7 @@ class NSInfo(object):
     def __init__(self, value=None, map=None):
         self.prefix = None
         self.value = value
-        self.map = map or NSMap()
+        self.map = NSMap() if map is None else map
         self._map_inverted = {v:k for k, v in iteritems(self.map)} if self.map else {}
 
         # Default NS is one that was set by a user explicitely
@@ -124,33 +221,73 @@ class NSInfo(object):
         self._map_inverted[self.value] = None
         self.is_default = is_default
 
+class FrozenNSInfo(NSInfo):
+    """ An NSInfo that cannot be modified, used as a shared placeholder by elements that have no namespaces.
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        _set = object.__setattr__
+        _set(self, 'prefix', None)
+        _set(self, 'value', None)
+        _set(self, 'map', _no_ns_map)
+        _set(self, '_map_inverted', _no_dict)
+        _set(self, 'is_default', False)
+
+    def __setattr__(self, name, value):
+        raise TypeError('{} cannot be modified'.format(self.__class__.__name__))
+
 # ################################################################################################################################
 
-def get_ns(name, ns_map, parent, is_elem=True):
-    """ Returns namespace prefix, namespace itself of an element or attribute + info if it's a default one.
+def resolve_name(name, ns_map):
+    """ Returns namespace prefix, namespace, name without prefix, name with a prefix and name in Clark notation
+    of an element or attribute. Prefix and namespace are None if name has no prefix that ns_map knows of.
+    Results are cached by NSMap objects, other mappings are not cached.
     """
-    # TODO: The following block is a hot-spot
+    if isinstance(ns_map, NSMap):
+        name_cache = ns_map.name_cache
+        result = name_cache.get(name)
+        if result is not None:
+            return result
+    else:
+        name_cache = None
 
     # Don't look up anything if it doesn't seem to have a NS prefix
     sep_idx = name.find('_', 0, ns_prefix_max_len)
-    if sep_idx:
+    if sep_idx > 0 and name[:sep_idx] in ns_map:
         prefix = name[:sep_idx]
-        if prefix in ns_map:
-            return prefix, ns_map[prefix], False
+        ns = ns_map[prefix]
+        name_no_ns = name[sep_idx+1:]
+        result = prefix, ns, name_no_ns, '{}:{}'.format(prefix, name_no_ns), '{%s}%s' % (ns, name_no_ns)
+
+    # No NS at all
+    else:
+        result = None, None, name, name, name
 
-    # Speed up access
-    _top_level = top_level
+    if name_cache is not None:
+        if len(name_cache) >= name_cache_max_size:
+            name_cache.clear()
+        name_cache[name] = result
+
+    return result
+
+# ################################################################################################################################
+
+def get_ns(name, ns_map, parent, is_elem=True):
+    """ Returns namespace prefix, namespace itself of an element or attribute + info if it's a default one.
+    """
+    prefix, ns = resolve_name(name, ns_map)[:2]
+    if prefix is not None:
+        return prefix, ns, False
 
     # Could be a default one for an element but not for an attribute - attributes don't inherit namespaces from parents.
     if is_elem:
-        if parent.ns.is_default and parent.ns.value is not None:
-            return parent.ns.prefix, parent.ns.value, True
+        if parent._zato_ns_info.is_default and parent._zato_ns_info.value is not None:
+            return parent._zato_ns_info.prefix, parent._zato_ns_info.value, True
         else:
-            while parent is not None and parent._zato_elem_name != _top_level:
-                if parent.ns.is_default and parent.ns.value is not None:
-                    return parent.ns.prefix, parent.ns.value, True
-
-                parent = parent._zato_parent
+            ns_info = parent._get_default_ns()
+            if ns_info is not None:
+                return ns_info.prefix, ns_info.value, True
 
     # No NS at all
     return None, None, False
@@ -160,28 +297,22 @@ def get_ns(name, ns_map, parent, is_elem=True):
 def get_ns_name(name, ns_map):
     """ Returns prefix + name of an element or atribute.
     """
-    # Don't look up anything if it doesn't seem to have a NS prefix
-    sep_idx = name.find('_', 0, ns_prefix_max_len)
-    if sep_idx:
-        prefix = name[:sep_idx]
-        if prefix in ns_map:
-            name_no_ns = name[sep_idx+1:]
-            name = '{}:{}'.format(prefix, name_no_ns)
-            return name_no_ns, name
-
-    # No NS at all
-    return name, name
+    return resolve_name(name, ns_map)[2:4]
 
 # ################################################################################################################################
 
 class Attr(object):
+    __slots__ = ('orig_name', 'name', 'name_no_ns', 'full_name', 'clark_name', '_zato_value', 'ns_prefix', 'ns')
+
     def __init__(self, name, value=None, ns_map=None, parent=None):
         self.orig_name = name
         self.name = name[1:] # [1:] to chop off the attribute indicator
-        self.name_no_ns = get_ns_name(self.name, ns_map)[0]
+
+        # Attributes don't inherit namespaces from parents so there is no need to call get_ns
+        self.ns_prefix, self.ns, self.name_no_ns, _, self.clark_name = resolve_name(self.name, ns_map)
+
         self.full_name = '{}{}'.format(name[0], self.name_no_ns)
         self._zato_value = value
-        self.ns_prefix, self.ns, _ = get_ns(self.name, ns_map, parent, False)
 
     def __repr__(self):
         return '<{} at {} name:`{}` value:`{}`>'.format(
@@ -195,7 +326,65 @@ class Attr(object):
 
 # ################################################################################################################################
 
+
+# Shared by all elements until they need containers of their own - none of these may be modified in place.
+_no_children = ()
+_no_children_names = frozenset()
+_no_dict = FrozenDict()
+_no_ns_map = FrozenNSMap()
+_no_ns_info = FrozenNSInfo()
+
+# ################################################################################################################################
+
+def _copy_ns_info(ns_info):
+    """ Returns a copy of NSInfo object so that elements don't share them with other documents, e.g. with their template.
+    """
+    if ns_info is _no_ns_info:
+        return ns_info
+
+    out = NSInfo.__new__(NSInfo)
+    out.prefix = ns_info.prefix
+    out.value = ns_info.value
+    out.map = ns_info.map
+    out._map_inverted = dict(ns_info._map_inverted)
+    out.is_default = ns_info.is_default
+
+    return out
+
+def _copy_attr(attr, value):
+    """ Returns a copy of an attribute, with a new value.
+    """
+    out = Attr.__new__(Attr)
+    out.orig_name = attr.orig_name
+    out.name = attr.name
+    out.name_no_ns = attr.name_no_ns
+    out.full_name = attr.full_name
+    out.clark_name = attr.clark_name
+    out._zato_value = value
+    out.ns_prefix = attr.ns_prefix
+    out.ns = attr.ns
+
+    return out
+
+# ################################################################################################################################
+
 class Elem(object):
+    """ A node in a tree of elements. Children are not kept in instance's __dict__, there is none, so as to save memory -
+    __getattr__ looks them up by name instead. Subclasses should declare __slots__ too if they don't need a __dict__.
+    """
+    __slots__ = ('_zato_elem_name', '_zato_value', '_zato_parent', '_zato_ns_info', '_zato_ns_map', '_zato_children',
+        '_zato_children_names',
+        '_zato_children_by_name', '_zato_list_children', '_zato_list_group', '_zato_list_idx', '_zato_attrs_ordered',
+        '_zato_incl_empty_text', '_zato_attrs', '_zato_full_name_value', '_zato_default_ns',
+        '_zato_cache', '_zato_shadow', '_zato_shadow_elem')
+
+    # Same for all elements
+    _zato_top_level_name = top_level
+
+    # If True, output of to_json and to_xml is cached for each subtree and reused until an element of the subtree changes.
+    # Changes are tracked when values and attributes are set, elements are added and namespaces are declared through
+    # elements - setting _zato_value of attributes directly is not tracked.
+    _zato_cache_output = False
 
     # Used by the .path attribute
     _zato_path_prefix = ''
@@ -206,18 +395,29 @@ class Elem(object):
 # ################################################################################################################################
 
     def __init__(self, name=top_level, value=no_value, parent=None, attrs_ordered=False, incl_empty_text=False):
-        self._zato_elem_name = name
-        self._zato_value = value
-        self._zato_parent = parent
-        self._zato_ns_info = NSInfo()
-        self._zato_children = []
-        self._zato_children_names = set()
-        self._zato_list_children = {}
-        self._zato_attrs_ordered = attrs_ordered
-        self._zato_incl_empty_text = incl_empty_text
-        self._zato_attrs = OrderedDict() if attrs_ordered else {}
-        self._zato_full_name_value = None
-        self._zato_top_level_name = top_level
+
+        # Internal attributes are set directly rather than through self.__setattr__ which is much slower.
+        _set = object.__setattr__
+
+        _set(self, '_zato_elem_name', name)
+        _set(self, '_zato_value', value)
+        _set(self, '_zato_parent', parent)
+        _set(self, '_zato_ns_info', _no_ns_info)
+        _set(self, '_zato_ns_map', _no_ns_map)
+        _set(self, '_zato_children', _no_children)
+        _set(self, '_zato_children_names', _no_children_names)
+        _set(self, '_zato_children_by_name', _no_dict)
+        _set(self, '_zato_list_children', _no_dict)
+        _set(self, '_zato_list_group', None)
+        _set(self, '_zato_list_idx', None)
+        _set(self, '_zato_attrs_ordered', attrs_ordered)
+        _set(self, '_zato_incl_empty_text', incl_empty_text)
+        _set(self, '_zato_attrs', _no_dict)
+        _set(self, '_zato_full_name_value', None)
+        _set(self, '_zato_default_ns', _unknown_default_ns)
+        _set(self, '_zato_cache', None)
+        _set(self, '_zato_shadow', None)
+        _set(self, '_zato_shadow_elem', None)
 
 # ################################################################################################################################
 
@@ -255,6 +455,10 @@ class Elem(object):
         """ Sets either a value of an individual list element or that of an attribute.
         """
         elem = self.__getitem__(label)._zato_value = value
+        if self._zato_cache_output:
+            self._drop_cache()
+        if self._zato_shadow is not None:
+            self._on_value_set()
         return elem
 
 # ################################################################################################################################
@@ -288,10 +492,20 @@ class Elem(object):
         """ Invoked when an attribute of a Python instance cannot be found.
         Dynamically creates a new element in the tree of elements.
         """
+        # Special names are looked up by Python itself, e.g. __dict__ or __deepcopy__, and must not become elements
+        if name.startswith('__'):
+            raise AttributeError(name)
+
         if name[0] in self._zato_attr_prefix_setattr:
             return self._get_attr_by_name(name)
         else:
-            return self._new_elem(name, self)
+            # For list elements, it is the most recently added one that is returned
+            list_child = self._zato_list_children.get(name)
+            if list_child:
+                return list_child[-1]
+
+            existing_child = self._zato_children_by_name.get(name)
+            return existing_child if existing_child is not None else self._new_elem(name, self)
 
 # ################################################################################################################################
 
@@ -306,6 +520,9 @@ class Elem(object):
                 return
 
             elif not isinstance(value, Elem):
+                if self._zato_cache_output:
+                    self._drop_cache()
+
                 existing_child = self.get_child(name)
                 if existing_child is not None:
                     existing_child._zato_value = value
@@ -317,46 +534,95 @@ class Elem(object):
                         self._new_elem(name, self, value)
                         return
             else:
-                print(3333, name, value)
+                self._graft(name, value)
+                return
+
+        elif name == '_zato_value':
+            object.__setattr__(self, name, value)
+            if self._zato_cache_output:
+                self._drop_cache()
+            if self._zato_shadow is not None:
+                self._on_value_set()
+            return
 
         object.__setattr__(self, name, value)
 
 # ################################################################################################################################
 
     def get_child(self, name):
-        # TODO: This could be sped up by using a dict to keep children names in addition to self._zato_children,
-        # in that manner there would be no iteration here
-        for child in self._zato_children:
-            if child._zato_elem_name == name:
-                return child
+        """ Returns the first child of that name or None if there is no such child. In the case of list elements,
+        this is the one under index 0.
+        """
+        return self._zato_children_by_name.get(name)
 
     def has_list_child(self, child):
-        # TODO: Same or similar speed up as in get_child
-        if self._zato_list_children:
-            for children in self._zato_list_children.values():
-                for _child in children:
-                    if child._full_zato_name == _child._full_zato_name:
-                        return True
+        """ Returns True if child is an element of any of self's lists. Membership is checked by identity.
+        """
+        return child._zato_list_group is not None and child._zato_parent is self
 
 # ################################################################################################################################
 
     @property
     def ns(self):
-        return self._zato_ns_info
+        return self._get_ns_info()
 
     @ns.setter
     def ns(self, value):
-        self._zato_ns_info.set_default_ns(value)
+        ns_info = self._get_ns_info()
+        was_default = ns_info.is_default and ns_info.value is not None
+        ns_info.set_default_ns(value)
+
+        if self._zato_cache_output:
+            self._drop_cache()
+        if self._zato_shadow is not None:
+            self._on_tree_changed()
+
+        # Descendants may have cached a default namespace inherited from above self - it is self's one that they should use now.
+        if not was_default:
+            self._drop_default_ns()
 
 # ################################################################################################################################
 
     @property
     def ns_map(self):
-        return self._zato_ns_info.map
+        """ Returns a copy of self's namespace map, which may be modified in place. Maps are shared with other elements
+        internally, so self starts to use the copy only once it is modified - changes to it are seen by self and children
+        added from then on only.
+        """
+        return NSMapCopy(self)
 
     @ns_map.setter
     def ns_map(self, value):
-        self._zato_ns_info.map.update(value)
+        """ Declares new namespaces - self stops sharing its parent's map and uses a new one, with the new namespaces added.
+        """
+        if value is not self._zato_ns_map:
+            ns_map = NSMap(self._zato_ns_map)
+            ns_map.update(value)
+            self._set_ns_map(ns_map)
+
+    def _set_ns_map(self, ns_map):
+        """ Makes self use a new namespace map or, if it is the one self uses already, tells self it was modified.
+        """
+        if ns_map is self._zato_ns_map:
+
+            # Descendants sharing the map may have cached output from before it was modified
+            if self._zato_cache_output:
+                stack = list(self._zato_children)
+                while stack:
+                    elem = stack.pop()
+                    if elem._zato_ns_map is ns_map:
+                        object.__setattr__(elem, '_zato_cache', None)
+                    stack.extend(elem._zato_children)
+        else:
+            object.__setattr__(self, '_zato_ns_map', ns_map)
+
+            if self._zato_ns_info is not _no_ns_info:
+                self._zato_ns_info.map = ns_map
+
+        if self._zato_cache_output:
+            self._drop_cache()
+        if self._zato_shadow is not None:
+            self._on_tree_changed()
 
 # ################################################################################################################################
 
@@ -392,7 +658,7 @@ class Elem(object):
         if not self._zato_full_name_value:
             idx = self._get_list_idx()
             idx = '[{}]'.format(idx) if idx is not None else ''
-            self._zato_full_name_value = '{}{}'.format(get_ns_name(self._zato_elem_name, self.ns_map)[1], idx)
+            self._zato_full_name_value = '{}{}'.format(get_ns_name(self._zato_elem_name, self._zato_ns_map)[1], idx)
 
         return self._zato_full_name_value
 
@@ -400,15 +666,20 @@ class Elem(object):
     def _no_ns_zato_name(self):
         """ Name of the element without its namespace prefix, if any.
         """
-        # Don't look up anything if it doesn't seem to have a NS prefix
-        if '_' in self._zato_elem_name[:ns_prefix_max_len]:
-            sep_idx = self._zato_elem_name.find('_', 0, ns_prefix_max_len)
-            if sep_idx:
-                prefix = self._zato_elem_name[:sep_idx]
-                if prefix in self.ns_map:
-                    return self._zato_elem_name[sep_idx+1:]
+        return resolve_name(self._zato_elem_name, self._zato_ns_map)[2]
 
-        return self._zato_elem_name
+    @property
+    def _clark_zato_name(self):
+        """ Name of the element in Clark notation, i.e. {namespace}name, or its name without a prefix if it has no namespace.
+        """
+        ns = self._zato_ns_info.value
+        _, prefix_ns, name_no_ns, _, clark_name = resolve_name(self._zato_elem_name, self._zato_ns_map)
+
+        if ns is None:
+            return name_no_ns
+
+        # It may be a default namespace rather than one from a prefix
+        return clark_name if ns == prefix_ns else '{%s}%s' % (ns, name_no_ns)
 
 # ################################################################################################################################
 
@@ -422,44 +693,107 @@ class Elem(object):
         else:
             return orig_value
 
-    def pretty(self, max_chars=20, emphasize_with='', indent=2, indent_with=' ', level=0):
+    def pretty(self, max_chars=20, emphasize_with='', indent=2, indent_with=' ', level=0, stream=None, max_elems=None,
+            max_depth=None, max_list_items=None):
         """ Returns a pretty representation of the tree of elements.
         @max_chars - how many characters of string values to return
         @emphasize_with - vertical separator to emphasize indentation with
         @indent - how much space to add on each level
         @indent_with - horizontal indentation character
         @level - level of indentation to start with, defaults to -1 to account for the internal top level element
+        @stream - text file object to write the representation to as it is produced, in which case None is returned
+        @max_elems - how many elements to show at most
+        @max_depth - how many levels of elements to show at most, counting from self
+        @max_list_items - how many elements of each list to show at most
+        Elements not shown because of the limits are replaced with lines ending in ... or [...] with a count of them.
         """
-        if self._zato_elem_name != top_level:
-            out = '{}{}{}'.format(indent_with * level * indent, emphasize_with, self._full_zato_name)
-        else:
-            out = ''
+        lines = self._iter_pretty(max_chars, emphasize_with, indent, indent_with, level, max_elems, max_depth, max_list_items)
 
-        if self._zato_value != no_value:
-            out += ' {}'.format(self._get_value_max_chars(self._zato_value, max_chars))
+        if stream is None:
+            return '\n'.join(lines).encode('utf-8')
 
-        # Display attributes before elements ..
-        for attr in self.attrs:
-            out += '\n{}#{} {}'.format(
-                indent_with * (level+1) * indent, attr.name, self._get_value_max_chars(attr._zato_value, max_chars))
+        # The first line is always there, even if it is an empty one
+        stream.write(next(lines))
+        batch = []
 
-        for child in self._zato_children:
-            out += '\n' + child.pretty(
-                max_chars, emphasize_with, indent, indent_with, level+1 if self._zato_elem_name != top_level else level
-                ).decode('utf-8')
+        for line in lines:
+            batch.append(line)
+            if len(batch) == 1000:
+                stream.write('\n' + '\n'.join(batch))
+                batch[:] = []
+
+        if batch:
+            stream.write('\n' + '\n'.join(batch))
 
-        return out.encode('utf-8')
+    def _iter_pretty(self, max_chars, emphasize_with, indent, indent_with, level, max_elems, max_depth, max_list_items):
+        """ Yields lines of the output of pretty one by one, walking the tree iteratively.
+        """
+        get_value = self._get_value_max_chars
+        shown = 0
+
+        # Elements along with their levels of indentation and depth, or lines standing for elements that are not shown
+        stack = [(self, level, 0 if self._zato_elem_name == top_level else 1)]
+        pop = stack.pop
+
+        while stack:
+            elem, level, depth = pop()
+
+            if level is None:
+                yield elem
+                continue
+
+            is_top = elem._zato_elem_name == top_level
+
+            if is_top:
+                line = ''
+            else:
+                if shown == max_elems:
+                    yield '{}{}...'.format(indent_with * level * indent, emphasize_with)
+                    return
+                shown += 1
+                line = '{}{}{}'.format(indent_with * level * indent, emphasize_with, elem._full_zato_name)
+
+            if elem._zato_value != no_value:
+                line += ' {}'.format(get_value(elem._zato_value, max_chars))
+
+            yield line
+
+            # Display attributes before elements ..
+            for attr in elem.attrs:
+                yield '{}#{} {}'.format(indent_with * (level+1) * indent, attr.name, get_value(attr._zato_value, max_chars))
+
+            children = elem._zato_children
+            if not children:
+                continue
+
+            child_level = level if is_top else level + 1
+            child_indent = indent_with * child_level * indent
+
+            if depth == max_depth:
+                yield '{}{}... (+{})'.format(child_indent, emphasize_with, len(children))
+                continue
+
+            items = []
+
+            for child in children:
+                if max_list_items is not None and elem.has_list_child(child) and child._zato_list_idx >= max_list_items:
+                    if child._zato_list_idx == max_list_items:
+                        items.append(('{}{}{}[...] (+{})'.format(
+                            child_indent, emphasize_with, get_ns_name(child._zato_elem_name, child._zato_ns_map)[1],
+                            len(child._zato_list_group) - max_list_items), None, None))
+                    continue
+
+                items.append((child, child_level, depth + 1))
+
+            items.reverse()
+            stack.extend(items)
 
 # ################################################################################################################################
 
     def _get_list_idx(self):
         """ Returns idx in self parent's _zato_list_children as long as this is a list element at all.
         """
-        if self._zato_parent._zato_list_children:
-            values = self._zato_parent._zato_list_children.values()
-            for children in values:
-                if self in children:
-                    return children.index(self)
+        return self._zato_list_idx
 
 # ################################################################################################################################
 
@@ -475,30 +809,184 @@ class Elem(object):
         """ Adds namespace information to an element or attribute + extracts actual name
         of element/attribute without namespace prefix (if any).
         """
-        self.ns_map = self._zato_parent.ns_map
+        # Namespace maps are shared with parents until self declares namespaces of its own
+        object.__setattr__(self, '_zato_ns_map', self._zato_parent._zato_ns_map)
 
-        name, ns, is_default = get_ns(name, self.ns_map, self._zato_parent)
-        if is_default:
-            self.ns.set_default_ns(ns)
-        else:
-            self.ns.set_ns(ns)
+        name, ns, is_default = get_ns(name, self._zato_ns_map, self._zato_parent)
+
+        # Elements without namespaces keep on sharing the placeholder NSInfo object
+        if ns is not None:
+            if is_default:
+                self._get_ns_info().set_default_ns(ns)
+            else:
+                self._get_ns_info().set_ns(ns)
+
+# ################################################################################################################################
+
+    def _get_default_ns(self):
+        """ Returns NSInfo of the nearest element, self included, with a default namespace, or None if there is none.
+        Top-level elements are not taken into account. Results are cached so it is an O(1) operation in the common case.
+        """
+        stale = []
+        elem = self
+        ns_info = None
+
+        while elem is not None and elem._zato_elem_name != top_level:
+            if elem._zato_default_ns is not _unknown_default_ns:
+                ns_info = elem._zato_default_ns
+                break
+
+            stale.append(elem)
+
+            if elem._zato_ns_info.is_default and elem._zato_ns_info.value is not None:
+                ns_info = elem._zato_ns_info
+                break
+
+            elem = elem._zato_parent
+
+        for elem in stale:
+            elem._zato_default_ns = ns_info
+
+        return ns_info
+
+    def _drop_default_ns(self):
+        """ Drops default namespaces cached by self and its descendants. Elements that have not cached any yet are skipped,
+        along with their descendants - these would have cached one only if their parent had done it first. The same goes
+        for elements with a default namespace of their own, which is the one that they and their descendants use.
+        """
+        _set = object.__setattr__
+        _set(self, '_zato_default_ns', _unknown_default_ns)
+        stack = list(self._zato_children)
+
+        while stack:
+            elem = stack.pop()
+            if elem._zato_default_ns is _unknown_default_ns or elem._zato_default_ns is elem._zato_ns_info:
+                continue
+
+            _set(elem, '_zato_default_ns', _unknown_default_ns)
+            stack.extend(elem._zato_children)
+
+    def _get_ns_info(self):
+        """ Returns self's NSInfo, allocating it first if self shares the placeholder one.
+        """
+        if self._zato_ns_info is _no_ns_info:
+            object.__setattr__(self, '_zato_ns_info', NSInfo(map=_no_ns_map))
+            self._zato_ns_info.map = self._zato_ns_map
+        return self._zato_ns_info
+
+    def _get_attrs(self):
+        """ Returns self's attributes container, allocating it first if self shares the placeholder one.
+        """
+        if self._zato_attrs is _no_dict:
+            object.__setattr__(self, '_zato_attrs', OrderedDict() if self._zato_attrs_ordered else {})
+        return self._zato_attrs
+
+    def _get_list_child(self, name):
+        """ Returns self's list of children of a given name, allocating it first if need be.
+        """
+        if self._zato_list_children is _no_dict:
+            object.__setattr__(self, '_zato_list_children', {})
+        return self._zato_list_children.setdefault(name, [])
+
+    def _add_child(self, elem):
+        """ Makes self aware of a new child, allocating containers for children first if self has none yet.
+        """
+        if self._zato_children is _no_children:
+            _set = object.__setattr__
+            _set(self, '_zato_children', [])
+            _set(self, '_zato_children_names', set())
+            _set(self, '_zato_children_by_name', {})
+
+        self._zato_children.append(elem)
+        self._zato_children_names.add(elem._zato_elem_name)
+        self._zato_children_by_name.setdefault(elem._zato_elem_name, elem)
 
 # ################################################################################################################################
 
-    def _new_elem(self, name, parent, value=no_value):
-        """ Creates a new element, sets its namespace and makes the parent aware of it.
+    def _new_elem(self, name, parent, value=no_value, set_ns=True):
+        """ Creates a new element, sets its namespace and makes the parent aware of it. Namespaces may be skipped
+        if it is known upfront that there are none in the whole tree.
         """
         elem = self.__class__(
             name, value=value, parent=parent, attrs_ordered=parent._zato_attrs_ordered,
             incl_empty_text=self._zato_incl_empty_text)
-        elem._set_ns(name)
-        elem._zato_elem_name = name
-        setattr(parent, elem._zato_elem_name, elem)
-        parent._zato_children.append(elem)
-        parent._zato_children_names.add(name)
+        if set_ns:
+            elem._set_ns(name)
+        parent._add_child(elem)
+
+        if parent._zato_cache_output:
+            parent._drop_cache()
+        if parent._zato_shadow is not None:
+            parent._on_child_added(elem)
 
         return elem
 
+    def _new_list_elem(self, name, value=no_value, set_ns=True):
+        """ Creates a new element at the end of self's list of children of that name. The list's first element
+        replaces a non-list child of the same name, if there is any.
+        """
+        list_child = self._get_list_child(name)
+
+        elem = self._new_elem(name, self, value, set_ns)
+        object.__setattr__(elem, '_zato_list_group', list_child)
+        object.__setattr__(elem, '_zato_list_idx', len(list_child))
+        list_child.append(elem)
+
+        if elem._zato_list_idx == 0:
+            existing = self._zato_children_by_name[name]
+            if existing is not elem:
+                self._zato_children.remove(existing)
+                self._zato_children_by_name[name] = elem
+                if self._zato_shadow is not None:
+                    self._on_child_removed(existing)
+
+        return elem
+
+# ################################################################################################################################
+
+    def _graft(self, name, other):
+        """ Copies value, attributes and children of another element, possibly a top-level one, to self's child of that name.
+        The child is created if it does not exist yet. The other element is left as it is and later changes to either of
+        the two are not seen by the other one.
+        """
+        elem = self.get_child(name)
+        if elem is None:
+            elem = self._new_elem(name, self)
+
+        if self._zato_cache_output:
+            elem._drop_cache()
+        if self._zato_shadow is not None:
+            self._on_tree_changed()
+
+        elem._zato_value = other._zato_value
+        _set = object.__setattr__
+
+        # Pairs of an element to copy from and the one its children and attributes are copied to
+        stack = [(other, elem)]
+
+        while stack:
+            source, target = stack.pop()
+
+            if source._zato_attrs:
+                attrs = target._get_attrs()
+                for key, attr in iteritems(source._zato_attrs):
+                    attrs[key] = _copy_attr(attr, attr._zato_value)
+
+            for child in source._zato_children:
+                copy = self.__class__(child._zato_elem_name, child._zato_value, target, target._zato_attrs_ordered,
+                    target._zato_incl_empty_text)
+                _set(copy, '_zato_ns_info', _copy_ns_info(child._zato_ns_info))
+                _set(copy, '_zato_ns_map', child._zato_ns_map)
+
+                if child._zato_list_group is not None:
+                    list_child = target._get_list_child(child._zato_elem_name)
+                    _set(copy, '_zato_list_group', list_child)
+                    _set(copy, '_zato_list_idx', len(list_child))
+                    list_child.append(copy)
+
+                target._add_child(copy)
+                stack.append((child, copy))
+
 # ################################################################################################################################
 
     def _validate_get_item_idx(self, list_child, idx, len_list_child):
@@ -533,7 +1021,7 @@ class Elem(object):
         Otherwise, IndexError is raised.
         """
         # All children of our parent with the same name as ours, i.e. our siblings.
-        list_child = self._zato_parent._zato_list_children.setdefault(self._zato_elem_name, [])
+        list_child = self._zato_parent._zato_list_children.get(self._zato_elem_name, _no_children)
         len_list_child = len(list_child)
 
         # Raises IndexError if invalid idx
@@ -543,15 +1031,7 @@ class Elem(object):
 
         # New element
         if idx == len_list_child:
-            elem = self._new_elem(self._zato_elem_name, self._zato_parent)
-            list_child.append(elem)
-
-            if idx == 0:
-                for child in self._zato_parent._zato_children:
-                    if child._full_zato_name == self._full_zato_name:
-                        self._zato_parent._zato_children.remove(child)
-
-            return elem
+            return self._zato_parent._new_list_elem(self._zato_elem_name)
 
         # Update existing element
         else:
@@ -560,12 +1040,50 @@ class Elem(object):
 # ################################################################################################################################
 
     def _get_attr_by_name(self, name, value=None):
-        return self._zato_attrs.setdefault(name, Attr(name, value, ns_map=self.ns_map, parent=self))
+        attr = self._zato_attrs.get(name)
+        if attr is None:
+            attr = self._get_attrs()[name] = Attr(name, value, ns_map=self._zato_ns_map, parent=self)
+            if self._zato_cache_output:
+                self._drop_cache()
+            if self._zato_shadow is not None:
+                self._on_value_set()
+        return attr
+
+    def _drop_cache(self):
+        """ Drops output cached for self and all of its ancestors, whose output includes that of self.
+        """
+        elem = self
+        while elem is not None:
+            if elem._zato_cache is not None:
+                object.__setattr__(elem, '_zato_cache', None)
+            elem = elem._zato_parent
+
+# ################################################################################################################################
+
+    # Subclasses may keep a shadow of each document, e.g. an lxml tree, and update it as the document changes rather than
+    # build it anew each time. Elements of such a document refer to the shadow in _zato_shadow and to their own parts
+    # of it in _zato_shadow_elem. The methods below are called only for elements with a shadow and do nothing here.
+
+    def _on_value_set(self):
+        """ Called after self's value or attributes changed.
+        """
+
+    def _on_child_added(self, child):
+        """ Called after a new child was added to self.
+        """
+
+    def _on_child_removed(self, child):
+        """ Called after child stopped being one of self's children.
+        """
+
+    def _on_tree_changed(self):
+        """ Called after a change that the shadow cannot follow, e.g. namespaces were declared, and a new one is needed.
+        """
 
 # ################################################################################################################################
 
     def append(self, value):
-        self.__setitem__(len(self._zato_parent._zato_list_children.setdefault(self._zato_elem_name, [])), value)
+        self.__setitem__(len(self._zato_parent._zato_list_children.get(self._zato_elem_name, _no_children)), value)
 
 # ################################################################################################################################
 
@@ -678,6 +1196,54 @@ class Elem(object):
                 on_list_child(
                     idx, child._zato_elem_name if include_ns else child._no_ns_zato_name, child, opaque)
 
+# ################################################################################################################################
+
+    def iter_events(self):
+        """ Yields SAX-like events describing self and its descendants in document order, as tuples of:
+        * (event.start, name, is_list, ns) - ns is a default namespace explicitly set for the element, if any
+        * (event.attr, name, value) - for each attribute, right after start of the element it belongs to
+        * (event.text, value) - if the element has a value, after its attributes
+        * (event.end, name)
+        Top-level elements yield events of their attributes and children only. The tree is walked iteratively
+        and each event is produced only when requested, so events may be filtered or transformed lazily.
+        """
+        stack = [self]
+        pop = stack.pop
+        push = stack.append
+
+        while stack:
+            elem = pop()
+
+            # End of an element, pushed when its start was yielded
+            if elem.__class__ is tuple:
+                yield elem
+                continue
+
+            is_top = elem._zato_elem_name == top_level
+
+            if not is_top:
+                ns = None
+                ns_info = elem._zato_ns_info
+
+                # Default namespaces that are inherited need not be repeated
+                if ns_info.is_default and ns_info.value is not None:
+                    parent_ns_info = elem._zato_parent._get_default_ns()
+                    if parent_ns_info is None or parent_ns_info.value != ns_info.value:
+                        ns = ns_info.value
+
+                yield event.start, elem._zato_elem_name, elem._zato_list_group is not None, ns
+
+            for attr in elem._zato_attrs.values():
+                yield event.attr, attr.name, attr._zato_value
+
+            if not is_top:
+                if elem._zato_value != no_value:
+                    yield event.text, elem._zato_value
+                push((event.end, elem._zato_elem_name))
+
+            if elem._zato_children:
+                stack.extend(reversed(elem._zato_children))
+
 # ################################################################################################################################
 
     def to_dict(self, text_key='text', attr_prefix='#', include_ns=False, serializer=DictSerializer):
@@ -689,6 +1255,190 @@ class Elem(object):
 # ################################################################################################################################
 
     def to_json(self, text_key='text', include_ns=False, dumps_func=dumps):
-        """ Dumps a tree of nodes to JSON.
+        """ Dumps a tree of nodes to JSON. If output is cached, JSON is produced directly, without a dict in between,
+        unless another dumps_func is given.
+        """
+        if self._zato_cache_output and dumps_func is dumps:
+            return ''.join(iter_json(self, text_key, include_ns=include_ns))
+
+        return dumps_func(self.to_dict(text_key, include_ns=include_ns))
+
+    def to_json_stream(self, dest, text_key='text', attr_prefix='#', include_ns=False, buffer_size=65536):
+        """ Writes a JSON representation of self to a binary file object or a file of a given name, in chunks of at least
+        buffer_size bytes, without building a dict first. Output is the same, byte for byte, as the one to_json produces.
+        """
+        is_own_file = isinstance(dest, basestring)
+        dest = open(dest, 'wb') if is_own_file else dest
+
+        try:
+            write_json(self, dest, text_key, attr_prefix, include_ns, buffer_size)
+        finally:
+            if is_own_file:
+                dest.close()
+
+    def iter_json(self, text_key='text', attr_prefix='#', include_ns=False, chunk_size=65536, http_chunked=False):
+        """ Yields a JSON representation of self as bytes, in chunks of at least chunk_size bytes, e.g. to be sent
+        in an HTTP response body as each chunk is produced. If http_chunked is True, chunks are framed
+        according to chunked transfer coding of HTTP/1.1, including the final, empty, chunk.
+        """
+        return iter_json_bytes(self, text_key, attr_prefix, include_ns, chunk_size, http_chunked)
+
+# ################################################################################################################################
+
+    def to_template(self):
+        """ Returns a template that new documents of the same shape as self's can be created out of.
+        """
+        # Imported here because _template itself imports from this module
+        from zato.elem._template import Template
+        return Template(self)
+
+# ################################################################################################################################
+
+    @classmethod
+    def _new_doc(cls, ns_map, attrs_ordered, incl_empty_text):
+        doc = cls(attrs_ordered=attrs_ordered, incl_empty_text=incl_empty_text)
+        if ns_map:
+            doc.ns_map = ns_map
+        return doc
+
+    @classmethod
+    def from_dict(cls, data, text_key='text', attr_prefix='#', ns_map=None, attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document built out of a dict in the format produced by to_dict. Keys starting with attr_prefix
+        become attributes, text_key is the value of an element and lists become lists of elements. Keys may use
+        namespace prefixes from ns_map, e.g. ns1_foo.
+        """
+        doc = cls._new_doc(ns_map, attrs_ordered, incl_empty_text)
+        stack = [(doc, data)]
+        _set = object.__setattr__
+
+        # Without a namespace map, there can be no namespaces in the document at all
+        set_ns = bool(ns_map)
+
+        while stack:
+            elem, data = stack.pop()
+
+            for key, value in iteritems(data):
+
+                # Values of top-level elements are never serialized so it must be a child named like text_key
+                if key == text_key and elem is not doc:
+                    _set(elem, '_zato_value', value)
+
+                elif key.startswith(attr_prefix):
+                    elem._get_attr_by_name('_' + key[len(attr_prefix):], value)
+
+                else:
+                    # Empty lists cannot be lists of elements so they are kept as values, as in doc.a.b = []
+                    if isinstance(value, list) and value:
+                        items = [(elem._new_list_elem(key, set_ns=set_ns), item) for item in value]
+                    else:
+                        items = [(elem._new_elem(key, elem, set_ns=set_ns), value)]
+
+                    for child, value in items:
+                        if isinstance(value, dict):
+                            stack.append((child, value))
+                        elif value is not None:
+                            _set(child, '_zato_value', value)
+
+        return doc
+
+# ################################################################################################################################
+
+    def _get_path_elem(self, segment):
+        """ Returns self's child pointed to by a single segment of a path, e.g. foo or foo[2], creating it if need be.
+        A new list element may be created only if its index is the length of the list.
+        """
+        if segment[-1] == ']':
+            name, idx = segment[:-1].split('[')
+            idx = int(idx)
+        else:
+            name, idx = segment, None
+
+        # Paths use full names of elements, e.g. ns1:foo, whereas names of elements are ns1_foo
+        name = name.replace(':', '_', 1)
+
+        # Like with doc.a.b, it is the most recently added element of a list that a segment without an index points to
+        if idx is None:
+            list_child = self._zato_list_children.get(name)
+            if list_child:
+                return list_child[-1]
+
+            elem = self._zato_children_by_name.get(name)
+            return elem if elem is not None else self._new_elem(name, self)
+
+        list_child = self._zato_list_children.get(name, _no_children)
+        if idx < len(list_child):
+            return list_child[idx]
+
+        elif idx == len(list_child):
+            return self._new_list_elem(name)
+
+        raise IndexError('Cannot access idx {}, {}[{}] is missing'.format(idx, name, len(list_child)))
+
+    @classmethod
+    def from_paths(cls, items, ns_map=None, attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document built out of (path, value) pairs, e.g. ('a.b[0].c', 123) or ('a.b._attr', 'abc'),
+        in the same format as .path of elements and attributes. Elements on paths that do not exist yet are created
+        and for lists, the same rules apply as for doc.a.b[idx], that is, only the next index of a list may be given.
+        """
+        doc = cls._new_doc(ns_map, attrs_ordered, incl_empty_text)
+        path_prefix = cls._zato_path_prefix
+        path_sep = cls._zato_path_sep
+        _set = object.__setattr__
+
+        for path, value in items:
+            if path_prefix and path.startswith(path_prefix):
+                path = path[len(path_prefix):]
+
+            segments = path.split(path_sep)
+            elem = doc
+
+            for segment in segments[:-1]:
+                elem = elem._get_path_elem(segment)
+
+            last = segments[-1]
+
+            if last[0] in cls._zato_attr_prefix_setattr:
+                elem._get_attr_by_name('_' + last[1:])._zato_value = value
+            else:
+                _set(elem._get_path_elem(last), '_zato_value', value)
+
+        return doc
+
+    @classmethod
+    def from_events(cls, events, ns_map=None, attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document built out of events in the format produced by iter_events. Events are consumed
+        one at a time so they may come from any iterable, e.g. a generator filtering events of another document.
         """
-        return dumps_func(self.to_dict(text_key, include_ns))
+        doc = cls._new_doc(ns_map, attrs_ordered, incl_empty_text)
+        elem = doc
+        _set = object.__setattr__
+
+        for item in events:
+            kind = item[0]
+
+            if kind == event.start:
+                _, name, is_list, ns = item
+                elem = elem._new_list_elem(name) if is_list else elem._new_elem(name, elem)
+                if ns is not None:
+                    elem.ns = ns
+
+            elif kind == event.attr:
+                elem._get_attr_by_name('_' + item[1])._zato_value = item[2]
+
+            elif kind == event.text:
+                # Values of top-level elements are never serialized
+                if elem is not doc:
+                    _set(elem, '_zato_value', item[1])
+
+            elif kind == event.end:
+                if elem is doc or item[1] != elem._zato_elem_name:
+                    raise ValueError('Unexpected end of `{}`, current element is `{}`'.format(item[1], elem.path))
+                elem = elem._zato_parent
+
+            else:
+                raise ValueError('Unknown event `{}`'.format(kind))
+
+        if elem is not doc:
+            raise ValueError('Missing end of `{}`'.format(elem.path))
+
+        return doc
@@ -10,11 +10,122 @@ Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
 https://zato.io
 """
 
+# stdlib
+from io import open
+
+# six
+from six import string_types as basestring
+
+# ujson
+from ujson import dumps, loads
+
 # Zato
 from zato.elem._common import Elem
 
 # ################################################################################################################################
 
+class _NDJSONWriter(object):
+    """ Writes documents or dicts as newline-delimited JSON, one per line, to a binary file object or a file of a given name.
+    Lines are buffered and written out in batches of at least buffer_size bytes.
+    """
+    def __init__(self, dest, buffer_size=65536, text_key='text', attr_prefix='#', include_ns=False):
+        self.is_own_file = isinstance(dest, basestring)
+        self.dest = open(dest, 'wb') if self.is_own_file else dest
+        self.buffer_size = buffer_size
+        self.text_key = text_key
+        self.attr_prefix = attr_prefix
+        self.include_ns = include_ns
+        self.buffer = []
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignored):
+        self.close()
+
+    def write(self, doc):
+        if isinstance(doc, Elem):
+            doc = doc.to_dict(self.text_key, self.attr_prefix, self.include_ns)
+
+        line = dumps(doc).encode('utf8') + b'\n'
+        self.buffer.append(line)
+        self.buffered += len(line)
+
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, docs):
+        for doc in docs:
+            self.write(doc)
+
+    def flush(self):
+        self.dest.write(b''.join(self.buffer))
+        self.buffer[:] = []
+        self.buffered = 0
+
+    def close(self):
+        """ Writes out all buffered lines. The underlying file is closed only if it was opened by the writer itself.
+        """
+        self.flush()
+        if self.is_own_file:
+            self.dest.close()
+        else:
+            self.dest.flush()
+
+# ################################################################################################################################
+
 class json(Elem):
     """ A base class for working with JSON.
     """
+    __slots__ = ()
+
+    @classmethod
+    def from_obj(cls, obj, text_key='text', attr_prefix='#', attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document out of an already decoded JSON object, in the same format as produced by to_dict,
+        i.e. keys starting with attr_prefix are attributes and lists are lists of elements.
+        """
+        if not isinstance(obj, dict):
+            raise ValueError('Expected a JSON object instead of `{}`'.format(obj.__class__.__name__))
+
+        return cls.from_dict(obj, text_key, attr_prefix, None, attrs_ordered, incl_empty_text)
+
+    @classmethod
+    def from_string(cls, data, text_key='text', attr_prefix='#', attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document out of a JSON string. Check from_obj for details.
+        """
+        return cls.from_obj(loads(data), text_key, attr_prefix, attrs_ordered, incl_empty_text)
+
+    @classmethod
+    def from_bytes(cls, data, text_key='text', attr_prefix='#', attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document out of JSON encoded in UTF-8. Check from_obj for details.
+        """
+        return cls.from_obj(loads(data), text_key, attr_prefix, attrs_ordered, incl_empty_text)
+
+    @classmethod
+    def iter_ndjson(cls, source, text_key='text', attr_prefix='#', as_dict=False, attrs_ordered=False, incl_empty_text=False):
+        """ Reads newline-delimited JSON from a binary file object or a file of a given name, line by line, and yields
+        a new document for each line or, if as_dict is True, a dict as it was decoded. Empty lines are skipped.
+        """
+        is_own_file = isinstance(source, basestring)
+        source = open(source, 'rb') if is_own_file else source
+
+        try:
+            for line in source:
+                if not line.strip():
+                    continue
+
+                obj = loads(line)
+                yield obj if as_dict else cls.from_obj(obj, text_key, attr_prefix, attrs_ordered, incl_empty_text)
+        finally:
+            if is_own_file:
+                source.close()
+
+    @classmethod
+    def ndjson_writer(cls, dest, buffer_size=65536, text_key='text', attr_prefix='#', include_ns=False):
+        """ Returns a writer of documents, or dicts, to a binary file object or a file of a given name,
+        as newline-delimited JSON. Must be closed, or used as a context manager, for all the lines to be written out.
+        """
+        return _NDJSONWriter(dest, buffer_size, text_key, attr_prefix, include_ns)
+
+# ################################################################################################################################
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# six
+from six import binary_type, text_type
+
+# ujson
+from ujson import dumps
+
+# Zato
+from zato.elem._serial import no_value
+
+# ################################################################################################################################
+
+# Signals that all elements of an array were serialized
+_done = object()
+
+# Literal JSON text is kept on the stack of elements to serialize as strings
+_str_classes = frozenset((binary_type, text_type))
+
+class _Fragment(object):
+    """ Marks the end of output of an element that is to be cached, which started at a given index of output parts.
+    """
+    __slots__ = ('elem', 'start')
+
+    def __init__(self, elem, start):
+        self.elem = elem
+        self.start = start
+
+def _set_cache(elem, key, value):
+    if elem._zato_cache is None:
+        object.__setattr__(elem, '_zato_cache', {})
+    elem._zato_cache[key] = value
+
+# ################################################################################################################################
+
+def _get_name(elem, include_ns):
+    return elem._zato_elem_name if include_ns else elem._no_ns_zato_name
+
+# ################################################################################################################################
+
+def iter_json(root, text_key='text', attr_prefix='#', include_ns=False, chunk_size=65536):
+    """ Serializes root and its descendants to JSON, producing the same output to_json does, and yields it in chunks
+    of at least chunk_size characters. No intermediate dicts are built and each list of elements is serialized
+    one element at a time, which means that the whole output is never kept in memory.
+
+    If root's class caches output, JSON of each element with children is cached, or taken from the cache if the element
+    has not changed since it was cached. Output is then yielded in one chunk.
+    """
+    parts = []
+    append = parts.append
+    chunks = []
+    size = 0
+
+    # JSON keys of elements sharing root's namespace map, by their names
+    ns_map = root._zato_ns_map
+    key_cache = {}
+    text_json_key = dumps(text_key) + ':'
+
+    cache_key = ('json', text_key, attr_prefix, include_ns) if root._zato_cache_output else None
+    if cache_key:
+        chunk_size = None
+
+    # Top-level elements serialize to their contents only
+    is_top = root._zato_elem_name == root._zato_top_level_name
+
+    if is_top:
+        stack = [root]
+    else:
+        append('{' + dumps(_get_name(root, include_ns)) + ':')
+        stack = ['}', root]
+
+    pop = stack.pop
+    push = stack.append
+
+    while stack:
+
+        # Enough output is ready to be returned
+        if len(parts) > 256 and chunk_size:
+            chunk = ''.join(parts)
+            parts[:] = []
+            chunks.append(chunk)
+            size += len(chunk)
+
+            if size >= chunk_size:
+                yield ''.join(chunks)
+                chunks[:] = []
+                size = 0
+
+        item = pop()
+
+        # Closing brackets and other literals
+        if item.__class__ in _str_classes:
+            append(item)
+            continue
+
+        # Elements of an array, one at a time
+        if item.__class__ is _ArrayIter:
+            child = next(item.children, _done)
+            if child is _done:
+                append(']')
+            else:
+                append(',')
+                push(item)
+                push(child)
+            continue
+
+        # Output of an element is complete and can be cached
+        if item.__class__ is _Fragment:
+            fragment = ''.join(parts[item.start:])
+            parts[item.start:] = [fragment]
+            _set_cache(item.elem, cache_key, fragment)
+            continue
+
+        elem = item
+        elem_is_top = is_top and elem is root
+        children = elem._zato_children
+        attrs = elem._zato_attrs
+
+        # Elements without attributes or children serialize to their values
+        if not (children or attrs or elem_is_top):
+            append(dumps(elem._zato_value if elem._zato_value != no_value else None))
+            continue
+
+        if cache_key:
+            cache = elem._zato_cache
+            if cache is not None and cache_key in cache:
+                append(cache[cache_key])
+                continue
+
+        # Keys and values of the object elem serializes to, in the same order DictSerializer adds them in,
+        # with elements that are not leaves still to be serialized.
+        keys = []
+        pending = []
+
+        if not elem_is_top and (elem._zato_value != no_value or elem._zato_incl_empty_text):
+            keys.append(text_json_key)
+            pending.append(text_json_key + dumps(elem._zato_value))
+
+        if attrs:
+            for attr in attrs.values():
+                json_key = dumps(attr_prefix + (attr.name if include_ns else attr.name_no_ns)) + ':'
+                sep = ',' if keys else ''
+                keys.append(json_key)
+                pending.append(sep + json_key + dumps(attr._zato_value))
+
+        list_children = elem._zato_list_children
+
+        for child in children:
+            if list_children and elem.has_list_child(child):
+                continue
+
+            name = child._zato_elem_name
+            json_key = key_cache.get(name) if child._zato_ns_map is ns_map else None
+            if json_key is None:
+                if not include_ns:
+                    name = child._no_ns_zato_name
+                json_key = dumps(name) + ':'
+                if child._zato_ns_map is ns_map:
+                    key_cache[child._zato_elem_name] = json_key
+            sep = ',' if keys else ''
+            keys.append(json_key)
+
+            if child._zato_children or child._zato_attrs:
+                pending.append(sep + json_key)
+                pending.append(child)
+            else:
+                pending.append(sep + json_key + dumps(child._zato_value if child._zato_value != no_value else None))
+
+        if list_children:
+            for list_items in list_children.values():
+                if list_items:
+                    json_key = dumps(_get_name(list_items[0], include_ns)) + ':'
+                    sep = ',' if keys else ''
+                    keys.append(json_key)
+                    pending.append(sep + json_key + '[')
+                    pending.append(list_items[0])
+                    pending.append(_ArrayIter(list_items))
+
+        # Keys that repeat are overwritten in dicts, which only DictSerializer knows how to do
+        if len(keys) > 1 and len(set(keys)) != len(keys):
+            if elem_is_top:
+                fragment = dumps(elem.to_dict(text_key, attr_prefix, include_ns))
+            else:
+                fragment = dumps(elem.to_dict(text_key, attr_prefix, include_ns)[_get_name(elem, include_ns)])
+
+            append(fragment)
+            if cache_key:
+                _set_cache(elem, cache_key, fragment)
+            continue
+
+        # Entries are pushed in reverse order so they are popped in the correct one
+        if cache_key:
+            push(_Fragment(elem, len(parts)))
+        push('}')
+        stack.extend(reversed(pending))
+
+        append('{')
+
+    chunks.append(''.join(parts))
+    yield ''.join(chunks)
+
+class _ArrayIter(object):
+    """ Elements of a list of elements that are yet to be serialized, except for the first one.
+    """
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        self.children = iter(children)
+        next(self.children)
+
+# ################################################################################################################################
+
+def iter_json_bytes(root, text_key='text', attr_prefix='#', include_ns=False, chunk_size=65536, http_chunked=False):
+    """ Same as iter_json but yields bytes. If http_chunked is True, each chunk is framed according to HTTP/1.1 chunked
+    transfer coding and a final, empty, chunk is added.
+    """
+    for chunk in iter_json(root, text_key, attr_prefix, include_ns, chunk_size):
+        chunk = chunk.encode('utf8')
+        if http_chunked:
+            chunk = '{:x}\r\n'.format(len(chunk)).encode('utf8') + chunk + b'\r\n'
+        yield chunk
+
+    if http_chunked:
+        yield b'0\r\n\r\n'
+
+def write_json(root, dest, text_key='text', attr_prefix='#', include_ns=False, buffer_size=65536):
+    """ Writes JSON that root and its descendants serialize to to a binary file object in chunks of at least
+    buffer_size bytes.
+    """
+    for chunk in iter_json_bytes(root, text_key, attr_prefix, include_ns, buffer_size):
+        dest.write(chunk)
@@ -48,65 +48,78 @@ class Serializer(object):
 # ################################################################################################################################
 
 class DictSerializer(Serializer):
-    """ Serializes to a Python dict.
+    """ Serializes to a Python dict. The tree is traversed once, using an explicit stack rather than recursion,
+    so documents deeper than the interpreter's recursion limit can be serialized too.
     """
-    def _set_value(self, elem, out):
-        has_children = elem._zato_children
-        has_attrs = elem._zato_attrs
-
-        name = elem._zato_elem_name if self.include_ns else elem._no_ns_zato_name
+    def serialize(self):
+        elem = self.orig_top_level
 
-        if not (has_children or has_attrs):
-            out[name] = elem._zato_value if elem._zato_value != no_value else None
+        # Top-level elements have no values of their own, only attributes and children, which are added to out directly
+        if elem._zato_elem_name == elem._zato_top_level_name:
+            self._add_attrs(elem, self.out)
+            stack = []
+            self._push_children(elem, self.out, stack)
         else:
-            out[name] = {}
-            out = out[name]
-            if elem._zato_value != no_value or elem._zato_incl_empty_text:
-                out[self.text_key] = elem._zato_value
-
-        return out
+            stack = [(elem, elem._zato_elem_name if self.include_ns else elem._no_ns_zato_name, self.out, None)]
 
-    def on_value(self, value, elem, out):
-        return self._set_value(elem, out)
+        self._walk(stack)
 
-    def on_attr(self, name, value, attr, elem, out):
-        out['%s%s' % (self.attr_prefix, name if self.include_ns else attr.name_no_ns)] = value
-        return out
-
-    def on_non_list_child(self, name, elem, out):
-
-        out = self._set_value(elem, out)
-        has_children = elem._zato_children
-        has_attrs = elem._zato_attrs
+        return self.out
 
-        if has_attrs:
+    def _walk(self, stack):
+        """ Serializes each element from stack along with all of its descendants. Items of the stack are tuples
+        of an element, its name, a dict it is to be added to and its index if it is an element of a list, or None otherwise.
+        """
+        text_key = self.text_key
+        pop = stack.pop
+
+        while stack:
+            elem, name, out, idx = pop()
+            has_children = elem._zato_children
+
+            if not (has_children or elem._zato_attrs):
+                value = elem._zato_value if elem._zato_value != no_value else None
+            else:
+                value = {}
+                if elem._zato_value != no_value or elem._zato_incl_empty_text:
+                    value[text_key] = elem._zato_value
+                self._add_attrs(elem, value)
+
+            if idx is None:
+                out[name] = value
+            else:
+                self._add_list_value(idx, name, elem, out, value)
+
+            if has_children:
+                self._push_children(elem, value, stack)
+
+    def _add_attrs(self, elem, out):
+        if elem._zato_attrs:
             for attr in elem._zato_attrs.values():
                 out['%s%s' % (self.attr_prefix, attr.name if self.include_ns else attr.name_no_ns)] = attr._zato_value
 
-        if has_children:
-
-            for child in elem._zato_children:
-                if elem.has_list_child(child):
-                    continue
-
-                out_child = {}
-                child.walk_tree(
-                    self.on_value, self.on_attr, self.on_non_list_child, self.on_list_child, self.include_ns,
-                    out_child)
-                out.update(out_child)
-
-            for children in elem._zato_list_children.values():
+    def _push_children(self, elem, out, stack):
+        """ Pushes all children of elem onto stack, in reverse order so that they are serialized in the correct one,
+        i.e. non-list children first, followed by elements of each list.
+        """
+        include_ns = self.include_ns
+        list_children = elem._zato_list_children
+        items = []
+
+        for child in elem._zato_children:
+            if list_children and elem.has_list_child(child):
+                continue
+            items.append((child, child._zato_elem_name if include_ns else child._no_ns_zato_name, out, None))
+
+        if list_children:
+            for children in list_children.values():
                 for idx, child in enumerate(children):
-                    self.on_list_child(
-                        idx, child._zato_elem_name if self.include_ns else child._no_ns_zato_name, child, out)
+                    items.append((child, child._zato_elem_name if include_ns else child._no_ns_zato_name, out, idx))
 
-        return out
+        items.reverse()
+        stack.extend(items)
 
-    def on_list_child(self, idx, name, elem, out):
-
-        # TODO: Consider changing it to a call to elem.walk_tree rather than elem.to_dict
-        # to save on the number of serializer instances created = to increase performance.
-        value = elem.to_dict(self.text_key, self.attr_prefix, self.include_ns)[name]
+    def _add_list_value(self, idx, name, elem, out, value):
 
         if name in out:
             # We append an element to an already existing list so idx must equal to the len of an already existing list.
@@ -123,4 +136,28 @@ class DictSerializer(Serializer):
 
             out[name] = [value]
 
+    def on_value(self, value, elem, out):
+        name = elem._zato_elem_name if self.include_ns else elem._no_ns_zato_name
+
+        if not (elem._zato_children or elem._zato_attrs):
+            out[name] = elem._zato_value if elem._zato_value != no_value else None
+        else:
+            out[name] = {}
+            out = out[name]
+            if elem._zato_value != no_value or elem._zato_incl_empty_text:
+                out[self.text_key] = elem._zato_value
+
+        return out
+
+    def on_attr(self, name, value, attr, elem, out):
+        out['%s%s' % (self.attr_prefix, name if self.include_ns else attr.name_no_ns)] = value
+        return out
+
+    def on_non_list_child(self, name, elem, out):
+        self._walk([(elem, name, out, None)])
+        return out
+
+    def on_list_child(self, idx, name, elem, out):
+        self._walk([(elem, name, out, idx)])
+
 # ################################################################################################################################
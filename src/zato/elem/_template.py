@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from collections import OrderedDict
+
+# Zato
+from zato.elem._common import _copy_attr, _copy_ns_info, _no_dict
+from zato.elem._serial import no_value
+
+# ################################################################################################################################
+
+class placeholder(object):
+    """ Marks a value of an element or attribute that is to be filled in each time a template is turned into a new document.
+    """
+    __slots__ = ('name', 'default')
+
+    def __init__(self, name, default=no_value):
+        self.name = name
+        self.default = default
+
+    def __repr__(self):
+        return '<{} at {} name:`{}`>'.format(self.__class__.__name__, hex(id(self)), self.name)
+
+# ################################################################################################################################
+
+class _Node(object):
+    """ A frozen copy of a single element of a template.
+    """
+    __slots__ = ('class_', 'name', 'value', 'ns_info', 'ns_map', 'full_name', 'attrs_ordered', 'incl_empty_text', 'attrs',
+        'children')
+
+class _ListNode(object):
+    """ All elements of a template's list of elements, in the position of the list's first element.
+    """
+    __slots__ = ('name', 'items')
+
+    def __init__(self, name):
+        self.name = name
+        self.items = []
+
+class _ListItemNode(object):
+    """ A single element of a template's list whose elements are interleaved with other ones, in its own position.
+    """
+    __slots__ = ('name', 'item')
+
+    def __init__(self, name, item):
+        self.name = name
+        self.item = item
+
+# ################################################################################################################################
+
+class Template(object):
+    """ A document whose structure, namespaces and names are computed once so that new documents of the same shape,
+    with values filled in for placeholders, can be quickly created out of it. Changes made to the original document
+    after the template was created are not taken into account.
+    """
+    def __init__(self, elem):
+        self.root = self._compile(elem)
+
+# ################################################################################################################################
+
+    def _new_node(self, elem):
+        node = _Node()
+        node.class_ = elem.__class__
+        node.name = elem._zato_elem_name
+        node.value = elem._zato_value
+        node.ns_info = _copy_ns_info(elem._zato_ns_info)
+        node.ns_map = elem._zato_ns_map
+        node.full_name = elem._zato_full_name_value if elem._zato_list_group is None else None
+        node.attrs_ordered = elem._zato_attrs_ordered
+        node.incl_empty_text = elem._zato_incl_empty_text
+        node.attrs = [(key, _copy_attr(attr, attr._zato_value)) for key, attr in elem._zato_attrs.items()]
+        node.children = []
+
+        return node
+
+    def _compile(self, elem):
+        """ Returns a frozen copy of elem and all of its descendants.
+        """
+        root = self._new_node(elem)
+        stack = [(elem, root)]
+
+        while stack:
+            elem, node = stack.pop()
+            list_nodes = {}
+            last_idx = {}
+            interleaved = set()
+            entries = []
+
+            for idx, child in enumerate(elem._zato_children):
+                child_node = self._new_node(child)
+                stack.append((child, child_node))
+
+                if elem.has_list_child(child):
+                    name = child._zato_elem_name
+                    if name in last_idx and last_idx[name] != idx - 1:
+                        interleaved.add(name)
+                    last_idx[name] = idx
+
+                    list_node = list_nodes.get(name)
+                    if list_node is None:
+                        list_node = list_nodes[name] = _ListNode(name)
+                    list_node.items.append(child_node)
+                    entries.append((list_node, child_node))
+                else:
+                    entries.append((None, child_node))
+
+            # All elements of a list are kept together, unless there are other elements between them,
+            # in which case each one is kept in its own position.
+            for list_node, child_node in entries:
+                if list_node is None:
+                    node.children.append(child_node)
+                elif list_node.name in interleaved:
+                    node.children.append(_ListItemNode(list_node.name, child_node))
+                elif list_node.items[0] is child_node:
+                    node.children.append(list_node)
+
+        return root
+
+# ################################################################################################################################
+
+    def _get_value(self, value, scope):
+        """ Returns value as is, unless it is a placeholder in which case the first value for it found in scope is returned.
+        """
+        if value.__class__ is not placeholder:
+            return value
+
+        for values in scope:
+            if value.name in values:
+                return values[value.name]
+
+        if value.default != no_value:
+            return value.default
+
+        raise ValueError('No value for placeholder `{}`'.format(value.name))
+
+    def _new_elem(self, node, parent, value, scope):
+        """ Creates a new element out of a template's node, without any children.
+        """
+        elem = node.class_(node.name, self._get_value(value, scope), parent, node.attrs_ordered, node.incl_empty_text)
+
+        _set = object.__setattr__
+        _set(elem, '_zato_ns_info', _copy_ns_info(node.ns_info))
+        _set(elem, '_zato_ns_map', node.ns_map)
+        _set(elem, '_zato_full_name_value', node.full_name)
+
+        if node.attrs:
+            attrs = OrderedDict() if node.attrs_ordered else {}
+            for key, attr in node.attrs:
+                attrs[key] = _copy_attr(attr, self._get_value(attr._zato_value, scope))
+            _set(elem, '_zato_attrs', attrs)
+        else:
+            _set(elem, '_zato_attrs', _no_dict)
+
+        return elem
+
+    def _get_list_items(self, list_node, scope):
+        """ Returns nodes, values and scopes for each element of a list. Values for lists may be given on input as lists,
+        each element of which is either a dict of values for placeholders or the value of a given element itself.
+        Template's first element of such a list is repeated for each input element. Otherwise, the list is copied as is.
+        Lists whose elements are interleaved with other ones are always copied as is.
+        """
+        for values in scope:
+            if list_node.name in values:
+                input_items = values[list_node.name]
+                break
+        else:
+            return [(item, item.value, scope) for item in list_node.items]
+
+        item = list_node.items[0]
+        out = []
+
+        for input_item in input_items:
+            if isinstance(input_item, dict):
+                out.append((item, item.value, (input_item,) + scope))
+            else:
+                out.append((item, input_item, scope))
+
+        return out
+
+    def new(self, values=None, **kwargs):
+        """ Returns a new document out of the template. Values for placeholders may be given either as a dict or keyword
+        arguments. Values for lists of elements may be given as lists, see _get_list_items for details.
+        """
+        values = dict(values or {}, **kwargs)
+        scope = (values,)
+        _set = object.__setattr__
+
+        root = self._new_elem(self.root, None, self.root.value, scope)
+        stack = [(self.root, root, scope)]
+
+        while stack:
+            node, elem, scope = stack.pop()
+
+            for child_node in node.children:
+
+                if child_node.__class__ is _ListNode:
+                    list_child = elem._get_list_child(child_node.name)
+
+                    for idx, (item, value, item_scope) in enumerate(self._get_list_items(child_node, scope)):
+                        child = self._new_elem(item, elem, value, item_scope)
+                        _set(child, '_zato_list_group', list_child)
+                        _set(child, '_zato_list_idx', idx)
+                        list_child.append(child)
+                        elem._add_child(child)
+                        stack.append((item, child, item_scope))
+
+                elif child_node.__class__ is _ListItemNode:
+                    for values in scope:
+                        if child_node.name in values:
+                            msg = 'Elements of list `{}` are interleaved with other ones, it cannot be given on input'
+                            raise ValueError(msg.format(child_node.name))
+
+                    list_child = elem._get_list_child(child_node.name)
+                    item = child_node.item
+
+                    child = self._new_elem(item, elem, item.value, scope)
+                    _set(child, '_zato_list_group', list_child)
+                    _set(child, '_zato_list_idx', len(list_child))
+                    list_child.append(child)
+                    elem._add_child(child)
+                    stack.append((item, child, scope))
+
+                else:
+                    child = self._new_elem(child_node, elem, child_node.value, scope)
+                    elem._add_child(child)
+                    stack.append((child_node, child, scope))
+
+        return root
+
+# ################################################################################################################################
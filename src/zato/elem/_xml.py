@@ -11,27 +11,461 @@ https://zato.io
 """
 
 # lxml
-from lxml.etree import cleanup_namespaces, Element, SubElement, tostring
+from lxml.etree import cleanup_namespaces, Element, fromstring, iterparse, iterwalk, parse, SubElement, tostring, XMLParser, \
+    XMLPullParser
+
+# six
+from six import iteritems
 
 # Zato
-from zato.elem._common import Elem, no_value, top_level
+from zato.elem._common import Elem, name_cache_max_size, no_value, ns_prefix_max_len, NSMap, top_level
+from zato.elem._xml_writer import HasNamespaces, to_xml_string, write_xml, xml_ns
+
+# ################################################################################################################################
+
+class _XMLBuilder(object):
+    """ Builds a tree of elements out of lxml's start-ns, start and end parsing events.
+    Namespace prefixes are kept unless they cannot be used in names of elements, i.e. they are too long or contain
+    an underscore, in which case new ones are generated. The same goes for prefixes that names of elements or attributes
+    without one begin with, followed by an underscore, e.g. p in p_x - such names would be read as prefixed ones, so each
+    document they are found in is built anew out of its lxml element, with new prefixes generated. These prefixes are renamed
+    in all documents built later on too. Elements in a default namespace get it as their .ns.
+    Repeated siblings of the same name become lists of elements. The same builder may be used to build a series of documents,
+    e.g. records of a stream, each new one is started with .reset.
+    """
+    def __init__(self, class_, attrs_ordered=False, incl_empty_text=False):
+        self.class_ = class_
+        self.attrs_ordered = attrs_ordered
+        self.incl_empty_text = incl_empty_text
+        self.declared = {}
+        self.prefixes = {}
+        self.names = {}
+        self.root_ns_maps = {}
+        self.ns_counter = 0
+        self.renamed = set()
+        self.collisions = set()
+        self.reset()
+
+    def reset(self):
+        self.doc = self.class_(attrs_ordered=self.attrs_ordered, incl_empty_text=self.incl_empty_text)
+        self.stack = [self.doc]
+        self.declared.clear()
+        self.collisions.clear()
+
+    def _get_cached(self, cache, key, ns_map, func, *args):
+        """ Returns a value computed out of ns_map, caching it. Cached values keep a reference to their NSMap
+        so that its id, which is part of key, is not reused as long as the value is in the cache.
+        """
+        value = cache.get(key)
+        if value is None:
+            if len(cache) >= name_cache_max_size:
+                cache.clear()
+            value = cache[key] = ns_map, func(ns_map, *args)
+        return value[1]
+
+    def _get_prefix(self, ns_map, ns):
+        """ Returns a prefix a namespace is known under in ns_map or None if there is none.
+        """
+        prefixes = self._get_cached(self.prefixes, id(ns_map), ns_map, lambda ns_map: {v:k for k, v in ns_map.items()})
+        return prefixes.get(ns)
+
+    def _new_prefix(self, ns_map):
+        while True:
+            prefix = 'ns{}'.format(self.ns_counter)
+            self.ns_counter += 1
+            if prefix not in ns_map:
+                return prefix
+
+    def _get_ns_map(self, ns_map):
+        """ Returns a new NSMap with all the namespaces declared since the last element started or ns_map if there are none.
+        """
+        if not self.declared:
+            return ns_map
+
+        out = NSMap(ns_map)
+        for prefix, ns in self.declared.items():
+
+            # Empty prefix is a default namespace, there is no need to keep it in the map
+            if prefix and out.get(prefix) != ns:
+                if len(prefix) >= ns_prefix_max_len or '_' in prefix or prefix in self.renamed:
+                    prefix = self._new_prefix(out)
+                out[prefix] = ns
+
+        self.declared.clear()
+
+        return out if out != ns_map else ns_map
+
+    def _get_collision(self, ns_map, name):
+        """ Returns a prefix from ns_map that a name without a prefix begins with, followed by an underscore, or None.
+        """
+        prefix, sep, _ = name.partition('_')
+        return prefix if sep and prefix in ns_map else None
+
+    def _get_names(self, ns_map, tag, prefix):
+        """ Returns name of an element, its namespace, information if it is a default one and a prefix the name
+        collides with, if any.
+        """
+        if tag[0] != '{':
+            return tag, None, False, self._get_collision(ns_map, tag)
+
+        ns, name = tag[1:].split('}')
+
+        if prefix is None or ns_map.get(prefix) != ns:
+            prefix = self._get_prefix(ns_map, ns)
+
+        if prefix is None:
+            return name, ns, True, self._get_collision(ns_map, name)
+        else:
+            return '{}_{}'.format(prefix, name), ns, False, None
+
+    def start_ns(self, prefix, ns):
+        self.declared[prefix or ''] = ns
+
+    def start(self, lxml_elem):
+        parent = self.stack[-1]
+        _set = object.__setattr__
+
+        # Namespaces declared by the root element are added to the top-level one, like doc.ns_map += {...} would do.
+        # Documents whose roots declare the same namespaces share their maps.
+        if parent is self.doc:
+            key = frozenset(self.declared.items())
+            ns_map = self.root_ns_maps.get(key)
+            if ns_map is None:
+                if len(self.root_ns_maps) >= name_cache_max_size:
+                    self.root_ns_maps.clear()
+                ns_map = self.root_ns_maps[key] = self._get_ns_map(parent._zato_ns_map)
+            self.declared.clear()
+            _set(parent, '_zato_ns_map', ns_map)
+        else:
+            ns_map = self._get_ns_map(parent._zato_ns_map)
+
+        tag, prefix = lxml_elem.tag, lxml_elem.prefix
+        name, ns, is_default, collision = self._get_cached(
+            self.names, (id(ns_map), tag, prefix), ns_map, self._get_names, tag, prefix)
+
+        if collision is not None:
+            self.collisions.add(collision)
+
+        elem = parent.__class__(name, no_value, parent, parent._zato_attrs_ordered, parent._zato_incl_empty_text)
+        _set(elem, '_zato_ns_map', ns_map)
+
+        if ns is not None:
+            if is_default:
+                elem._get_ns_info().set_default_ns(ns)
+            else:
+                elem._get_ns_info().set_ns(ns)
+
+        for key, value in lxml_elem.attrib.items():
+            if key[0] == '{':
+                attr_ns, key = key[1:].split('}')
+                prefix = self._get_prefix(elem._zato_ns_map, attr_ns)
+                if prefix is None:
+                    prefix = 'xml' if attr_ns == xml_ns else self._new_prefix(elem._zato_ns_map)
+                    elem.ns_map = {prefix: attr_ns}
+                key = '{}_{}'.format(prefix, key)
+            elif '_' in key:
+                collision = self._get_collision(ns_map, key)
+                if collision is not None:
+                    self.collisions.add(collision)
+            elem._get_attr_by_name('_' + key, value)
+
+        # A repeated sibling turns all elements of that name into a list
+        existing = parent._zato_children_by_name.get(name)
+        if existing is not None:
+            list_child = parent._get_list_child(name)
+            if not list_child:
+                _set(existing, '_zato_list_group', list_child)
+                _set(existing, '_zato_list_idx', 0)
+                _set(existing, '_zato_full_name_value', None)
+                list_child.append(existing)
+
+            _set(elem, '_zato_list_group', list_child)
+            _set(elem, '_zato_list_idx', len(list_child))
+            list_child.append(elem)
+
+        parent._add_child(elem)
+        self.stack.append(elem)
+
+        return elem
+
+    def end(self, lxml_elem):
+        elem = self.stack.pop()
+        if lxml_elem.text is not None:
+            object.__setattr__(elem, '_zato_value', lxml_elem.text)
+
+        # Elements have no place for text that follows their children, so mixed content is rejected rather than lost.
+        # Whitespace between elements is not content.
+        for child in lxml_elem:
+            if child.tail is not None and child.tail.strip():
+                raise ValueError('Mixed content is not supported, found text `{}` in `{}`'.format(child.tail, elem.path))
+
+        # A complete document in which names collide with prefixes
+        if self.collisions and len(self.stack) == 1:
+            return self._rebuild(lxml_elem)
+
+        return elem
+
+    def _rebuild(self, lxml_elem):
+        """ Builds the current document anew out of its root lxml element, renaming prefixes that names collided with.
+        """
+        self.renamed.update(self.collisions)
+
+        # Maps of roots may use prefixes renamed now
+        self.root_ns_maps.clear()
+
+        events = iterwalk(lxml_elem, events=('start-ns', 'start', 'end'))
+        for event, value in events:
+            if event == 'start':
+                self.start_doc(value)
+                break
+
+        self.build(events)
+
+        return self.doc._zato_children[0]
+
+    def start_doc(self, lxml_elem):
+        """ Starts a new document whose root is lxml_elem, with all the namespaces lxml_elem knows of, including ones
+        declared by its ancestors.
+        """
+        self.reset()
+        for prefix, ns in lxml_elem.nsmap.items():
+            self.start_ns(prefix, ns)
+        return self.start(lxml_elem)
+
+    def build(self, events):
+        """ Consumes all the events and returns the document built.
+        """
+        for event, value in events:
+            if event == 'start':
+                self.start(value)
+            elif event == 'end':
+                self.end(value)
+            else:
+                self.start_ns(*value)
+
+        return self.doc
+
+# ################################################################################################################################
+
+class _DepthMatcher(object):
+    """ Tells whether elements are at one of given depths, the root element's depth being 0.
+    """
+    def __init__(self, depths):
+        self.depths = frozenset(depths)
+        self.depth = 0
+
+    def start(self, lxml_elem):
+        """ Returns True if an element that has just started is at one of the depths.
+        """
+        depth = self.depth
+        self.depth += 1
+        return depth in self.depths
+
+    def end(self):
+        self.depth -= 1
+
+class _PathMatcher(_DepthMatcher):
+    """ Tells whether elements are at a given path, e.g. /soap:Envelope/soap:Body/orders/order. Names without a prefix
+    match elements of that name in any namespace. Prefixes are looked up in ns_map or, if there is none, compared with
+    prefixes that documents use.
+    """
+    def __init__(self, path, ns_map=None):
+        self.ns_map = ns_map
+        self.segments = []
+        self.depth = 0
+        self.matched = 0
+
+        for segment in path.strip('/').split('/'):
+            prefix, _, name = segment.rpartition(':')
+            self.segments.append((prefix or None, name))
+
+        self.len_segments = len(self.segments)
+
+    def _matches(self, lxml_elem, segment):
+        prefix, name = segment
+        tag = lxml_elem.tag
+
+        if tag[0] == '{':
+            ns, local_name = tag[1:].split('}')
+        else:
+            ns, local_name = None, tag
+
+        if local_name != name:
+            return False
+
+        if prefix is None:
+            return True
+
+        return ns == self.ns_map.get(prefix) if self.ns_map is not None else lxml_elem.prefix == prefix
+
+    def start(self, lxml_elem):
+        """ Returns True if an element that has just started is at the path.
+        """
+        depth = self.depth
+        self.depth += 1
+
+        if depth == self.matched and depth < self.len_segments and self._matches(lxml_elem, self.segments[depth]):
+            self.matched += 1
+            return self.matched == self.len_segments
+
+        return False
+
+    def end(self):
+        self.depth -= 1
+        if self.depth < self.matched:
+            self.matched = self.depth
+
+# ################################################################################################################################
+
+def _clear(lxml_elem):
+    """ Frees memory taken by an element that has been processed already and by its preceding siblings.
+    """
+    lxml_elem.clear()
+    parent = lxml_elem.getparent()
+    if parent is not None:
+        while lxml_elem.getprevious() is not None:
+            del parent[0]
+
+class _RecordReader(object):
+    """ Turns elements selected by a matcher into documents, each built out of lxml's start-ns, start and end parsing events.
+    All the elements are cleared once they are no longer needed. Elements nested in ones already selected are part
+    of the latter's documents rather than documents of their own. Events may be given in any number of batches.
+    """
+    def __init__(self, class_, matcher, attrs_ordered=False, incl_empty_text=False):
+        self.matcher = matcher
+        self.builder = _XMLBuilder(class_, attrs_ordered, incl_empty_text)
+        self.record_depth = None
+
+    def read(self, events):
+        """ Yields all documents completed by events.
+        """
+        matcher = self.matcher
+        builder = self.builder
+
+        for event, value in events:
+
+            if event == 'start':
+                if self.record_depth is not None:
+                    matcher.depth += 1
+                    builder.start(value)
+                elif matcher.start(value):
+                    self.record_depth = matcher.depth
+                    builder.start_doc(value)
+
+            elif event == 'end':
+                if self.record_depth is not None:
+                    builder.end(value)
+                    if matcher.depth == self.record_depth:
+                        self.record_depth = None
+                        yield builder.doc
+                        _clear(value)
+
+                # Elements outside of records are not needed once they end
+                else:
+                    _clear(value)
+
+                matcher.end()
+
+            # Namespaces declared outside of records will be found in .nsmap of records themselves
+            elif self.record_depth is not None:
+                builder.start_ns(*value)
+
+class _PushParser(object):
+    """ Incrementally parses XML data given in chunks, as they arrive, and returns documents out of elements
+    at configured depths as soon as each of them is complete.
+    """
+    def __init__(self, class_, depths, attrs_ordered=False, incl_empty_text=False, **kwargs):
+        kwargs.setdefault('remove_blank_text', True)
+        self.parser = XMLPullParser(events=('start-ns', 'start', 'end'), **kwargs)
+        self.reader = _RecordReader(class_, _DepthMatcher(depths), attrs_ordered, incl_empty_text)
+
+    def feed(self, data):
+        """ Parses a chunk of data and returns a list of documents completed by it, possibly an empty one.
+        """
+        self.parser.feed(data)
+        return list(self.reader.read(self.parser.read_events()))
+
+    def close(self):
+        """ Signals the end of data and returns a list of documents not returned yet, if any. Raises an exception
+        if data was not a well-formed document.
+        """
+        self.parser.close()
+        return list(self.reader.read(self.parser.read_events()))
+
+# ################################################################################################################################
+
+class xml_backend:
+    """ Ways to_xml can serialize documents to strings. lxml builds an lxml tree first while direct writes markup
+    straight out of elements, which to_xml does only for documents without namespaces. Both produce the same output.
+    to_xml_stream and output caching write markup directly for all documents, resolving namespaces the way lxml does.
+    """
+    lxml = 'lxml'
+    direct = 'direct'
+
+
+# Keyword arguments to_xml accepts with the direct backend, with any other ones lxml is used
+_direct_kwargs = frozenset(('encoding', 'xml_declaration'))
+
+class _LXMLShadow(object):
+    """ An lxml tree kept for a document, along with elements whose values lxml rejected. If namespaces of the tree
+    were cleaned up, the tree is dirty when elements were added or removed since then and it needs to be cleaned up again.
+    Root is None once the tree is dropped, elements of the document keep referring to it until a new one is built.
+    """
+    __slots__ = ('root', 'cleaned_up', 'dirty', 'stale')
+
+    def __init__(self, root):
+        self.root = root
+        self.cleaned_up = False
+        self.dirty = True
+        self.stale = set()
+
+def _in_scope(lxml_elem, ns, is_attr):
+    """ Returns True if lxml can use a namespace already declared for an element rather than declare a new one.
+    """
+    for prefix, value in iteritems(lxml_elem.nsmap):
+        if value == ns and (prefix is not None or not is_attr):
+            return True
+
+    return False
+
+def _is_used(elem, ns):
+    """ Returns True if elem or any of its ancestors is in a namespace or has an attribute in it. In a new tree, these are
+    the elements lxml declares namespaces for, while namespaces that are only declared when cleaning them up do not count.
+    """
+    while elem._zato_parent is not None:
+        if elem._zato_ns_info.value == ns:
+            return True
+
+        for attr in elem.attrs:
+            if attr.ns == ns:
+                return True
+
+        elem = elem._zato_parent
+
+    return False
 
 # ################################################################################################################################
 
 class xml(Elem):
     """ A base class for working with XML.
     """
+    __slots__ = ()
+
     # How to separate path elements in element's __repr__ representation.
     _zato_path_prefix = _zato_path_sep = '/'
 
+    # Which backend to_xml uses unless told otherwise, one of xml_backend's attributes.
+    _zato_xml_backend = xml_backend.lxml
+
+    # If True, the lxml backend keeps an lxml tree for each document and updates it as values, attributes and children
+    # are set rather than building a new one each time. Namespaces set through elements make it build a new one.
+    _zato_lxml_shadow = False
+
     def _child_to_xml(self, xml_elem, child):
         """ Serializes an individual child, list or not, to XML. Recursively calls
         serialization for descendant elements.
         """
-        if child._zato_ns_info:
-            xml_child = SubElement(xml_elem, '{%s}%s' % (child._zato_ns_info.value, child._no_ns_zato_name))
-        else:
-            xml_child = SubElement(xml_elem, child._no_ns_zato_name)
+        xml_child = SubElement(xml_elem, child._clark_zato_name)
 
         xml_child.text = child._zato_value if child._zato_value != no_value else None
 
@@ -45,7 +479,7 @@ class xml(Elem):
         """
         # Serialize attributes
         for attr in root.attrs:
-            xml_elem.set(attr.name_no_ns if not attr.ns else '{%s}%s' % (attr.ns, attr.name_no_ns), attr._zato_value)
+            xml_elem.set(attr.clark_name, attr._zato_value)
 
         # All children, including list ones
         for child in root._zato_children:
@@ -57,10 +491,7 @@ class xml(Elem):
         """ Serializes root node to XML. Check to_xml's docstring for details.
         """
         # Prepare the top-level lxml element upfront
-        if root._zato_ns_info:
-            xml_elem = Element('{%s}%s' % (root._zato_ns_info.value, root._no_ns_zato_name))
-        else:
-            xml_elem = Element(root._no_ns_zato_name)
+        xml_elem = Element(root._clark_zato_name)
 
         # Root may have some text in addition to attributes and children
         xml_elem.text = root._zato_value if root._zato_value != no_value else None
@@ -70,7 +501,7 @@ class xml(Elem):
 
         # Useful to offer it as a parameter
         if cleanup_ns:
-            cleanup_namespaces(xml_root, root._zato_ns_info.map or {})
+            cleanup_namespaces(xml_root, root._zato_ns_map or {})
 
         # Serialize by default but not always so users can customize the resulting document if need be
         if to_string:
@@ -78,10 +509,173 @@ class xml(Elem):
         else:
             return xml_root
 
-    def to_xml(self, to_string=True, cleanup_ns=True, **kwargs):
-        """ Returns an XML representation of self. Either as lxml Element or string,
-        depending on value of to_string. If cleanup_ns is True, unused namespaces will be cleaned up.
-        Any keyword arguments are passed directly to lxml.etree.tostring used for string serialization.
+    def _build_lxml_shadow(self, root):
+        """ Builds the same lxml tree root_to_xml does, without cleaning up namespaces, and makes root, its parent and
+        all of its descendants keep references to the tree and to their lxml elements.
+        """
+        _set = object.__setattr__
+
+        xml_root = Element(root._clark_zato_name)
+        xml_root.text = root._zato_value if root._zato_value != no_value else None
+
+        shadow = _LXMLShadow(xml_root)
+        _set(root, '_zato_shadow', shadow)
+        _set(root, '_zato_shadow_elem', xml_root)
+
+        for attr in root.attrs:
+            xml_root.set(attr.clark_name, attr._zato_value)
+
+        # Each child is followed by its own descendants, as in _child_to_xml, so that new namespaces get the same prefixes
+        stack = [(iter(root._zato_children), xml_root)]
+
+        while stack:
+            children, xml_elem = stack[-1]
+            child = next(children, None)
+
+            if child is None:
+                stack.pop()
+                continue
+
+            xml_child = SubElement(xml_elem, child._clark_zato_name)
+            xml_child.text = child._zato_value if child._zato_value != no_value else None
+            _set(child, '_zato_shadow', shadow)
+            _set(child, '_zato_shadow_elem', xml_child)
+
+            if child.attrs or child._zato_children:
+                for attr in child.attrs:
+                    xml_child.set(attr.clark_name, attr._zato_value)
+                stack.append((iter(child._zato_children), xml_child))
+
+        # Only complete trees are kept for documents - if lxml rejected a value, elements refer to this one until the next build
+        _set(root._zato_parent, '_zato_shadow', shadow)
+
+        return shadow
+
+    def _get_lxml_shadow(self, root, cleanup_ns):
+        """ Returns the lxml tree kept for the document of root, building it first if there is none yet
+        or if its namespaces were cleaned up and cleanup_ns is False.
+        """
+        shadow = root._zato_parent._zato_shadow
+
+        # Values that lxml rejected, if any, make it raise the same exception it does when building a new tree
+        if shadow is None or shadow.root is None or shadow.stale or (shadow.cleaned_up and not cleanup_ns):
+            if shadow is not None:
+                shadow.root = None
+            shadow = self._build_lxml_shadow(root)
+
+        if cleanup_ns and shadow.dirty:
+
+            # lxml may have declared some of the namespaces before it found an invalid one
+            try:
+                cleanup_namespaces(shadow.root, root._zato_ns_map or {})
+            except ValueError:
+                shadow.root = None
+                raise
+
+            shadow.cleaned_up = True
+            shadow.dirty = False
+
+        return shadow.root
+
+    def _set_lxml_values(self):
+        """ Sets value and attributes of self's lxml element.
+        """
+        lxml_elem = self._zato_shadow_elem
+        lxml_elem.text = self._zato_value if self._zato_value != no_value else None
+
+        lxml_elem.attrib.clear()
+        for attr in self.attrs:
+            lxml_elem.set(attr.clark_name, attr._zato_value)
+
+    def _on_value_set(self):
+        """ Writes value and attributes of self to the lxml tree of its document. Values lxml rejects are written again
+        at serialization time while attributes in namespaces that are not declared yet require a new tree.
+        """
+        shadow = self._zato_shadow
+        if shadow.root is None or self._zato_parent is None:
+            return
+
+        # Once namespaces are cleaned up, the root declares the ones from its namespace map, which new tree's root
+        # does only for namespaces its own attributes are not in.
+        is_root = shadow.cleaned_up and self._zato_parent._zato_parent is None
+        lxml_elem = self._zato_shadow_elem
+
+        # Namespaces of self and its attributes set so far
+        used = {self._zato_ns_info.value}
+
+        for attr in self.attrs:
+            ns = attr.ns
+            if ns is not None and ns != xml_ns and attr.clark_name not in lxml_elem.attrib:
+                if is_root or not _in_scope(lxml_elem, ns, True) or not (ns in used or _is_used(self._zato_parent, ns)):
+                    shadow.root = None
+                    return
+            used.add(ns)
+
+        try:
+            self._set_lxml_values()
+        except (TypeError, ValueError):
+            shadow.stale.add(self)
+        else:
+            shadow.stale.discard(self)
+
+    def _on_child_added(self, child):
+        """ Adds a new child to the lxml tree of self's document. A new tree is required if the child is a second root
+        or it is in a namespace that is not declared yet - lxml would give it a prefix other than in a new tree.
+        """
+        shadow = self._zato_shadow
+        if shadow.root is None:
+            return
+
+        if self._zato_parent is None:
+            shadow.root = None
+            return
+
+        lxml_elem = self._zato_shadow_elem
+        ns = child._zato_ns_info.value
+
+        if ns is not None and not (_in_scope(lxml_elem, ns, False) and _is_used(self, ns)):
+            shadow.root = None
+            return
+
+        try:
+            xml_child = SubElement(lxml_elem, child._clark_zato_name)
+        except ValueError:
+            shadow.root = None
+            return
+
+        object.__setattr__(child, '_zato_shadow', shadow)
+        object.__setattr__(child, '_zato_shadow_elem', xml_child)
+        shadow.dirty = True
+        child._on_value_set()
+
+    def _on_child_removed(self, child):
+        """ Removes a child that is no longer self's one from the lxml tree of self's document. A new tree is required
+        if the child's subtree uses namespaces, which may have been declared for the first time in it.
+        """
+        shadow = self._zato_shadow
+        if shadow.root is None:
+            return
+
+        xml_child = child._zato_shadow_elem
+        if child._zato_shadow is not shadow or xml_child.getparent() is not self._zato_shadow_elem:
+            shadow.root = None
+            return
+
+        for lxml_elem in xml_child.iter():
+            if lxml_elem.tag[0] == '{' or any(name[0] == '{' for name in lxml_elem.attrib):
+                shadow.root = None
+                return
+
+        self._zato_shadow_elem.remove(xml_child)
+        shadow.dirty = True
+
+    def _on_tree_changed(self):
+        """ Drops the lxml tree kept for the document self belongs to so that a new one is built when needed.
+        """
+        self._zato_shadow.root = None
+
+    def _get_xml_root(self):
+        """ Returns the element that is the root of the XML document that self serializes to.
         """
         # There must be exactly one root element. However, we raise exception only if we're serializing
         # top-level element and not if, for instance, a user selected one of middle nodes in the tree for serialization.
@@ -99,6 +693,104 @@ class xml(Elem):
         else:
             root = self
 
+        return root
+
+    def to_xml(self, to_string=True, cleanup_ns=True, backend=None, **kwargs):
+        """ Returns an XML representation of self. Either as lxml Element or string,
+        depending on value of to_string. If cleanup_ns is True, unused namespaces will be cleaned up.
+        Any keyword arguments are passed directly to lxml.etree.tostring used for string serialization.
+        Backend defaults to class-level _zato_xml_backend. The direct one is used only for strings, if keyword arguments,
+        if any, are encoding or xml_declaration, and for documents without namespaces, otherwise lxml is used. If output
+        is cached, it is the direct backend that is the default one, for documents with namespaces too, because only
+        its output can be cached.
+
+        If the class keeps an lxml tree for documents, the lxml backend serializes that tree without building a new one,
+        unless self is an element below the root. If to_string is False, the tree itself is returned and it must be treated
+        as read-only - it changes as the document does, while changes made to it directly are not seen by the document
+        and may be lost once the tree is built anew. Use copy.deepcopy for a tree that may be modified.
+        """
+        backend = backend or (xml_backend.direct if self._zato_cache_output else self._zato_xml_backend)
+
+        if backend == xml_backend.direct:
+            if to_string and _direct_kwargs.issuperset(kwargs):
+                try:
+                    return to_xml_string(self._get_xml_root(), cleanup_ns, ns_free=not self._zato_cache_output, **kwargs)
+                except HasNamespaces:
+                    pass
+
+        elif backend != xml_backend.lxml:
+            raise ValueError('Unknown XML backend `{}`'.format(backend))
+
+        root = self._get_xml_root()
+
+        if self._zato_lxml_shadow and root._zato_parent is not None and root._zato_parent._zato_parent is None:
+            xml_root = self._get_lxml_shadow(root, cleanup_ns)
+            return tostring(xml_root, **kwargs) if to_string else xml_root
+
         return self.root_to_xml(root, to_string, cleanup_ns, **kwargs)
 
+    def to_xml_stream(self, fileobj, cleanup_ns=True, encoding=None, xml_declaration=None, buffer_size=65536):
+        """ Writes an XML representation of self to a file object opened in binary mode, in chunks of buffer_size
+        characters, without building an lxml tree first. Output is the same, byte for byte, as the one to_xml produces
+        with the same cleanup_ns, encoding and xml_declaration.
+        """
+        write_xml(self._get_xml_root(), fileobj, encoding, xml_declaration, cleanup_ns, buffer_size)
+
+# ################################################################################################################################
+
+    @classmethod
+    def from_lxml(cls, lxml_elem, attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document out of an lxml element or element tree. Namespaces declared by ancestors
+        of the element are taken into account.
+        """
+        if hasattr(lxml_elem, 'getroot'):
+            lxml_elem = lxml_elem.getroot()
+
+        builder = _XMLBuilder(cls, attrs_ordered, incl_empty_text)
+        events = iterwalk(lxml_elem, events=('start-ns', 'start', 'end'))
+
+        # The root's own start-ns events are superseded by the namespaces start_doc declares
+        for event, value in events:
+            if event == 'start':
+                builder.start_doc(value)
+                break
+
+        return builder.build(events)
+
+    @classmethod
+    def from_string(cls, data, parser=None, attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document out of XML data given on input. Whitespace between elements is ignored,
+        unless a custom lxml parser is given.
+        """
+        parser = parser if parser is not None else XMLParser(remove_blank_text=True)
+        return cls.from_lxml(fromstring(data, parser), attrs_ordered, incl_empty_text)
+
+    @classmethod
+    def from_file(cls, source, parser=None, attrs_ordered=False, incl_empty_text=False):
+        """ Returns a new document out of an XML file, given as a path or an open file object.
+        Whitespace between elements is ignored, unless a custom lxml parser is given.
+        """
+        parser = parser if parser is not None else XMLParser(remove_blank_text=True)
+        return cls.from_lxml(parse(source, parser), attrs_ordered, incl_empty_text)
+
+    @classmethod
+    def iter_records(cls, source, path, ns_map=None, attrs_ordered=False, incl_empty_text=False, **kwargs):
+        """ Incrementally parses an XML file, given as a path or an open file object, and yields a new document for each
+        element at path, e.g. /soap:Envelope/soap:Body/orders/order, with all the namespaces the element knows of.
+        Elements already processed are discarded so memory used is proportional to the size of a single record rather
+        than the whole file. Keyword arguments are passed to lxml.etree.iterparse.
+        """
+        kwargs.setdefault('remove_blank_text', True)
+        events = iterparse(source, events=('start-ns', 'start', 'end'), **kwargs)
+
+        return _RecordReader(cls, _PathMatcher(path, ns_map), attrs_ordered, incl_empty_text).read(events)
+
+    @classmethod
+    def push_parser(cls, depths=(1,), attrs_ordered=False, incl_empty_text=False, **kwargs):
+        """ Returns a parser that XML data can be fed to in chunks, e.g. as they are read from a socket. Each time
+        an element at one of depths is complete, the root element's depth being 0, a new document is built out of it,
+        with all the namespaces it knows of. Keyword arguments are passed to lxml.etree.XMLPullParser.
+        """
+        return _PushParser(cls, depths, attrs_ordered, incl_empty_text, **kwargs)
+
 # ################################################################################################################################
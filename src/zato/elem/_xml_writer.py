@@ -0,0 +1,622 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import re
+from codecs import getincrementalencoder
+
+# lxml
+from lxml.etree import cleanup_namespaces, Element
+
+# six
+from six import binary_type, string_types, text_type
+
+# Zato
+from zato.elem._common import no_value, resolve_name
+
+# ################################################################################################################################
+
+# Never declared explicitly in documents yet attributes such as xml:lang use it
+xml_ns = 'http://www.w3.org/XML/1998/namespace'
+
+# Encodings that lxml does not add an XML declaration for unless explicitly asked to
+_no_declaration_encodings = ('ASCII', 'US-ASCII', 'UTF-8', 'UTF8')
+
+_invalid_chars = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Whether text or attribute values need to be escaped or validated
+_text_special = re.compile('[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f]').search
+_attr_special = re.compile('[&<>"\r\n\t\x00-\x08\x0b\x0c\x0e-\x1f]').search
+
+# ################################################################################################################################
+
+def _to_text(value):
+    """ Returns value as text, raising the same exceptions lxml does for values it cannot serialize.
+    """
+    if isinstance(value, binary_type):
+        value = value.decode('utf8')
+    elif not isinstance(value, text_type):
+        raise TypeError("Argument must be bytes or unicode, got '{}'".format(value.__class__.__name__))
+
+    if _invalid_chars.search(value):
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters')
+
+    return value
+
+def escape_text(value):
+    value = _to_text(value)
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '\r' in value:
+        value = value.replace('\r', '&#13;')
+    return value
+
+def escape_attr(value):
+    value = escape_text(value)
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#9;')
+    return value
+
+# ################################################################################################################################
+
+class HasNamespaces(Exception):
+    """ Raised when an element or attribute in a namespace is found while serializing a document that is expected
+    to have none.
+    """
+
+# ################################################################################################################################
+
+class _Decl(object):
+    """ A namespace declaration. Target is the declaration that all references to this one are to use instead.
+    is_top is True if the namespace comes from the top-level namespace map.
+    """
+    __slots__ = ('prefix', 'ns', 'target', 'used', 'is_top')
+
+    def __init__(self, prefix, ns):
+        self.prefix = prefix
+        self.ns = ns
+        self.target = self
+        self.used = False
+        self.is_top = False
+
+
+_xml_decl = _Decl('xml', xml_ns)
+
+# ################################################################################################################################
+
+class NSResolver(object):
+    """ Assigns namespace prefixes and declarations to elements and attributes exactly the way to_xml does, that is,
+    the way lxml declares namespaces of new elements and attributes and how cleanup_namespaces then moves them to the root
+    if they are found in top_ns_map. Elements must be given in document order, i.e. each element's start followed by its
+    children and its end.
+
+    All namespaces from top_ns_map are declared on the root unless a set of ones in use is given. Callers either find them
+    in a separate pass or, if they keep the whole output in memory, check which ones were used at the end of the document.
+
+    Output of elements whose namespaces were all declared by ancestors depends only on prefixes these namespaces were given
+    so it can be reused wherever they have the same prefixes. To find such elements, callers may check whether the number
+    of changes remained the same between an element's start and end. If uses is a list, (namespace, prefix) pairs
+    of elements and attributes are appended to it.
+
+    Prefixes that lxml uses for well-known namespaces are looked up by each resolver anew so that changes made
+    with lxml.etree.register_namespace are always taken into account.
+    """
+    def __init__(self, top_ns_map=None, cleanup_ns=True, used_top=None, uses=None):
+        self.top_ns_map = top_ns_map or {}
+        self.cleanup_ns = cleanup_ns
+        self.used_top = used_top
+        self.top_decls = []
+        self.ns_counter = 0
+        self.lxml_prefixes = {}
+
+        # Namespaces as lxml would see them when creating elements
+        self.created = {}
+        self.created_undo = []
+
+        # Namespaces in scope of each element after cleanup, by namespace and by prefix, nearest ones last,
+        # and which of them each element declared
+        self.scope_by_ns = {}
+        self.scope_by_prefix = {}
+        self.scope_undo = []
+
+        # How many times namespaces were created or declared and which of them were used
+        self.changes = 0
+        self.uses = uses
+
+    def _get_lxml_prefix(self, ns, is_attr):
+        """ Returns a prefix lxml uses for a well-known namespace, e.g. xsl, or None for other ones.
+        Invalid namespaces are rejected the way lxml does it, i.e. only for elements.
+        """
+        if ns not in self.lxml_prefixes:
+            try:
+                prefix = Element('{%s}a' % ns).prefix
+            except ValueError:
+                if is_attr:
+                    return None
+                raise
+            self.lxml_prefixes[ns] = prefix if prefix != 'ns0' else None
+        return self.lxml_prefixes[ns]
+
+    def _new_prefix(self):
+        prefix = 'ns{}'.format(self.ns_counter)
+        self.ns_counter += 1
+        return prefix
+
+    def _create(self, ns, decls, is_attr=False):
+        """ Returns a declaration of a namespace that a newly created element or attribute points to,
+        declaring the namespace on the element if it is not known yet.
+        """
+        if ns == xml_ns:
+            return _xml_decl
+
+        prefix = self._get_lxml_prefix(ns, is_attr)
+
+        decl = self.created.get(ns)
+        if decl is None:
+            decl = self.created[ns] = _Decl(prefix or self._new_prefix(), ns)
+            self.created_undo[-1].append(ns)
+            decls.append(decl)
+
+        return decl
+
+    def _find_in_scope(self, ns):
+        """ Returns the nearest declaration of a namespace whose prefix is not redeclared by a nearer one.
+        """
+        by_prefix = self.scope_by_prefix
+        for decl in reversed(self.scope_by_ns.get(ns, ())):
+            if by_prefix[decl.prefix][-1] is decl:
+                return decl
+
+    def _push(self, decls):
+        # Each element's declarations are kept in reverse order so that the first one is found first
+        decls = decls[::-1]
+        for decl in decls:
+            self.scope_by_ns.setdefault(decl.ns, []).append(decl)
+            self.scope_by_prefix.setdefault(decl.prefix, []).append(decl)
+        self.scope_undo.append(decls)
+
+    def start(self, elem_ns, attr_nss, is_root):
+        """ Returns a prefix for the element, prefixes for its attributes and namespaces to declare on the element.
+        attr_nss is None if no attribute has a namespace, in which case there are no prefixes for attributes either.
+        """
+        created = self.created
+
+        # Most elements use namespaces that are already declared and there is nothing to declare for them
+        if not is_root and (elem_ns is None or (elem_ns in created and elem_ns in self.lxml_prefixes)) and \
+                (not attr_nss or all(ns is None or ns in created for ns in attr_nss)):
+
+            self.created_undo.append(())
+            if self.cleanup_ns:
+                self.scope_undo.append(())
+
+            uses = self.uses
+
+            prefix = None
+            if elem_ns is not None:
+                decl = created[elem_ns].target
+                decl.used = True
+                prefix = decl.prefix
+                if uses is not None:
+                    uses.append((elem_ns, prefix))
+
+            attr_prefixes = None
+            if attr_nss:
+                attr_prefixes = []
+                for ns in attr_nss:
+                    if ns is None:
+                        attr_prefixes.append(None)
+                    else:
+                        decl = created[ns].target
+                        decl.used = True
+                        attr_prefixes.append(decl.prefix)
+                        if uses is not None:
+                            uses.append((ns, decl.prefix))
+
+            return prefix, attr_prefixes, ()
+
+        decls = []
+        self.created_undo.append([])
+
+        elem_decl = self._create(elem_ns, decls) if elem_ns is not None else None
+        attr_decls = [self._create(ns, decls, True) if ns is not None else None for ns in attr_nss or ()]
+
+        if is_root or decls:
+            self.changes += 1
+
+        if self.cleanup_ns:
+
+            # Namespaces from top_ns_map are declared on the root unless their prefixes are taken already
+            if is_root:
+                prefixes = set(decl.prefix for decl in decls)
+                for prefix, ns in self.top_ns_map.items():
+                    if prefix not in prefixes and prefix != 'xml':
+                        prefixes.add(prefix)
+                        decl = _Decl(prefix, ns)
+                        decl.is_top = True
+                        decls.append(decl)
+                        self.top_decls.append(decl)
+
+            # Declarations of namespaces already declared by ancestors are redundant
+            else:
+                kept = []
+                for decl in decls:
+                    existing = self._find_in_scope(decl.ns)
+                    if existing is None:
+                        kept.append(decl)
+                    else:
+                        decl.target = existing
+                decls = kept
+
+            if elem_decl is not None:
+                elem_decl = elem_decl.target
+                elem_decl.used = True
+
+            for idx, decl in enumerate(attr_decls):
+                if decl is not None:
+                    decl = attr_decls[idx] = decl.target
+                    decl.used = True
+
+            self._push(decls)
+
+            # Unused namespaces from top_ns_map are removed
+            if is_root and self.used_top is not None:
+                decls = [decl for decl in decls if not decl.is_top or decl.prefix in self.used_top]
+
+        if self.uses is not None:
+            if elem_decl is not None:
+                self.uses.append((elem_ns, elem_decl.prefix))
+            for ns, decl in zip(attr_nss or (), attr_decls):
+                if decl is not None:
+                    self.uses.append((ns, decl.prefix))
+
+        return (elem_decl.prefix if elem_decl else None,
+            [decl.prefix if decl else None for decl in attr_decls] if attr_nss else None, decls)
+
+    def reuse(self, uses):
+        """ Returns True if namespaces have the same prefixes as in uses, marking them as used, or False otherwise.
+        """
+        created = self.created
+
+        for ns, prefix in uses:
+            if ns != xml_ns:
+                decl = created.get(ns)
+                if decl is None or decl.target.prefix != prefix:
+                    return False
+
+        for ns, prefix in uses:
+            if ns != xml_ns:
+                created[ns].target.used = True
+
+        if self.uses is not None:
+            self.uses.extend(uses)
+
+        return True
+
+    def end(self):
+        for ns in self.created_undo.pop():
+            del self.created[ns]
+
+        if self.cleanup_ns:
+            for decl in self.scope_undo.pop():
+                self.scope_by_ns[decl.ns].pop()
+                self.scope_by_prefix[decl.prefix].pop()
+
+    def get_used_top(self):
+        return set(decl.prefix for decl in self.top_decls if decl.used)
+
+# ################################################################################################################################
+
+def _is_unicode(encoding):
+    """ Whether encoding means that output is to be text rather than bytes, the same way lxml understands it.
+    """
+    return encoding is text_type or (isinstance(encoding, string_types) and encoding.lower() == 'unicode')
+
+class _Output(object):
+    """ Collects text and writes it out encoded to a file object in chunks of at least buffer_size characters.
+    Text is written as is if encoding is None.
+    """
+    def __init__(self, fileobj, encoding, buffer_size):
+        self.fileobj = fileobj
+        self.encoder = getincrementalencoder(encoding)('xmlcharrefreplace') if encoding else None
+        self.buffer_size = buffer_size
+        self.chunks = []
+        self.size = 0
+
+    def add(self, parts):
+        """ Adds a list of strings to the output, emptying the list.
+        """
+        chunk = ''.join(parts)
+        parts[:] = []
+
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self, final=False):
+        data = ''.join(self.chunks)
+        self.fileobj.write(self.encoder.encode(data, final) if self.encoder else data)
+        self.chunks[:] = []
+        self.size = 0
+
+
+# ################################################################################################################################
+
+# Ends the scope of namespaces an element declared
+_end = object()
+
+# Closing tags are kept on the stack of elements to serialize as strings
+_tag_classes = frozenset((binary_type, text_type))
+
+class _Fragment(object):
+    """ Marks the end of output of an element that is to be cached, which started at a given index of output parts.
+    """
+    __slots__ = ('elem', 'start', 'changes', 'uses')
+
+    def __init__(self, elem, start, changes, uses):
+        self.elem = elem
+        self.start = start
+        self.changes = changes
+        self.uses = uses
+
+def _set_cache(elem, key, value):
+    if elem._zato_cache is None:
+        object.__setattr__(elem, '_zato_cache', {})
+    elem._zato_cache[key] = value
+
+def _get_ns_attrs(attrs):
+    """ Returns attributes along with their namespaces or None instead of the latter if none of them has one. Attributes
+    of the same name in the same namespace, e.g. set under two prefixes of it, are one attribute to lxml - it keeps the place
+    of the first one and the value of the last one.
+    """
+    out = []
+    attr_nss = []
+    positions = {}
+
+    for attr in attrs:
+        ns = attr.ns or None
+        key = (ns, attr.name_no_ns)
+        idx = positions.get(key)
+        if idx is None:
+            positions[key] = len(out)
+            out.append(attr)
+            attr_nss.append(ns)
+        else:
+            out[idx] = attr
+
+    return out, attr_nss if any(attr_nss) else None
+
+def _get_used_top(root, top_ns_map):
+    """ Returns prefixes of namespaces from top_ns_map that are used by root or its descendants.
+    """
+    resolver = NSResolver(top_ns_map)
+    stack = [root]
+
+    while stack:
+        elem = stack.pop()
+
+        if elem is _end:
+            resolver.end()
+            continue
+
+        ns = elem._zato_ns_info.value or None
+        attr_nss = _get_ns_attrs(elem._zato_attrs.values())[1] if elem._zato_attrs else None
+
+        # Elements without namespaces cannot affect ones that their descendants use
+        if ns is not None or attr_nss or elem is root:
+            resolver.start(ns, attr_nss, elem is root)
+            stack.append(_end)
+
+        stack.extend(reversed(elem._zato_children))
+
+    return resolver.get_used_top()
+
+def _format_decls(decls):
+    """ Returns namespace declarations as they are written out in a start tag.
+    """
+    out = []
+
+    for decl in decls:
+        ns = decl.ns
+        if _attr_special(ns):
+            ns = escape_attr(ns)
+        out.append(' xmlns:{}="{}"'.format(decl.prefix, ns) if decl.prefix else ' xmlns="{}"'.format(ns))
+
+    return ''.join(out)
+
+def _serialize(root, encoding, xml_declaration, cleanup_ns, out, ns_free=False):
+    """ Serializes root and its descendants to strings. If out is given, they are added to it as they are produced,
+    which requires for the tree to be traversed twice if root has a namespace map, to find out which of its namespaces
+    are used before anything is written out. Otherwise, all of them are returned at the end, with root's namespaces
+    filled in then. If ns_free is True, HasNamespaces is raised as soon as an element or attribute in a namespace is found.
+
+    If out is not given and root's class caches output, output of each element with children, other than root, is cached
+    along with namespaces it uses, unless it declares namespaces of its own. Cached output is reused if the element
+    has not changed since and its namespaces still have the same prefixes.
+    """
+    is_unicode = _is_unicode(encoding)
+    if is_unicode and xml_declaration:
+        raise ValueError('Serialisation to unicode must not request an XML declaration')
+
+    top_ns_map = root._zato_ns_map if cleanup_ns else None
+    used_top = None
+
+    if top_ns_map:
+
+        # Let lxml reject invalid prefixes or namespaces, the same way it does in to_xml
+        cleanup_namespaces(Element('a'), top_ns_map)
+
+        if out:
+            used_top = _get_used_top(root, top_ns_map)
+
+    cache_key = ('xml', bool(cleanup_ns)) if out is None and root._zato_cache_output else None
+    uses = [] if cache_key else None
+
+    resolver = NSResolver(top_ns_map, cleanup_ns, used_top, uses)
+
+    parts = []
+    append = parts.append
+
+    # Where namespaces from top_ns_map are to be written to, if they are only known at the end
+    top_idx = None
+
+    # Like lxml, encodings other than ASCII or UTF-8 get an XML declaration unless explicitly told not to
+    default_declaration = not is_unicode and encoding and encoding.upper() not in _no_declaration_encodings
+
+    if xml_declaration or (xml_declaration is None and default_declaration):
+        append("<?xml version='1.0' encoding='{}'?>\n".format(encoding or 'ASCII'))
+
+    stack = [root]
+    pop = stack.pop
+    push = stack.append
+
+    while stack:
+        elem = pop()
+
+        # Closing tags
+        if elem.__class__ in _tag_classes:
+            append(elem)
+            continue
+
+        if elem is _end:
+            resolver.end()
+            continue
+
+        # Output of an element is complete and can be cached if it did not declare any namespaces
+        if elem.__class__ is _Fragment:
+            if elem.changes == resolver.changes:
+                fragment = ''.join(parts[elem.start:])
+                parts[elem.start:] = [fragment]
+                _set_cache(elem.elem, cache_key, (fragment, tuple(set(uses[elem.uses:]))))
+            continue
+
+        if cache_key and elem._zato_cache is not None:
+            cached = elem._zato_cache.get(cache_key)
+            if cached is not None and resolver.reuse(cached[1]):
+                append(cached[0])
+                continue
+
+        ns = elem._zato_ns_info.value or None
+        name = elem._zato_elem_name
+        ns_map = elem._zato_ns_map
+        name = (ns_map.name_cache.get(name) or resolve_name(name, ns_map))[2]
+
+        attrs = elem._zato_attrs
+        attr_nss = None
+        if attrs:
+            attrs = attrs.values()
+            for attr in attrs:
+                if attr.ns:
+                    attrs, attr_nss = _get_ns_attrs(attrs)
+                    break
+
+        if ns_free and (ns is not None or attr_nss):
+            raise HasNamespaces()
+
+        # Text is checked before attributes, which is the order lxml sets them in, so that the same errors are raised first
+        text = elem._zato_value
+        has_text = text != no_value and text is not None
+        if has_text and (text.__class__ is not text_type or _text_special(text)):
+            text = escape_text(text)
+
+        # Only elements with namespaces need to have them resolved
+        resolved = ns is not None or attr_nss or elem is root
+
+        children = elem._zato_children
+        if cache_key and children and elem is not root:
+            push(_Fragment(elem, len(parts), resolver.changes, len(uses)))
+
+        if resolved:
+            prefix, attr_prefixes, decls = resolver.start(ns, attr_nss, elem is root)
+
+            if prefix:
+                name = prefix + ':' + name
+
+            append('<' + name)
+
+            if decls:
+                if elem is root and used_top is None and resolver.top_decls:
+                    append(_format_decls(decl for decl in decls if not decl.is_top))
+                    top_idx = len(parts)
+                    append('')
+                else:
+                    append(_format_decls(decls))
+
+            if attr_prefixes:
+                for attr_prefix, attr in zip(attr_prefixes, attrs):
+                    value = attr._zato_value
+                    if value.__class__ is not text_type or _attr_special(value):
+                        value = escape_attr(value)
+                    if attr_prefix:
+                        append(' ' + attr_prefix + ':' + attr.name_no_ns + '="' + value + '"')
+                    else:
+                        append(' ' + attr.name_no_ns + '="' + value + '"')
+                attrs = None
+
+        else:
+            append('<' + name)
+
+        if attrs:
+            for attr in attrs:
+                value = attr._zato_value
+                if value.__class__ is not text_type or _attr_special(value):
+                    value = escape_attr(value)
+                append(' ' + attr.name_no_ns + '="' + value + '"')
+
+        if has_text or children:
+            if has_text:
+                append('>' + text)
+            else:
+                append('>')
+
+            if resolved:
+                push(_end)
+            push('</' + name + '>')
+
+            if children:
+                stack.extend(reversed(children))
+
+        else:
+            append('/>')
+            if resolved:
+                resolver.end()
+
+        if out and len(parts) > 256:
+            out.add(parts)
+
+    if top_idx is not None:
+        parts[top_idx] = _format_decls(decl for decl in resolver.top_decls if decl.used)
+
+    return parts
+
+def write_xml(root, fileobj, encoding=None, xml_declaration=None, cleanup_ns=True, buffer_size=65536):
+    """ Serializes root and its descendants to a file object, producing the same output that to_xml does.
+    """
+    out = _Output(fileobj, None if _is_unicode(encoding) else encoding or 'ascii', buffer_size)
+    out.add(_serialize(root, encoding, xml_declaration, cleanup_ns, out))
+    out.flush(True)
+
+def to_xml_string(root, cleanup_ns=True, encoding=None, xml_declaration=None, ns_free=False):
+    """ Returns root and its descendants serialized to bytes, or text if encoding is 'unicode', the same way to_xml does.
+    If ns_free is True, HasNamespaces is raised for documents with elements or attributes in namespaces.
+    """
+    out = ''.join(_serialize(root, encoding, xml_declaration, cleanup_ns, None, ns_free))
+    return out if _is_unicode(encoding) else out.encode(encoding or 'ascii', 'xmlcharrefreplace')
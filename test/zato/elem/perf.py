@@ -11,58 +11,555 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # Part of Zato - Open-source ESB, SOA, REST, APIs and Cloud Integrations in Python
 # https://zato.io
 
-from zato.elem import default_ns, xml
+# Throughput benchmarks of building, parsing and serializing documents. Run from the top-level directory as a module, e.g.
+#
+#   python -m test.zato.elem.perf                          # All benchmarks
+#   python -m test.zato.elem.perf 'to_xml.*' '*.ns'        # Only those whose names match any of the patterns
+#   python -m test.zato.elem.perf --json baseline.json     # Save results as JSON
+#   python -m test.zato.elem.perf --compare baseline.json  # Compare with saved results, exits with 1 on regressions
+#
+# Each benchmark is named after an operation and its input, e.g. to_xml.wide, and processes a given number of items,
+# e.g. elements or records, in each call. Calls are made in loops lasting at least --min-time seconds each, first --warmup
+# loops whose times are discarded, then --repeat loops that statistics are computed from.
 
-def main(n):
+# stdlib
+import argparse
+import datetime
+import fnmatch
+import gc
+import itertools
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
 
-    for x in range(n):
+# Not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
 
-        doc = xml()
-        doc.ns_map += {'rem':'http://remoting.example.com/'}, default_ns.s12
+# lxml
+from lxml.etree import fromstring, LXML_VERSION
 
-        header = doc.s12_Envelope.s12_Header
+# ujson
+from ujson import dumps, loads
 
-        header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
-        header.wsa_Action._s12_mustUnderstand = '1'
-        header.wsa_Action._actor_type = '2'
-        header.wsa_MessageID = 'uuid:123'
-        header.wsa_ReplyTo.wsa_Address = 'http://www.w3.org/2005/08/addressing/anonymous'
+# Zato
+from zato.elem import default_ns, json, placeholder, xml
 
-        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
-        arg0.user = 'my-user'
-        arg0._rem_is_req = 'true'
-        arg0.pwd = 'my-password'
-        arg0.role = 'my-role'
-        arg0.org = 'my-org'
+# ################################################################################################################################
 
-        arg0.rem_access[0] = 'no'
-        arg0.rem_access[0]._rem_type = '0'
-        arg0.rem_access[0].access = '000'
+# Python 2 has no perf_counter
+perf_counter = getattr(time, 'perf_counter', time.time)
 
-        arg0.rem_access[1] = 'yes'
-        arg0.rem_access[1]._rem_type = '1'
-        arg0.rem_access[1].access = '111'
+# Python 2 has no timezone, results are dated with datetime.utcnow there, which is deprecated in Python 3
+utc = getattr(datetime, 'timezone', None) and datetime.timezone.utc
 
-        doc.to_json()
+# ################################################################################################################################
+
+def soap(n):
+    """ Builds a SOAP message with n access elements.
+    """
+    doc = xml()
+    doc.ns_map += {'rem':'http://remoting.example.com/'}, default_ns.s12
+
+    header = doc.s12_Envelope.s12_Header
+
+    header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+    header.wsa_Action._s12_mustUnderstand = '1'
+    header.wsa_Action._actor_type = '2'
+    header.wsa_MessageID = 'uuid:123'
+    header.wsa_ReplyTo.wsa_Address = 'http://www.w3.org/2005/08/addressing/anonymous'
+
+    arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+    arg0.user = 'my-user'
+    arg0._rem_is_req = 'true'
+    arg0.pwd = 'my-password'
+    arg0.role = 'my-role'
+    arg0.org = 'my-org'
+
+    for idx in range(n):
+        arg0.rem_access[idx] = 'yes' if idx % 2 else 'no'
+        arg0.rem_access[idx]._rem_type = str(idx)
+        arg0.rem_access[idx].access = str(idx) * 3
 
     return doc
 
-if __name__ == '__main__':
-    import datetime
+def get_template():
+    """ The same document as soap builds but with placeholders for its values, turned into a template.
+    """
+    doc = xml()
+    doc.ns_map += {'rem':'http://remoting.example.com/'}, default_ns.s12
+
+    header = doc.s12_Envelope.s12_Header
+
+    header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+    header.wsa_Action._s12_mustUnderstand = '1'
+    header.wsa_Action._actor_type = '2'
+    header.wsa_MessageID = placeholder('msg_id')
+    header.wsa_ReplyTo.wsa_Address = 'http://www.w3.org/2005/08/addressing/anonymous'
+
+    arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+    arg0.user = placeholder('user')
+    arg0._rem_is_req = 'true'
+    arg0.pwd = placeholder('pwd')
+    arg0.role = placeholder('role')
+    arg0.org = placeholder('org')
+
+    arg0.rem_access[0] = placeholder('value')
+    arg0.rem_access[0]._rem_type = placeholder('type')
+    arg0.rem_access[0].access = placeholder('access')
+
+    return doc.to_template()
+
+def wide(n):
+    """ Builds a document whose root has n distinct children.
+    """
+    doc = xml()
+    root = doc.root
+
+    for idx in range(n):
+        setattr(root, 'elem{}'.format(idx), str(idx))
+
+    return doc
+
+def deep(n):
+    """ Builds a document with n elements, each nested in the previous one.
+    """
+    doc = xml()
+    elem = doc.root
+
+    for idx in range(n - 1):
+        elem._level = str(idx)
+        elem = elem.elem
+
+    elem._zato_value = 'leaf'
+
+    return doc
+
+def list_heavy(n):
+    """ Builds a document whose root has a list of n repeated elements.
+    """
+    doc = xml()
+    item = doc.root.item
+
+    for idx in range(n):
+        item[idx] = str(idx)
+        item[idx]._id = str(idx)
+
+    return doc
+
+def ns_heavy(n):
+    """ Builds a document declaring all of the default namespaces, with n elements nested in pairs under its root.
+    """
+    doc = xml()
+    doc.ns_map += [value for name, value in sorted(vars(default_ns).items()) if not name.startswith('__')]
+    root = doc.s12_Envelope.s12_Body
+
+    for idx in range(n // 2):
+        elem = getattr(root, 'wsa_elem{}'.format(idx))
+        elem.xs_value = str(idx)
+
+    return doc
+
+# ################################################################################################################################
+
+def get_orders_xml(n):
+    """ Returns a SOAP message with n order records.
+    """
+    orders = ''.join(
+        '<order id="{0}"><sku>sku-{0}</sku><qty>{0}</qty><price cur="EUR">1.5</price></order>'.format(idx) for idx in range(n))
+
+    return '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><orders>{}' \
+        '</orders></soap:Body></soap:Envelope>'.format(orders).encode('utf8')
+
+def get_orders_json(n):
+    """ Returns a JSON document with n order records.
+    """
+    return dumps({'orders': {'order': [
+        {'#id': str(idx), 'sku': 'sku-{}'.format(idx), 'qty': idx, 'price': {'text': '1.5', '#cur': 'EUR'}}
+        for idx in range(n)]}})
+
+def write_orders_file(path, n):
+    """ Writes n order records to an XML file, without keeping them all in memory.
+    """
+    with open(path, 'wb') as f:
+        f.write(b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><orders>')
+        for idx in range(n):
+            f.write('<order id="{0}"><sku>sku-{0}</sku><qty>{0}</qty><price cur="EUR">1.5</price></order>'.format(
+                idx).encode('utf8'))
+        f.write(b'</orders></soap:Body></soap:Envelope>')
+
+def write_orders_ndjson(path, n):
+    """ Writes n order records to a newline-delimited JSON file.
+    """
+    with json.ndjson_writer(path) as writer:
+        for idx in range(n):
+            writer.write(json.from_obj({'order': {'#id': str(idx), 'sku': 'sku-{}'.format(idx), 'qty': idx}}))
+
+class cached_xml(xml):
+    __slots__ = ()
+    _zato_cache_output = True
+
+class shadow_xml(xml):
+    __slots__ = ()
+    _zato_lxml_shadow = True
+
+# ################################################################################################################################
+
+# Each setup function below is called with n and a temporary directory and returns a function to time.
+
+def _build(builder, n, tmp_dir):
+    return partial(builder, n)
+
+def _serialize(builder, op, n, tmp_dir, **kwargs):
+    return partial(getattr(builder(n), op), **kwargs)
+
+def _template(n, tmp_dir):
+    template = get_template()
+    access = [{'value':'no', 'type':'0', 'access':'000'}, {'value':'yes', 'type':'1', 'access':'111'}]
+
+    return partial(template.new, msg_id='uuid:123', user='my-user', pwd='my-password', role='my-role', org='my-org',
+        rem_access=access)
+
+def _parse(parse_func, get_data, n, tmp_dir):
+    return partial(parse_func, get_data(n))
+
+def _serialize_orders(op, n, tmp_dir, **kwargs):
+    return partial(getattr(xml.from_string(get_orders_xml(n)), op), **kwargs)
+
+def _serialize_orders_stream(op, n, tmp_dir):
+    func = getattr(xml.from_string(get_orders_xml(n)), op)
+
+    def serialize():
+        with open(os.devnull, 'wb') as f:
+            func(f)
+
+    return serialize
+
+def _reserialize(class_, op, n, tmp_dir):
+    """ Serializes a document again after one of its leaves changes.
+    """
+    doc = class_.from_string(get_orders_xml(n))
+    order = doc.soap_Envelope.soap_Body.orders.order[n // 2]
+    values = itertools.cycle(('1', '2'))
+    func = getattr(doc, op)
+    func()
+
+    def reserialize():
+        order.qty = next(values)
+        func()
+
+    return reserialize
+
+def _ndjson_write(n, tmp_dir):
+    return partial(write_orders_ndjson, os.path.join(tmp_dir, 'ndjson-write.ndjson'), n)
+
+def _ndjson_read(n, tmp_dir, **kwargs):
+    path = os.path.join(tmp_dir, 'ndjson-read.ndjson')
+    write_orders_ndjson(path, n)
+
+    def read():
+        for doc in json.iter_ndjson(path, **kwargs):
+            pass
+
+    return read
+
+def _ndjson_transform(n, tmp_dir):
+    path = os.path.join(tmp_dir, 'ndjson-transform.ndjson')
+    out_path = os.path.join(tmp_dir, 'ndjson-transform-out.ndjson')
+    write_orders_ndjson(path, n)
+
+    def transform():
+        with json.ndjson_writer(out_path) as writer:
+            for doc in json.iter_ndjson(path):
+                doc.order.qty = doc.order.qty._zato_value * 2
+                writer.write(doc)
+
+    return transform
 
-    #import cProfile
-    #cProfile.run('main(10000)')
+def _iter_records(n, tmp_dir):
+    path = os.path.join(tmp_dir, 'records.xml')
+    write_orders_file(path, n)
 
-    n = 200
-    repeats = 40
-    items = []
+    def read():
+        for record in xml.iter_records(path, '/soap:Envelope/soap:Body/orders/order'):
+            pass
 
-    for x in range(repeats):
-        start = datetime.datetime.utcnow()
-        doc = main(n)
-        elapsed = datetime.datetime.utcnow() - start
-        result = 1.0 / elapsed.total_seconds() * n
-        items.append(result)
-        print('{:.0f} doc/s'.format(result))
+    return read
 
-    print('Avg of {:.0f} doc/s after {} repeats'.format(sum(items) / repeats, repeats))
+# ################################################################################################################################
+
+class Benchmark(object):
+    """ A function to time, created by a setup function which prepares its input data. Each call of the function
+    processes a given number of items, e.g. elements or records, which throughput is given in.
+    """
+    def __init__(self, name, setup, n, items=None):
+        self.name = name
+        self.setup = setup
+        self.n = n
+        self.items = n if items is None else items
+
+
+# Names, builders and sizes of documents that each of the basic operations is run on. Benchmarks of SOAP messages
+# process one document in each call, those of other documents - one element.
+_shapes = (
+    ('soap', soap, 2, 1),
+    ('wide', wide, 2000, None),
+    ('deep', deep, 400, None),
+    ('list', list_heavy, 2000, None),
+    ('ns', ns_heavy, 2000, None),
+)
+
+# The lxml backend of to_xml recurses into each level of elements, so deep documents cannot be much deeper than that
+_max_depth = 400
+
+def get_benchmarks(scale=1.0):
+    """ Returns all benchmarks, with sizes of their input data multiplied by scale.
+    """
+    def size(n):
+        return max(1, int(n * scale))
+
+    out = []
+
+    for shape, builder, n, items in _shapes:
+        if items is None:
+            n = size(n)
+        if builder is deep:
+            n = min(n, _max_depth)
+
+        out.append(Benchmark('build.{}'.format(shape), partial(_build, builder), n, items))
+        for op in ('to_xml', 'to_dict', 'to_json', 'pretty'):
+            out.append(Benchmark('{}.{}'.format(op, shape), partial(_serialize, builder, op), n, items))
+
+        # The direct backend serializes only documents without namespaces
+        if shape in ('wide', 'deep', 'list'):
+            out.append(Benchmark('to_xml_direct.{}'.format(shape),
+                partial(_serialize, builder, 'to_xml', backend='direct'), n, items))
+
+    out.append(Benchmark('template.soap', _template, 2, 1))
+
+    n = size(2000)
+
+    out.append(Benchmark('parse.orders', partial(_parse, xml.from_string, get_orders_xml), n))
+    out.append(Benchmark('parse_lxml.orders', partial(_parse, fromstring, get_orders_xml), n))
+    out.append(Benchmark('parse_json.orders', partial(_parse, json.from_string, get_orders_json), n))
+    out.append(Benchmark('parse_ujson.orders', partial(_parse, loads, get_orders_json), n))
+
+    out.append(Benchmark('to_xml.orders', partial(_serialize_orders, 'to_xml'), n))
+    out.append(Benchmark('to_xml_stream.orders', partial(_serialize_orders_stream, 'to_xml_stream'), n))
+    out.append(Benchmark('to_json.orders', partial(_serialize_orders, 'to_json'), n))
+    out.append(Benchmark('to_json_stream.orders', partial(_serialize_orders_stream, 'to_json_stream'), n))
+
+    out.append(Benchmark('ndjson_write.orders', _ndjson_write, n))
+    out.append(Benchmark('ndjson_read.orders', _ndjson_read, n))
+    out.append(Benchmark('ndjson_read_dict.orders', partial(_ndjson_read, as_dict=True), n))
+    out.append(Benchmark('ndjson_transform.orders', _ndjson_transform, n))
+    out.append(Benchmark('iter_records.orders', _iter_records, n))
+
+    # Documents are serialized again after one change, which is what items are
+    n = size(10000)
+
+    out.append(Benchmark('reserialize_xml.orders', partial(_reserialize, xml, 'to_xml'), n, 1))
+    out.append(Benchmark('reserialize_xml.orders_cached', partial(_reserialize, cached_xml, 'to_xml'), n, 1))
+    out.append(Benchmark('reserialize_xml.orders_shadow', partial(_reserialize, shadow_xml, 'to_xml'), n, 1))
+    out.append(Benchmark('reserialize_json.orders', partial(_reserialize, xml, 'to_json'), n, 1))
+    out.append(Benchmark('reserialize_json.orders_cached', partial(_reserialize, cached_xml, 'to_json'), n, 1))
+
+    return out
+
+# ################################################################################################################################
+
+def _run_loop(func, number, timer):
+    start = timer()
+    for x in range(number):
+        func()
+    return timer() - start
+
+def measure(func, repeat=7, warmup=1, min_time=0.1, timer=perf_counter):
+    """ Returns the number of calls to func in each loop, chosen so that loops last at least min_time seconds,
+    and times per call, in seconds, of each of repeat loops run after warmup ones. Time is what timer returns,
+    wall-clock time by default.
+    """
+    number = 1
+    while _run_loop(func, number, timer) < min_time:
+        number *= 2
+
+    times = []
+
+    for idx in range(warmup + repeat):
+        gc.collect()
+        elapsed = _run_loop(func, number, timer)
+        if idx >= warmup:
+            times.append(elapsed / number)
+
+    return number, times
+
+def get_stats(number, times, items):
+    """ Returns statistics of times per call, in seconds, measured in loops of a given number of calls.
+    """
+    times = sorted(times)
+    count = len(times)
+    middle = count // 2
+
+    mean = sum(times) / count
+    median = times[middle] if count % 2 else (times[middle - 1] + times[middle]) / 2
+    stdev = (sum((elem - mean) ** 2 for elem in times) / (count - 1)) ** 0.5 if count > 1 else 0.0
+
+    return {
+        'number': number,
+        'repeat': count,
+        'items': items,
+        'min': times[0],
+        'max': times[-1],
+        'mean': mean,
+        'median': median,
+        'stdev': stdev,
+        'items_per_second': items / median if median else None,
+    }
+
+def get_change(stats, baseline_stats):
+    """ Returns how much median time per item changed relative to baseline, e.g. 0.1 if it is 10% slower.
+    Times per item are compared, rather than times per call, in case the two were run with different sizes of input data.
+    """
+    return (stats['median'] / stats['items']) / (baseline_stats['median'] / baseline_stats['items']) - 1
+
+def compare(results, baseline, threshold=0.1):
+    """ Returns names and changes of benchmarks found in both results and baseline which are slower than in baseline
+    by more than threshold, a fraction of their baseline times.
+    """
+    regressions = []
+
+    for name, stats in sorted(results['benchmarks'].items()):
+        baseline_stats = baseline['benchmarks'].get(name)
+        if baseline_stats:
+            change = get_change(stats, baseline_stats)
+            if change > threshold:
+                regressions.append((name, change))
+
+    return regressions
+
+# ################################################################################################################################
+
+def run(benchmarks, repeat=7, warmup=1, min_time=0.1, baseline=None, threshold=0.1, out=None):
+    """ Runs benchmarks, printing their statistics, and compared with baseline, if there is one, as they complete.
+    Returns results ready to be serialized to JSON.
+    """
+    out = out or sys.stdout
+    results = {
+        'meta': {
+            'date': (datetime.datetime.now(utc) if utc else datetime.datetime.utcnow()).isoformat(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'lxml': '.'.join(str(elem) for elem in LXML_VERSION),
+            'repeat': repeat,
+            'warmup': warmup,
+            'min_time': min_time,
+        },
+        'benchmarks': {},
+    }
+
+    header = '{:<32} {:>7} {:>12} {:>8} {:>14}'.format('benchmark', 'items', 'median', 'stdev', 'items/s')
+    if baseline:
+        header += ' {:>8}'.format('change')
+    print(header, file=out)
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        for benchmark in benchmarks:
+            func = benchmark.setup(benchmark.n, tmp_dir)
+            number, times = measure(func, repeat, warmup, min_time)
+            stats = get_stats(number, times, benchmark.items)
+            stats['n'] = benchmark.n
+            results['benchmarks'][benchmark.name] = stats
+
+            line = '{:<32} {:>7} {:>9.3f} ms {:>7.1f}% {:>14.0f}'.format(benchmark.name, benchmark.items,
+                stats['median'] * 1000, stats['stdev'] / stats['mean'] * 100, stats['items_per_second'] or 0)
+
+            if baseline:
+                baseline_stats = baseline['benchmarks'].get(benchmark.name)
+                if baseline_stats:
+                    change = get_change(stats, baseline_stats)
+                    line += ' {:>+7.1f}%{}'.format(change * 100, ' REGRESSION' if change > threshold else '')
+                else:
+                    line += ' {:>8}'.format('new')
+
+            print(line, file=out)
+            out.flush()
+
+            # Input data of one benchmark is not to slow down garbage collection in the next ones
+            del func
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if resource is not None:
+        results['meta']['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return results
+
+# ################################################################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Throughput benchmarks of zato-elem.')
+    parser.add_argument('patterns', nargs='*', help='Run only benchmarks whose names match any of the shell-style patterns')
+    parser.add_argument('--list', action='store_true', help='List benchmarks and exit')
+    parser.add_argument('--repeat', type=int, default=7, help='Loops to compute statistics from (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=1, help='Loops to discard first (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=0.1, help='Minimum time of a loop, in seconds (default: %(default)s)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier of sizes of input data (default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH', help='Save results as JSON to a file, or stdout if PATH is -')
+    parser.add_argument('--compare', metavar='PATH', help='Compare results with those saved in a JSON file')
+    parser.add_argument('--threshold', type=float, default=10.0,
+        help='Percent by which benchmarks can be slower than in the compared results (default: %(default)s)')
+
+    args = parser.parse_args(argv)
+
+    benchmarks = [elem for elem in get_benchmarks(args.scale)
+        if not args.patterns or any(fnmatch.fnmatchcase(elem.name, pattern) for pattern in args.patterns)]
+
+    if args.list:
+        for benchmark in benchmarks:
+            print('{:<32} n={}'.format(benchmark.name, benchmark.n))
+        return 0
+
+    if not benchmarks:
+        parser.error('No benchmarks match `{}`'.format(' '.join(args.patterns)))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'rb') as f:
+            baseline = loads(f.read())
+
+    threshold = args.threshold / 100
+    out = sys.stderr if args.json == '-' else sys.stdout
+
+    results = run(benchmarks, args.repeat, args.warmup, args.min_time, baseline, threshold, out)
+    results['meta']['scale'] = args.scale
+
+    if args.json:
+        data = dumps(results, indent=2, escape_forward_slashes=False)
+        if args.json == '-':
+            print(data)
+        else:
+            with open(args.json, 'w') as f:
+                f.write(data)
+
+    if baseline:
+        regressions = compare(results, baseline, threshold)
+        for name, change in regressions:
+            print('Regression: {} is {:.1f}% slower'.format(name, change * 100), file=out)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.elem import default_ns, json, xml
+
+# ################################################################################################################################
+
+class cached_xml(xml):
+    __slots__ = ()
+    _zato_cache_output = True
+
+class cached_json(json):
+    __slots__ = ()
+    _zato_cache_output = True
+
+# ################################################################################################################################
+
+def fill(doc):
+    doc.ns_map += default_ns.s12, default_ns.wsa, {'rem':'http://remoting.example.com'}
+
+    header = doc.s12_Envelope.s12_Header
+    header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+    header.wsa_Action._s12_mustUnderstand = '1'
+    header.wsa_MessageID = 'uuid:123'
+
+    arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+    arg0.user = 'my-user'
+    arg0.rem_access[0] = 'no'
+    arg0.rem_access[0]._rem_type = '0'
+    arg0.rem_access[1]._rem_type = '1'
+    arg0.rem_access[1].access = '111'
+
+    return doc
+
+# ################################################################################################################################
+
+class Cache(TestCase):
+    """ Tests caching of output of documents that are changed between serializations.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def _assert_same(self, doc, expected):
+        self.assertEquals(doc.to_xml(), expected.to_xml())
+        self.assertEquals(doc.to_xml(cleanup_ns=False), expected.to_xml(cleanup_ns=False))
+        self.assertEquals(doc.to_xml(encoding='utf-8', xml_declaration=True),
+            expected.to_xml(encoding='utf-8', xml_declaration=True))
+        self.assertEquals(doc.to_json(), expected.to_json())
+        self.assertEquals(doc.to_json(include_ns=True), expected.to_json(include_ns=True))
+        self.assertEquals(doc.to_dict(), expected.to_dict())
+
+# ################################################################################################################################
+
+    def test_cache_changes(self):
+        doc = fill(cached_xml())
+        expected = fill(xml())
+
+        def change(func):
+            func(doc)
+            func(expected)
+            self._assert_same(doc, expected)
+
+        self._assert_same(doc, expected)
+        self._assert_same(doc, expected)
+
+        # Values
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Header, 'wsa_MessageID', 'uuid:456'))
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[1], '_zato_value', 'yes'))
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access.__setitem__(0, 'maybe'))
+
+        # Attributes
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Header.wsa_MessageID, '_rem_id', 'abc'))
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0, '_rem_level', '2'))
+
+        # New elements
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0, 'pwd', 'secret'))
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[2])
+        change(lambda doc: doc.s12_Envelope.s12_Header.wsa_ReplyTo.wsa_Address)
+
+        # Namespaces
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin, 'ns', 'http://other.example.com'))
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0, 'ns_map', {'x':'http://x.example.com'}))
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.x_other)
+
+        # Whole subtrees, copied from other documents
+        change(lambda doc: setattr(
+            doc.s12_Envelope.s12_Body, 'copy', fill(doc.__class__()).s12_Envelope.s12_Body.rem_usrOrgRoleLogin))
+
+# ################################################################################################################################
+
+    def test_cache_dropped(self):
+        doc = fill(cached_xml())
+        header = doc.s12_Envelope.s12_Header
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+
+        doc.to_xml()
+        doc.to_json()
+
+        # Neither roots of XML documents nor elements within which a namespace is used for the first time are cached as XML
+        self.assertEquals(sorted(doc._zato_cache), [('json', 'text', '#', False)])
+        self.assertEquals(sorted(doc.s12_Envelope._zato_cache), [('json', 'text', '#', False)])
+        self.assertEquals(sorted(header._zato_cache), [('json', 'text', '#', False)])
+        self.assertEquals(sorted(arg0._zato_cache), [('json', 'text', '#', False), ('xml', True)])
+
+        arg0.rem_access[1].access = '222'
+
+        # Ancestors of changed elements are no longer cached but other elements are
+        self.assertIsNone(arg0.rem_access[1]._zato_cache)
+        self.assertIsNone(arg0._zato_cache)
+        self.assertIsNone(doc._zato_cache)
+        self.assertEquals(len(header._zato_cache), 1)
+        self.assertEquals(sorted(arg0.rem_access[0]._zato_cache), [('json', 'text', '#', False)])
+
+        expected = fill(xml())
+        expected.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[1].access = '222'
+        self._assert_same(doc, expected)
+
+# ################################################################################################################################
+
+    def test_cache_json(self):
+        doc = cached_json()
+        expected = json()
+
+        for elem in doc, expected:
+            for idx in range(10):
+                elem.a.b[idx].c = idx
+                elem.a.b[idx].d.e = 'e{}'.format(idx)
+
+        self.assertEquals(doc.to_json(), expected.to_json())
+        self.assertEquals(doc.to_json(), expected.to_json())
+
+        for elem in doc, expected:
+            elem.a.b[5].d.e = 'changed'
+            elem.a.b[10].c = 10
+
+        self.assertEquals(doc.to_json(), expected.to_json())
+        self.assertEquals(b''.join(doc.iter_json()), expected.to_json().encode('utf8'))
+
+# ################################################################################################################################
+
+    def test_cache_not_used(self):
+        doc = fill(xml())
+        doc.to_xml(backend='direct')
+        doc.to_json()
+
+        self.assertIsNone(doc._zato_cache)
+        self.assertIsNone(doc.s12_Envelope.s12_Header._zato_cache)
+
+# ################################################################################################################################
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import sys
+from unittest import TestCase
+
+# Zato
+from zato.elem import default_ns, Elem, event, xml
+
+# ################################################################################################################################
+
+def get_doc():
+    doc = xml()
+    doc.ns_map += default_ns.s12, {'rem':'http://remoting.example.com'}
+
+    arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+    arg0._rem_id = '123'
+    arg0.user = 'myuser'
+    arg0.rem_access[0] = 'access1'
+    arg0.rem_access[0]._type = 'type1'
+    arg0.rem_access[1]._type = 'type2'
+    arg0.rem_access[1].level = '2'
+
+    other = arg0.other
+    other.ns = 'http://other.example.com'
+    other.a = 'aaa'
+
+    return doc
+
+# ################################################################################################################################
+
+class Events(TestCase):
+    """ Tests iter_events and from_events.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def test_iter_events(self):
+        doc = get_doc()
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+
+        self.assertListEqual(list(arg0.iter_events()), [
+            (event.start, 'arg0', False, None),
+            (event.attr, 'rem_id', '123'),
+            (event.start, 'user', False, None),
+            (event.text, 'myuser'),
+            (event.end, 'user'),
+            (event.start, 'rem_access', True, None),
+            (event.attr, 'type', 'type1'),
+            (event.text, 'access1'),
+            (event.end, 'rem_access'),
+            (event.start, 'rem_access', True, None),
+            (event.attr, 'type', 'type2'),
+            (event.start, 'level', False, None),
+            (event.text, '2'),
+            (event.end, 'level'),
+            (event.end, 'rem_access'),
+            (event.start, 'other', False, 'http://other.example.com'),
+            (event.start, 'a', False, None),
+            (event.text, 'aaa'),
+            (event.end, 'a'),
+            (event.end, 'other'),
+            (event.end, 'arg0'),
+        ])
+
+        # Top-level elements have no events of their own
+        self.assertEquals(next(doc.iter_events()), (event.start, 's12_Envelope', False, None))
+
+# ################################################################################################################################
+
+    def test_from_events(self):
+        doc = get_doc()
+        new = xml.from_events(doc.iter_events(), ns_map=doc.ns_map)
+
+        self.assertEquals(new.to_xml(), doc.to_xml())
+        self.assertListEqual(list(new.iter_events()), list(doc.iter_events()))
+
+        arg0 = new.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+        self.assertTrue(arg0.has_list_child(arg0.rem_access[1]))
+        self.assertEquals(arg0.rem_access[1].path, '/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[1]')
+
+# ################################################################################################################################
+
+    def test_pipeline(self):
+        doc = Elem()
+        for idx in range(5):
+            doc.a.b[idx] = idx
+            doc.a.b[idx]._c = 'c{}'.format(idx)
+
+        def no_attrs(events):
+            for item in events:
+                if item[0] != event.attr:
+                    yield item
+
+        def double(events):
+            for item in events:
+                yield (event.text, item[1] * 2) if item[0] == event.text else item
+
+        new = Elem.from_events(double(no_attrs(doc.iter_events())))
+        self.assertDictEqual(new.to_dict(), {'a': {'b': [0, 2, 4, 6, 8]}})
+
+# ################################################################################################################################
+
+    def test_deep(self):
+        doc = Elem()
+        depth = sys.getrecursionlimit() + 100
+
+        elem = doc.a
+        for idx in range(depth):
+            elem = elem.a
+        elem.b = 'bbb'
+
+        events = list(doc.iter_events())
+        self.assertEquals(len(events), (depth + 2) * 2 + 1)
+        self.assertListEqual(list(Elem.from_events(events).iter_events()), events)
+
+# ################################################################################################################################
+
+    def test_from_events_invalid(self):
+        for events, message in (
+            ([(event.end, 'a')], 'Unexpected end of `a`, current element is ``'),
+            ([(event.start, 'a', False, None), (event.end, 'b')], 'Unexpected end of `b`, current element is `a`'),
+            ([(event.start, 'a', False, None)], 'Missing end of `a`'),
+            ([('abc',)], 'Unknown event `abc`'),
+        ):
+            try:
+                Elem.from_events(events)
+            except ValueError as e:
+                self.assertEquals(e.args[0], message)
+            else:
+                self.fail('Invalid events yet no ValueError raised')
+
+# ################################################################################################################################
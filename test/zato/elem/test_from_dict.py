@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.elem import compare_xml, default_ns, Elem, xml
+
+# ################################################################################################################################
+
+def get_expected():
+    doc = xml()
+    doc.ns_map += {'rem':'http://remoting.example.com/'}, default_ns.s12
+    arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+    arg0._rem_id = '123'
+    arg0.user = 'myuser'
+    arg0.rem_access[0] = 'access1'
+    arg0.rem_access[0]._type = 'type1'
+    arg0.rem_access[1] = 'access2'
+    arg0.rem_access[1]._type = 'type2'
+    return doc
+
+# ################################################################################################################################
+
+class FromDictTestCase(TestCase):
+
+    def test_from_dict(self):
+        data = {'s12_Envelope': {'s12_Body': {'rem_usrOrgRoleLogin': {'arg0': {
+            '#rem_id': '123',
+            'user': 'myuser',
+            'rem_access': [
+                {'text': 'access1', '#type': 'type1'},
+                {'text': 'access2', '#type': 'type2'},
+            ]}}}}}
+
+        ns_map = dict(default_ns.s12, rem='http://remoting.example.com/')
+        doc = xml.from_dict(data, ns_map=ns_map)
+
+        compare_xml(get_expected().to_xml(), doc.to_xml())
+
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+        self.assertEquals(arg0._rem_id._zato_value, '123')
+        self.assertEquals(arg0.rem_access[1]._type._zato_value, 'type2')
+        self.assertEquals(arg0.rem_access[1].path, '/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[1]')
+        self.assertTrue(arg0.has_list_child(arg0.rem_access[0]))
+
+    def test_round_trip(self):
+        doc = Elem()
+        doc.a.b = 'abc'
+        doc.a.c._d = 'def'
+        doc.a.e.f[0] = 1
+        doc.a.e.f[1] = 2
+        doc.a.e.f[1].g = 3
+        doc.a.h = None
+
+        data = doc.to_dict()
+        self.assertEquals(Elem.from_dict(data).to_dict(), data)
+
+    def test_text_key_attr_prefix(self):
+        doc = Elem.from_dict({'a': {'value': 'abc', '@b': 'def'}}, text_key='value', attr_prefix='@')
+        self.assertEquals(doc.to_dict(), {'a': {'text': 'abc', '#b': 'def'}})
+
+# ################################################################################################################################
+
+class FromPathsTestCase(TestCase):
+
+    def test_from_paths(self):
+        doc = xml.from_paths([
+            ('/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/_rem_id', '123'),
+            ('/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/user', 'myuser'),
+            ('/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[0]', 'access1'),
+            ('/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[0]/_type', 'type1'),
+            ('/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[1]', 'access2'),
+            ('/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[1]/@type', 'type2'),
+        ], ns_map=dict(default_ns.s12, rem='http://remoting.example.com/'))
+
+        compare_xml(get_expected().to_xml(), doc.to_xml())
+
+    def test_elem_paths(self):
+        doc = Elem.from_paths([('a.b', 1), ('a.c[0].d', 2), ('a.c[1]', 3), ('a.c[0].d', 4), ('a._e', 5)])
+        self.assertEquals(doc.to_dict(), {'a': {'b': 1, 'c': [{'d': 4}, 3], '#e': 5}})
+
+    def test_list_promoted(self):
+        doc = Elem.from_paths([('a.b', 1), ('a.b[0]', 2)])
+        self.assertEquals(doc.to_dict(), {'a': {'b': [2]}})
+
+    def test_list_last(self):
+        doc = Elem.from_paths([('a.b[0].c', 1), ('a.b[1].c', 2), ('a.b.d', 3)])
+        self.assertEquals(doc.to_dict(), {'a': {'b': [{'c': 1}, {'c': 2, 'd': 3}]}})
+        self.assertIs(doc.a.b.d, doc.a.b[1].d)
+
+    def test_invalid_idx(self):
+        with self.assertRaises(IndexError) as ctx:
+            Elem.from_paths([('a.b[0]', 1), ('a.b[2]', 2)])
+        self.assertEquals(ctx.exception.args[0], 'Cannot access idx 2, b[1] is missing')
+
+# ################################################################################################################################
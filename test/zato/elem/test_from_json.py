@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from unittest import TestCase
+
+# ujson
+from ujson import dumps, loads
+
+# Zato
+from zato.elem import json
+
+# ################################################################################################################################
+
+status = {
+    'coordinates': None,
+    'favorited': False,
+    'id': 210462857140252672,
+    'entities': {
+        'urls': [
+            {'expanded_url': 'https://dev.twitter.com/terms/display-guidelines',
+             'url': 'https://t.co/Ed4omjYs',
+             'indices': [76, 97],
+             'display_url': 'dev.twitter.com/terms/display-…'}
+        ],
+        'hashtags': [
+            {'text': 'Twitterbird',
+             'indices': [19, 31]}
+        ],
+        'user_mentions': []
+    },
+    'contributors': [14927800],
+    'text': "Along with our new #Twitterbird, we've also updated our Display Guidelines: https://t.co/Ed4omjYs  ^JC",
+    'user': {
+        'name': 'Twitter API',
+        'utc_offset': -28800,
+        'description': {'text': 'The Real Twitter API.', '#lang': 'en'},
+    },
+}
+
+# ################################################################################################################################
+
+class FromJSONTestCase(TestCase):
+
+    def setUp(self):
+        self.maxDiff = None
+
+    def test_from_string(self):
+        doc = json.from_string(dumps(status))
+        self.assertEquals(doc.to_dict(), status)
+
+        self.assertEquals(doc.id._zato_value, 210462857140252672)
+        self.assertEquals(doc.entities.urls[0].url._zato_value, 'https://t.co/Ed4omjYs')
+        self.assertEquals(doc.user.description._lang._zato_value, 'en')
+        self.assertEquals(doc.user.description._zato_value, 'The Real Twitter API.')
+
+        # A child rather than a value as values of top-level elements are not serialized
+        self.assertEquals(doc.text._zato_value, status['text'])
+
+    def test_from_bytes(self):
+        doc = json.from_bytes(dumps(status).encode('utf8'))
+        self.assertEquals(doc.to_dict(), status)
+        self.assertEquals(doc.entities.urls[0].display_url._zato_value, 'dev.twitter.com/terms/display-…')
+
+    def test_from_obj(self):
+        doc = json.from_obj({'a': {'@b': 'c', 'value': 'd'}}, text_key='value', attr_prefix='@')
+        self.assertEquals(doc.a._b._zato_value, 'c')
+        self.assertEquals(doc.a._zato_value, 'd')
+
+    def test_to_json(self):
+        self.assertEquals(loads(json.from_string(dumps(status)).to_json()), status)
+
+    def test_not_an_object(self):
+        with self.assertRaises(ValueError) as ctx:
+            json.from_string('[1, 2]')
+        self.assertEquals(ctx.exception.args[0], 'Expected a JSON object instead of `list`')
+
+# ################################################################################################################################
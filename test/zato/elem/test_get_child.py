@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.elem import Elem
+
+# ################################################################################################################################
+
+class GetChild(TestCase):
+    """ Tests how children are looked up by their names.
+    """
+    def test_get_child(self):
+        doc = Elem()
+        doc.a.b = 1
+        doc.a.c = 2
+
+        self.assertIs(doc.a.get_child('b'), doc.a.b)
+        self.assertIs(doc.a.get_child('c'), doc.a.c)
+        self.assertIs(doc.a['b'], doc.a.b)
+        self.assertIsNone(doc.a.get_child('d'))
+
+# ################################################################################################################################
+
+    def test_get_child_setattr_existing(self):
+        doc = Elem()
+        doc.a.b = 1
+        b = doc.a.b
+        doc.a.b = 2
+
+        self.assertIs(doc.a.get_child('b'), b)
+        self.assertEquals(len(doc.a._zato_children), 1)
+        self.assertDictEqual(doc.to_dict(), {'a': {'b': 2}})
+
+# ################################################################################################################################
+
+    def test_get_child_list_promotion(self):
+        doc = Elem()
+        doc.a.b = 'non-list'
+        doc.a.b[0] = 'b0'
+        doc.a.b[1] = 'b1'
+
+        b0 = doc.a.b[0]
+
+        self.assertIs(doc.a.get_child('b'), b0)
+        self.assertIs(doc.a['b'], b0)
+        self.assertEquals(len(doc.a._zato_children), 2)
+        self.assertListEqual(doc.a._zato_children, doc.a._zato_list_children['b'])
+
+# ################################################################################################################################
+
+    def test_get_child_wide(self):
+        doc = Elem()
+        names = ['a{}'.format(idx) for idx in range(500)]
+
+        for idx, name in enumerate(names):
+            setattr(doc.root, name, idx)
+
+        for idx, name in enumerate(names):
+            self.assertEquals(doc.root.get_child(name)._zato_value, idx)
+
+        self.assertEquals(len(doc.root), len(names))
+
+# ################################################################################################################################
+
+class HasListChild(TestCase):
+    """ Tests how list children are told apart from non-list ones.
+    """
+    def test_has_list_child(self):
+        doc = Elem()
+        doc.a.b[0] = 'b0'
+        doc.a.b[1] = 'b1'
+        doc.a.c = 'c'
+
+        self.assertTrue(doc.a.has_list_child(doc.a.b[0]))
+        self.assertTrue(doc.a.has_list_child(doc.a.b[1]))
+        self.assertFalse(doc.a.has_list_child(doc.a.c))
+
+# ################################################################################################################################
+
+    def test_has_list_child_other_parent(self):
+        doc1 = Elem()
+        doc1.a.b[0] = 'b0'
+
+        doc2 = Elem()
+        doc2.a.b[0] = 'b0'
+
+        self.assertTrue(doc1.a.has_list_child(doc1.a.b[0]))
+        self.assertFalse(doc1.a.has_list_child(doc2.a.b[0]))
+
+# ################################################################################################################################
+
+    def test_has_list_child_long_list(self):
+        doc = Elem()
+        for idx in range(5000):
+            doc.a.b[idx] = idx
+
+        self.assertDictEqual(doc.to_dict(), {'a': {'b': list(range(5000))}})
+
+# ################################################################################################################################
+
+class ListIdx(TestCase):
+    """ Tests how list elements know their own position.
+    """
+    def test_list_idx(self):
+        doc = Elem()
+        doc.a.b = 'non-list'
+        doc.a.c = 'c'
+
+        for idx in range(3):
+            doc.a.b[idx] = idx
+
+        self.assertIsNone(doc.a._get_list_idx())
+        self.assertIsNone(doc.a.c._get_list_idx())
+
+        for idx in range(3):
+            elem = doc.a.b[idx]
+            self.assertEquals(elem._get_list_idx(), idx)
+            self.assertIs(elem._zato_list_group, doc.a._zato_list_children['b'])
+            self.assertEquals(elem.path, 'a.b[{}]'.format(idx))
+
+# ################################################################################################################################
+
+    def test_list_idx_long_list(self):
+        doc = Elem()
+        for idx in range(5000):
+            doc.a.b[idx] = idx
+
+        self.assertEquals(doc.a.b[4999].path, 'a.b[4999]')
+        self.assertEquals(doc.a.b[0]._full_zato_name, 'b[0]')
+
+# ################################################################################################################################
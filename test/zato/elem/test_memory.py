@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import gc
+from unittest import skipIf, TestCase
+
+# six
+from six import PY2
+
+# Zato
+from zato.elem import Elem, json, xml
+from zato.elem._common import Attr, NSInfo
+
+# ################################################################################################################################
+
+def get_dict_based(class_):
+    """ Returns a copy of class_ keeping instance attributes in __dict__ instead of __slots__.
+    """
+    skip = set(class_.__slots__) | set(['__slots__', '__dict__', '__weakref__'])
+    attrs = dict((key, value) for key, value in class_.__dict__.items() if key not in skip)
+    return type(str('{}DictBased'.format(class_.__name__)), class_.__bases__, attrs)
+
+def get_bytes_per_elem(class_, n=2000):
+    """ Returns how many bytes on average it takes to create each of n children of a single element.
+    """
+    import tracemalloc
+
+    names = ['elem{}'.format(idx) for idx in range(n)]
+
+    # Names are resolved once and cached for later use, this is not what is measured
+    doc = class_()
+    for name in names:
+        getattr(doc.root, name)
+
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        doc = class_()
+        root = doc.root
+        for name in names:
+            getattr(root, name)
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    return size / n
+
+# ################################################################################################################################
+
+class Slots(TestCase):
+    """ Tests that nodes use __slots__ rather than __dict__.
+    """
+    def test_no_dict(self):
+        doc = Elem()
+        doc.a._b = '1'
+
+        for item in (doc, doc.a, doc.a._b, doc.a.ns, Attr('_a', ns_map={}), NSInfo(), xml(), json()):
+            self.assertFalse(hasattr(item, '__dict__'), item)
+
+        self.assertListEqual(doc._zato_children, [doc.a])
+
+# ################################################################################################################################
+
+    def test_children_not_in_slots(self):
+        doc = Elem()
+        doc.a.b[0] = 'b0'
+        doc.a.b[1] = 'b1'
+        doc.a.c = 'c'
+
+        self.assertIs(doc.a.b, doc.a._zato_list_children['b'][1])
+        self.assertIs(doc.a.c, doc.a.get_child('c'))
+
+# ################################################################################################################################
+
+    def test_assign_elem(self):
+        doc1 = Elem()
+        doc2 = Elem()
+
+        doc2.b = 123
+        doc2.c[0] = 1
+        doc2.c[1] = 2
+        doc2._d = 'd'
+        doc1.a = doc2
+
+        self.assertDictEqual(doc1.to_dict(), {'a': {'b': 123, 'c': [1, 2], '#d': 'd'}})
+        self.assertEquals(doc1.a.c.path, 'a.c[1]')
+        self.assertIs(doc1.a.c._zato_parent, doc1.a)
+
+        # The elements were copied, not moved, so changes to one of the documents are not seen by the other one
+        self.assertDictEqual(doc2.to_dict(), {'b': 123, 'c': [1, 2], '#d': 'd'})
+
+        doc1.a.b = 456
+        doc1.a.c[2] = 3
+        doc2._d._zato_value = 'd2'
+
+        self.assertDictEqual(doc1.to_dict(), {'a': {'b': 456, 'c': [1, 2, 3], '#d': 'd'}})
+        self.assertDictEqual(doc2.to_dict(), {'b': 123, 'c': [1, 2], '#d': 'd2'})
+
+# ################################################################################################################################
+
+    def test_leaf_shares_containers(self):
+        doc = Elem()
+        doc.a.b = 'b'
+        doc.a.c = 'c'
+
+        b, c = doc.a.b, doc.a.c
+
+        for name in ('_zato_ns_info', '_zato_children', '_zato_children_names', '_zato_children_by_name',
+                     '_zato_list_children', '_zato_attrs'):
+            self.assertIs(getattr(b, name), getattr(c, name), name)
+
+        for name in ('_zato_children', '_zato_children_names', '_zato_children_by_name'):
+            self.assertIsNot(getattr(doc.a, name), getattr(b, name), name)
+
+        self.assertRaises(TypeError, b._zato_attrs.setdefault, '_x', None)
+        self.assertRaises(TypeError, b._zato_ns_info.set_ns, 'example.com')
+        self.assertRaises(TypeError, b._zato_ns_info.map.update, {'x':'example.com/x'})
+
+        b._x = 'x'
+        b.ns = 'example.com'
+        b.d[0] = 'd'
+
+        self.assertIsNot(b._zato_attrs, c._zato_attrs)
+        self.assertIsNot(b._zato_ns_info, c._zato_ns_info)
+        self.assertIsNot(b._zato_list_children, c._zato_list_children)
+        self.assertDictEqual(doc.to_dict(), {'a': {'b': {'text': 'b', '#x': 'x', 'd': ['d']}, 'c': 'c'}})
+        self.assertFalse(c._zato_attrs)
+        self.assertFalse(c._zato_ns_info)
+
+# ################################################################################################################################
+
+    @skipIf(PY2, 'tracemalloc is not available under Python 2')
+    def test_bytes_per_elem(self):
+        slots_based = get_bytes_per_elem(Elem)
+        dict_based = get_bytes_per_elem(get_dict_based(Elem))
+
+        self.assertLess(slots_based, dict_based,
+            'Bytes per element: {:.0f} (__dict__), {:.0f} (__slots__)'.format(dict_based, slots_based))
+
+# ################################################################################################################################
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import os
+from io import BytesIO
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# Zato
+from zato.elem import json
+
+# ################################################################################################################################
+
+records = [
+    {'order': {'#id': '1', 'sku': 'a', 'qty': 1}},
+    {'order': {'#id': '2', 'sku': 'b', 'qty': 2, 'tags': ['x', 'y']}},
+    {'order': {'#id': '3', 'sku': 'ć', 'qty': {'text': 3, '#unit': 'kg'}}},
+]
+
+data = b'{"order":{"#id":"1","sku":"a","qty":1}}\n' \
+    b'{"order":{"#id":"2","sku":"b","qty":2,"tags":["x","y"]}}\n' \
+    b'\n' \
+    b'{"order":{"#id":"3","sku":"\\u0107","qty":{"text":3,"#unit":"kg"}}}'
+
+# ################################################################################################################################
+
+class NDJSONTestCase(TestCase):
+
+    def test_iter_ndjson(self):
+        docs = list(json.iter_ndjson(BytesIO(data)))
+        self.assertEquals(len(docs), 3)
+        self.assertEquals(docs[1].order._id._zato_value, '2')
+        self.assertEquals(docs[1].order.tags[1]._zato_value, 'y')
+        self.assertEquals([doc.to_dict() for doc in docs], records)
+
+    def test_iter_ndjson_as_dict(self):
+        self.assertEquals(list(json.iter_ndjson(BytesIO(data), as_dict=True)), records)
+
+    def test_writer(self):
+        out = BytesIO()
+
+        with json.ndjson_writer(out, buffer_size=100) as writer:
+            for doc in json.iter_ndjson(BytesIO(data)):
+                doc.order.qty = 10
+                writer.write(doc)
+
+            # Dicts are written as they are
+            writer.write({'a': 1})
+
+            # Some of the lines were written already, before all of them were buffered
+            self.assertTrue(out.getvalue())
+            self.assertNotIn(b'{"a":1}', out.getvalue())
+
+        lines = out.getvalue().splitlines()
+        self.assertEquals(len(lines), 4)
+        self.assertEquals(lines[3], b'{"a":1}')
+        self.assertFalse(out.closed)
+
+        docs = list(json.iter_ndjson(BytesIO(out.getvalue()), as_dict=True))
+        self.assertEquals([doc['order']['qty'] for doc in docs[:3]], [10, 10, {'text': 10, '#unit': 'kg'}])
+        self.assertEquals(docs[2]['order']['sku'], 'ć')
+
+    def test_file_names(self):
+        tmp_dir = mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'records.ndjson')
+
+            with json.ndjson_writer(path) as writer:
+                writer.write_all(records)
+
+            self.assertEquals([doc.to_dict() for doc in json.iter_ndjson(path)], records)
+        finally:
+            rmtree(tmp_dir)
+
+# ################################################################################################################################
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.elem import default_ns, Elem, xml
+from zato.elem._common import name_cache_max_size, NSMap, resolve_name
+
+# ################################################################################################################################
+
+class NSMapScope(TestCase):
+    """ Tests how namespace maps are shared between elements.
+    """
+    def test_shared_with_parent(self):
+        doc = Elem()
+        doc.ns_map += default_ns.s12, default_ns.wsa
+        doc.s12_Envelope.s12_Header.wsa_Action = 'a'
+
+        self.assertIs(doc.s12_Envelope._zato_ns_map, doc._zato_ns_map)
+        self.assertIs(doc.s12_Envelope.s12_Header.wsa_Action._zato_ns_map, doc._zato_ns_map)
+
+# ################################################################################################################################
+
+    def test_iadd_forks(self):
+        doc = Elem()
+        doc.ns_map += {'x':'example.com/x'}
+        top_ns_map = doc._zato_ns_map
+
+        doc.a.ns_map += {'y':'example.com/y'}
+        doc.a.y_b = 'b'
+        doc.c.y_d = 'd'
+
+        self.assertIs(doc._zato_ns_map, top_ns_map)
+        self.assertIs(doc.a.y_b._zato_ns_map, doc.a._zato_ns_map)
+        self.assertIs(doc.c._zato_ns_map, top_ns_map)
+        self.assertDictEqual(doc.ns_map, {'x':'example.com/x'})
+        self.assertDictEqual(doc.a.ns_map, {'x':'example.com/x', 'y':'example.com/y'})
+
+        self.assertDictEqual(doc.to_dict(), {'a': {'b': 'b'}, 'c': {'y_d': 'd'}})
+
+# ################################################################################################################################
+
+    def test_existing_children_keep_their_map(self):
+        doc = Elem()
+        doc.a.b = 'b'
+        doc.ns_map += {'x':'example.com/x'}
+        doc.a.x_c = 'c'
+        doc.x_e = 'e'
+
+        self.assertDictEqual(doc.a.ns_map, {})
+        self.assertDictEqual(doc.to_dict(), {'a': {'b': 'b', 'x_c': 'c'}, 'e': 'e'})
+
+# ################################################################################################################################
+
+    def test_setter_merges(self):
+        doc = Elem()
+        doc.ns_map = {'x':'example.com/x'}
+        doc.ns_map = {'y':'example.com/y'}
+
+        self.assertIsInstance(doc.ns_map, NSMap)
+        self.assertDictEqual(doc.ns_map, {'x':'example.com/x', 'y':'example.com/y'})
+
+# ################################################################################################################################
+
+    def test_empty_map_shared(self):
+        doc1 = Elem()
+        doc2 = Elem()
+
+        self.assertIs(doc1._zato_ns_map, doc2._zato_ns_map)
+        self.assertRaises(TypeError, doc1._zato_ns_map.update, {'x':'example.com/x'})
+        self.assertRaises(TypeError, doc1._zato_ns_map.__ior__, {'x':'example.com/x'})
+
+        doc1.ns_map.update({'x':'example.com/x'})
+        doc2.ns_map['y'] = 'example.com/y'
+
+        self.assertDictEqual(doc1.ns_map, {'x':'example.com/x'})
+        self.assertDictEqual(doc2.ns_map, {'y':'example.com/y'})
+        self.assertDictEqual(Elem().ns_map, {})
+
+# ################################################################################################################################
+
+    def test_getter_private(self):
+        doc = Elem()
+        doc.ns_map = {'x':'example.com/x'}
+        doc.a.b = 'b'
+
+        ns_map = doc.ns_map
+        ns_map['y'] = 'example.com/y'
+        doc.y_c = 'c'
+        doc.a.y_d = 'd'
+
+        # Existing children keep the map they shared with their parent, while new ones share the parent's private copy
+        self.assertIs(doc._zato_ns_map, ns_map)
+        self.assertIs(doc.y_c._zato_ns_map, ns_map)
+        self.assertDictEqual(doc.a.ns_map, {'x':'example.com/x'})
+        self.assertDictEqual(doc.to_dict(), {'a': {'b': 'b', 'y_d': 'd'}, 'c': 'c'})
+
+# ################################################################################################################################
+
+    def test_getter_no_side_effects(self):
+
+        class cached_xml(xml):
+            __slots__ = ()
+            _zato_cache_output = True
+
+        def fill(doc):
+            doc.ns_map = {'x':'example.com/x'}
+            doc.root.x_a = 'a'
+            doc.root.b.c = 'c'
+            return doc
+
+        doc = fill(cached_xml())
+        expected = doc.to_xml()
+
+        # Reading the map changes nothing, the output cached stays in place
+        ns_map = doc.root._zato_ns_map
+        self.assertDictEqual(doc.root.b.ns_map, {'x':'example.com/x'})
+        self.assertIsNot(doc.root.ns_map, ns_map)
+        self.assertIs(doc.root._zato_ns_map, ns_map)
+        self.assertIsNotNone(doc.root.b._zato_cache)
+        self.assertEquals(doc.to_xml(), expected)
+
+        # A copy modified after the element's map was replaced is not used by the element
+        copy = doc.root.ns_map
+        doc.root.ns_map += {'y':'example.com/y'}
+        copy['z'] = 'example.com/z'
+        self.assertNotIn('z', doc.root._zato_ns_map)
+
+        # Modifying a map in use drops output cached by elements sharing it
+        def change(doc):
+            ns_map = doc.root.ns_map
+            ns_map['q'] = 'example.com/q'
+            doc.root.d.e = 'e'
+            doc.to_xml()
+            ns_map['q'] = 'example.com/q2'
+
+        change(doc)
+        self.assertIsNone(doc.root.d._zato_cache)
+
+        expected = fill(xml())
+        change(expected)
+        self.assertEquals(doc.to_xml(), expected.to_xml())
+
+# ################################################################################################################################
+
+    def test_ns_info_map(self):
+        doc = xml()
+        doc.ns_map += {'x':'example.com/x'}
+        doc.x_a.ns_map += {'y':'example.com/y'}
+
+        ns_map = doc.x_a._zato_ns_map
+        self.assertIs(doc.x_a.ns.map, ns_map)
+        self.assertDictEqual(ns_map, {'x':'example.com/x', 'y':'example.com/y'})
+
+# ################################################################################################################################
+
+class DefaultNS(TestCase):
+    """ Tests how default namespaces are inherited from ancestors.
+    """
+    def test_inherited_deep(self):
+        doc = xml()
+        doc.ns_map += {'x':'example.com/x'}
+        doc.root.ns = 'example.com'
+
+        elem = doc.root.x_a
+        for idx in range(1000):
+            elem = getattr(elem, 'b{}'.format(idx))
+
+        self.assertEquals(elem.ns.value, 'example.com')
+        self.assertEquals(doc.root.x_a.ns.value, 'example.com/x')
+        self.assertFalse(doc.root.x_a.ns.is_default)
+
+# ################################################################################################################################
+
+    def test_set_on_ancestor_with_children(self):
+        doc = xml()
+        doc.ns_map += {'x':'example.com/x'}
+        doc.root.x_a.b = 'b'
+        doc.root.c = 'c'
+
+        doc.root.ns = 'example.com'
+        doc.root.x_a.d = 'd'
+        doc.root.x_a.b.e = 'e'
+        doc.root.f = 'f'
+
+        self.assertFalse(doc.root.x_a.b.ns)
+        self.assertFalse(doc.root.c.ns)
+        self.assertEquals(doc.root.x_a.d.ns.value, 'example.com')
+        self.assertEquals(doc.root.x_a.b.e.ns.value, 'example.com')
+        self.assertEquals(doc.root.f.ns.value, 'example.com')
+
+# ################################################################################################################################
+
+    def test_cache_dropped_per_subtree(self):
+        doc1 = xml()
+        doc1.ns_map += {'x':'example.com/x'}
+        doc1.root.a.b = 'b'
+        doc1.root.c.ns = 'example.com/c'
+        doc1.root.c.x_d.e = 'e'
+
+        doc2 = xml()
+        doc2.root.a.b = 'b'
+
+        # Only the subtree of the element given a default namespace is affected, other documents are not
+        doc1.root.a.ns = 'example.com/a'
+        doc1.root.ns = 'example.com'
+
+        self.assertIsNone(doc2.root.a._zato_default_ns)
+        self.assertIs(doc1.root.c.x_d._zato_default_ns, doc1.root.c.ns)
+        self.assertIs(doc1.root.a.b._get_default_ns(), doc1.root.a.ns)
+        self.assertEquals(doc1.root.a.f.ns.value, 'example.com/a')
+        self.assertEquals(doc1.root.g.ns.value, 'example.com')
+
+# ################################################################################################################################
+
+    def test_change_on_ancestor(self):
+        doc = xml()
+        doc.ns_map += {'x':'example.com/x'}
+        doc.root.ns = 'example.com/1'
+        doc.root.x_a.b = 'b'
+
+        doc.root.ns = 'example.com/2'
+        doc.root.x_a.c = 'c'
+
+        self.assertEquals(doc.root.x_a.b.ns.value, 'example.com/1')
+        self.assertEquals(doc.root.x_a.c.ns.value, 'example.com/2')
+
+# ################################################################################################################################
+
+    def test_top_level_not_inherited(self):
+        doc = xml()
+        doc.ns_map += {'x':'example.com/x'}
+        doc.ns = 'example.com'
+        doc.a.b = 'b'
+        doc.x_c.d = 'd'
+
+        self.assertEquals(doc.a.ns.value, 'example.com')
+        self.assertEquals(doc.a.b.ns.value, 'example.com')
+        self.assertFalse(doc.x_c.d.ns)
+
+# ################################################################################################################################
+
+class ResolveName(TestCase):
+    """ Tests how names of elements and attributes are split into prefixes and local names.
+    """
+    def test_resolve_name(self):
+        ns_map = NSMap({'x':'example.com/x'})
+
+        self.assertEquals(resolve_name('x_a', ns_map), ('x', 'example.com/x', 'a', 'x:a', '{example.com/x}a'))
+        self.assertEquals(resolve_name('y_a', ns_map), (None, None, 'y_a', 'y_a', 'y_a'))
+        self.assertEquals(resolve_name('_x_a', ns_map), (None, None, '_x_a', '_x_a', '_x_a'))
+        self.assertEquals(resolve_name('xa', {'x':'example.com/x'}), (None, None, 'xa', 'xa', 'xa'))
+
+        self.assertIs(resolve_name('x_a', ns_map), resolve_name('x_a', ns_map))
+
+# ################################################################################################################################
+
+    def test_cache_invalidated(self):
+        ns_map = NSMap()
+        self.assertEquals(resolve_name('x_a', ns_map)[0], None)
+
+        ns_map['x'] = 'example.com/x'
+        self.assertEquals(resolve_name('x_a', ns_map)[0], 'x')
+
+        ns_map.update({'x':'example.com/x2'})
+        self.assertEquals(resolve_name('x_a', ns_map)[1], 'example.com/x2')
+
+        ns_map += {'y':'example.com/y'}
+        self.assertEquals(resolve_name('y_a', ns_map)[0], 'y')
+
+        if hasattr(dict, '__ior__'):
+            ns_map |= {'z':'example.com/z'}
+            self.assertEquals(resolve_name('z_a', ns_map)[0], 'z')
+            self.assertIsInstance(ns_map, NSMap)
+
+        self.assertFalse(hasattr(NSMap, '_invalidates_cache'))
+
+# ################################################################################################################################
+
+    def test_cache_bounded(self):
+        ns_map = NSMap()
+        for idx in range(name_cache_max_size + 1):
+            resolve_name('a{}'.format(idx), ns_map)
+
+        self.assertLessEqual(len(ns_map.name_cache), name_cache_max_size)
+
+# ################################################################################################################################
+
+    def test_elem_ns_map_changes(self):
+        doc = xml()
+        doc.a.x_b = 'b'
+        doc.ns_map += {'x':'example.com/x'}
+        doc.x_c._x_d = 'd'
+        doc.ns_map = {'x':'example.com/x2'}
+        doc.x_e._x_f = 'f'
+
+        self.assertEquals(doc.a.x_b._clark_zato_name, 'x_b')
+        self.assertEquals(doc.x_c._clark_zato_name, '{example.com/x}c')
+        self.assertEquals(doc.x_c._x_d.clark_name, '{example.com/x}d')
+        self.assertEquals(doc.x_e._clark_zato_name, '{example.com/x2}e')
+        self.assertEquals(doc.x_e._x_f.clark_name, '{example.com/x2}f')
+
+# ################################################################################################################################
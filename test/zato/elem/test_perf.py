@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import TestCase
+
+# ujson
+from ujson import dumps, loads
+
+# Zato
+from .perf import compare, get_benchmarks, get_stats, main, run
+
+# ################################################################################################################################
+
+class Perf(TestCase):
+    """ Tests the benchmark suite itself, with input data and loops small enough for tests.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stats(self):
+        stats = get_stats(10, [0.4, 0.1, 0.2, 0.3], 100)
+
+        self.assertEquals(stats['number'], 10)
+        self.assertEquals(stats['repeat'], 4)
+        self.assertEquals(stats['min'], 0.1)
+        self.assertEquals(stats['max'], 0.4)
+        self.assertAlmostEqual(stats['mean'], 0.25)
+        self.assertAlmostEqual(stats['median'], 0.25)
+        self.assertAlmostEqual(stats['stdev'], 0.1290994)
+        self.assertAlmostEqual(stats['items_per_second'], 400)
+
+        stats = get_stats(1, [0.3, 0.1, 0.2], 1)
+        self.assertEquals(stats['median'], 0.2)
+
+# ################################################################################################################################
+
+    def test_compare(self):
+        results = {'benchmarks': {
+            'a': {'median': 1.2, 'items': 10},
+            'b': {'median': 1.05, 'items': 10},
+            'c': {'median': 2.4, 'items': 20},
+            'd': {'median': 5.0, 'items': 10},
+        }}
+
+        baseline = {'benchmarks': {
+            'a': {'median': 1.0, 'items': 10},
+            'b': {'median': 1.0, 'items': 10},
+            'c': {'median': 1.0, 'items': 10},
+        }}
+
+        # Times per item are compared and benchmarks missing from baseline are not
+        regressions = compare(results, baseline, 0.1)
+        self.assertEquals([name for name, change in regressions], ['a', 'c'])
+        self.assertAlmostEqual(regressions[0][1], 0.2)
+        self.assertAlmostEqual(regressions[1][1], 0.2)
+
+        self.assertEquals(compare(results, baseline, 0.25), [])
+
+# ################################################################################################################################
+
+    def test_run(self):
+        benchmarks = [elem for elem in get_benchmarks(0.01) if elem.name in ('build.wide', 'to_json.ns', 'iter_records.orders')]
+        self.assertEquals(len(benchmarks), 3)
+
+        out = StringIO()
+        results = run(benchmarks, repeat=2, warmup=1, min_time=0.001, out=out)
+
+        self.assertEquals(sorted(results['benchmarks']), ['build.wide', 'iter_records.orders', 'to_json.ns'])
+        self.assertEquals(results['benchmarks']['build.wide']['n'], 20)
+        self.assertEquals(results['benchmarks']['build.wide']['repeat'], 2)
+        self.assertEquals(len(out.getvalue().splitlines()), 4)
+
+# ################################################################################################################################
+
+    def test_main(self):
+        path = os.path.join(self.tmp_dir, 'results.json')
+        baseline_path = os.path.join(self.tmp_dir, 'baseline.json')
+        argv = ['to_dict.list', '--scale', '0.01', '--repeat', '2', '--min-time', '0.001']
+
+        self.assertEquals(main(argv + ['--json', path]), 0)
+
+        with open(path) as f:
+            results = loads(f.read())
+
+        self.assertEquals(list(results['benchmarks']), ['to_dict.list'])
+        self.assertEquals(results['meta']['scale'], 0.01)
+
+        # A baseline much faster than any run can be
+        results['benchmarks']['to_dict.list']['median'] = 1e-12
+        with open(baseline_path, 'w') as f:
+            f.write(dumps(results))
+
+        self.assertEquals(main(argv + ['--compare', baseline_path]), 1)
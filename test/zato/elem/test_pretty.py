@@ -11,6 +11,8 @@ https://zato.io
 """
 
 # stdlib
+import sys
+from io import StringIO
 from unittest import TestCase
 
 # Zato
@@ -190,4 +192,84 @@ b:a zzz
 
         self.assertEquals(expected, self.doc.pretty(level=4))
 
+# ################################################################################################################################
+
+    def test_pretty_stream(self):
+
+        out = StringIO()
+        self.assertIsNone(self.doc.pretty(stream=out))
+        self.assertEquals(out.getvalue(), self.doc.pretty().decode('utf-8'))
+
+        out = StringIO()
+        self.doc.b_a.b.a_c.d.pretty(indent=4, stream=out)
+        self.assertEquals(out.getvalue(), self.doc.b_a.b.a_c.d.pretty(indent=4).decode('utf-8'))
+
+# ################################################################################################################################
+
+    def test_pretty_max_elems(self):
+
+        expected = b"""
+b:a zzz
+  b
+    a:c
+      #a zxc
+      #b qwe
+      d
+        ..."""
+
+        self.assertEquals(expected, self.doc.pretty(max_elems=4))
+
+# ################################################################################################################################
+
+    def test_pretty_max_depth(self):
+
+        expected = b"""
+b:a zzz
+  b
+    a:c
+      #a zxc
+      #b qwe
+      ... (+1)"""
+
+        self.assertEquals(expected, self.doc.pretty(max_depth=3))
+
+        expected = b"""a:e zzz
+  f 123
+    ... (+3)"""
+
+        self.assertEquals(expected, self.doc.b_a.b.a_c.d.a_e.pretty(max_depth=2))
+
+# ################################################################################################################################
+
+    def test_pretty_max_list_items(self):
+
+        expected = b"""
+b:a zzz
+  b
+    a:c
+      #a zxc
+      #b qwe
+      d
+        a:e zzz
+          f 123
+            g[0] 000
+            g[...] (+2)"""
+
+        self.assertEquals(expected, self.doc.pretty(max_list_items=1))
+
+# ################################################################################################################################
+
+    def test_pretty_deep(self):
+
+        doc = Elem()
+        depth = sys.getrecursionlimit() + 100
+
+        elem = doc.a
+        for idx in range(depth):
+            elem = elem.a
+
+        out = StringIO()
+        doc.pretty(indent=1, stream=out)
+        self.assertEquals(out.getvalue(), '\n' + '\n'.join(' ' * idx + 'a' for idx in range(depth + 1)))
+
 # ################################################################################################################################
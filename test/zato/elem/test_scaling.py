@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import math
+import os
+import time
+from unittest import skipUnless, TestCase
+
+# Zato
+from zato.elem import xml
+from .perf import deep, list_heavy, measure, wide
+
+# CPU time of the process, which is not affected by other processes running at the same time. Python 2 has no process_time.
+process_time = getattr(time, 'process_time', None) or time.clock
+
+# Timing tests may fail on busy machines, so they are run only if asked to
+run_timing = os.environ.get('ZATO_ELEM_SCALING') == '1'
+skip_timing = 'Timing tests are run only if ZATO_ELEM_SCALING=1'
+
+# ################################################################################################################################
+
+def many_ns(n):
+    """ Builds a document declaring n namespaces, each used by one child of the root and by that child's attribute.
+    """
+    doc = xml()
+    doc.ns_map += dict(('ns{}'.format(idx), 'http://ns{}.example.com'.format(idx)) for idx in range(n))
+    root = doc.root
+
+    for idx in range(n):
+        elem = getattr(root, 'ns{}_elem'.format(idx))
+        elem._zato_value = str(idx)
+        setattr(elem, '_ns{}_attr'.format(idx), str(idx))
+
+    return doc
+
+def lookup(doc):
+    """ Looks up each element of a document again, by its name or its index in a list.
+    """
+    stack = [doc]
+
+    while stack:
+        elem = stack.pop()
+        for child in elem._zato_children:
+            name = child._zato_elem_name
+            if elem.has_list_child(child):
+                getattr(elem, name)[child._zato_list_idx]
+            else:
+                elem.get_child(name)
+            stack.append(child)
+
+def get_exponent(sizes, times):
+    """ Returns the slope of a least-squares line through log(size), log(time) points, i.e. k in time ~ size ** k.
+    """
+    xs = [math.log(elem) for elem in sizes]
+    ys = [math.log(elem) for elem in times]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sum((x - x_mean) ** 2 for x in xs)
+
+
+# ################################################################################################################################
+
+# Functions building documents of a given size along each dimension, and the smallest size to build
+dimensions = {
+    'width': (wide, 500),
+    'depth': (deep, 50),
+    'list_len': (list_heavy, 500),
+    'ns_count': (many_ns, 100),
+}
+
+# Operations run on documents built beforehand
+operations = (
+    ('lookup', lookup),
+    ('to_xml', lambda doc: doc.to_xml()),
+    ('to_xml_direct', lambda doc: doc.to_xml(backend='direct')),
+    ('to_dict', lambda doc: doc.to_dict()),
+    ('to_json', lambda doc: doc.to_json()),
+    ('pretty', lambda doc: doc.pretty()),
+)
+
+# ################################################################################################################################
+
+class Scaling(TestCase):
+    """ Tests that time of building documents and of operations on them grows no faster than allowed as documents grow
+    along each dimension. Growth exponents are fitted to times measured for sizes from multipliers of the smallest ones.
+    """
+    multipliers = (1, 2, 4, 8)
+
+    # Each time is the minimum of that many loops, each lasting at least min_time seconds of CPU time
+    repeat = 3
+    min_time = 0.002
+
+    # 1.0 means linear growth and 2.0 means quadratic
+    max_exponent = float(os.environ.get('ZATO_ELEM_MAX_EXPONENT', 1.3))
+
+    # Exponents allowed for operations that grow faster for reasons outside of this library, by dimension and operation.
+    # lxml's cleanup_namespaces is quadratic in the number of namespaces an element declares. to_xml with the direct backend
+    # falls back to lxml for documents with namespaces, so it is affected too, unlike to_xml_stream or cached output.
+    max_exponent_by_op = {
+        ('ns_count', 'to_xml'): 1.8,
+        ('ns_count', 'to_xml_direct'): 1.8,
+    }
+
+    # Timing is noisy, so operations that grow too fast are measured again this many times before a test fails
+    retries = 2
+
+    def _get_funcs(self, dimension):
+        """ Returns sizes of documents along a dimension and, by name, functions to time for each size.
+        """
+        builder, base = dimensions[dimension]
+        sizes = [base * elem for elem in self.multipliers]
+        docs = [builder(size) for size in sizes]
+
+        funcs = {'build': [lambda size=size: builder(size) for size in sizes]}
+        for name, func in operations:
+            funcs[name] = [lambda doc=doc, func=func: func(doc) for doc in docs]
+
+        return sizes, funcs
+
+    def _get_exponent(self, sizes, funcs):
+        return get_exponent(sizes, [min(measure(func, self.repeat, 0, self.min_time, process_time)[1]) for func in funcs])
+
+    def _assert_scaling(self, dimension):
+        sizes, funcs = self._get_funcs(dimension)
+        failed = []
+
+        for name, op_funcs in sorted(funcs.items()):
+            max_exponent = self.max_exponent_by_op.get((dimension, name), self.max_exponent)
+
+            for x in range(self.retries + 1):
+                exponent = self._get_exponent(sizes, op_funcs)
+                if exponent <= max_exponent:
+                    break
+            else:
+                failed.append('{} {:.2f} > {:.2f}'.format(name, exponent, max_exponent))
+
+        if failed:
+            self.fail('Growth exponents by {} {} exceeded: {}'.format(dimension, sizes, ', '.join(failed)))
+
+# ################################################################################################################################
+
+    @skipUnless(run_timing, skip_timing)
+    def test_width(self):
+        self._assert_scaling('width')
+
+    @skipUnless(run_timing, skip_timing)
+    def test_depth(self):
+        self._assert_scaling('depth')
+
+    @skipUnless(run_timing, skip_timing)
+    def test_list_len(self):
+        self._assert_scaling('list_len')
+
+    @skipUnless(run_timing, skip_timing)
+    def test_ns_count(self):
+        self._assert_scaling('ns_count')
+
+# ################################################################################################################################
+
+    def test_get_exponent(self):
+        sizes = [100, 200, 400, 800]
+
+        self.assertAlmostEqual(get_exponent(sizes, [size * 0.001 for size in sizes]), 1.0)
+        self.assertAlmostEqual(get_exponent(sizes, [size ** 2 * 0.001 for size in sizes]), 2.0)
+        self.assertAlmostEqual(get_exponent(sizes, [5.0 for size in sizes]), 0.0)
+
+# ################################################################################################################################
+
+    @skipUnless(run_timing, skip_timing)
+    def test_quadratic_detected(self):
+
+        def quadratic(doc):
+            children = doc.root._zato_children
+            for elem in children:
+                for other in children:
+                    doc.root.get_child(other._zato_elem_name)
+
+        sizes = [50 * elem for elem in self.multipliers]
+        funcs = [lambda doc=wide(size): quadratic(doc) for size in sizes]
+
+        self.assertGreater(self._get_exponent(sizes, funcs), self.max_exponent)
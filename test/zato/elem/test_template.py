@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.elem import compare_xml, default_ns, Elem, json, placeholder, Template, xml
+
+# ################################################################################################################################
+
+def get_soap_template():
+    doc = xml()
+    doc.ns_map += {'rem':'http://remoting.example.com/'}, default_ns.s12, default_ns.wsa
+
+    header = doc.s12_Envelope.s12_Header
+    header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+    header.wsa_Action._s12_mustUnderstand = '1'
+    header.wsa_MessageID = placeholder('msg_id')
+
+    arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+    arg0.user = placeholder('user')
+    arg0.pwd = placeholder('pwd', 'default-pwd')
+    arg0.rem_access[0] = placeholder('access')
+    arg0.rem_access[0]._rem_type = placeholder('type')
+
+    return doc.to_template()
+
+# ################################################################################################################################
+
+class TemplateTestCase(TestCase):
+    """ Tests how documents are created out of templates.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def test_to_xml(self):
+        expected = """
+        <s12:Envelope xmlns:rem="http://remoting.example.com/" xmlns:s12="http://www.w3.org/2003/05/soap-envelope"
+            xmlns:wsa="http://www.w3.org/2005/08/addressing">
+          <s12:Header>
+            <wsa:Action s12:mustUnderstand="1">urn:hl7-org:v3:MCCI_IN000002UV01</wsa:Action>
+            <wsa:MessageID>uuid:123</wsa:MessageID>
+          </s12:Header>
+          <s12:Body>
+            <rem:usrOrgRoleLogin>
+              <arg0>
+                <user>my-user</user>
+                <pwd>default-pwd</pwd>
+                <rem:access rem:type="0">no</rem:access>
+                <rem:access rem:type="1">yes</rem:access>
+                <rem:access rem:type="2">maybe</rem:access>
+              </arg0>
+            </rem:usrOrgRoleLogin>
+          </s12:Body>
+        </s12:Envelope>
+        """
+
+        doc = get_soap_template().new(msg_id='uuid:123', user='my-user', rem_access=[
+            {'access':'no', 'type':'0'},
+            {'access':'yes', 'type':'1'},
+            {'access':'maybe', 'type':'2'},
+        ])
+
+        compare_xml(expected, doc.to_xml())
+
+# ################################################################################################################################
+
+    def test_new_documents_independent(self):
+        template = get_soap_template()
+
+        doc1 = template.new({'msg_id':'1', 'user':'user1', 'rem_access':[{'access':'a1', 'type':'t1'}]})
+        doc2 = template.new({'msg_id':'2', 'user':'user2', 'pwd':'pwd2', 'rem_access':[]})
+
+        doc1.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[1] = 'a2'
+        doc1.s12_Envelope.s12_Header.wsa_Action.ns = 'example.com'
+
+        arg01 = doc1.to_dict()['Envelope']['Body']['usrOrgRoleLogin']['arg0']
+        arg02 = doc2.to_dict()['Envelope']['Body']['usrOrgRoleLogin']['arg0']
+
+        self.assertDictEqual(arg01, {
+            'user':'user1', 'pwd':'default-pwd', 'access': [{'text':'a1', '#type':'t1'}, 'a2']})
+        self.assertDictEqual(arg02, {'user':'user2', 'pwd':'pwd2'})
+
+        self.assertEquals(doc2.s12_Envelope.s12_Header.wsa_Action.ns.value, 'http://www.w3.org/2005/08/addressing')
+        self.assertEquals(doc1.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[1].path,
+            '/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[1]')
+
+# ################################################################################################################################
+
+    def test_list_of_values(self):
+        doc = Elem()
+        doc.a.b = placeholder('b')
+        doc.a.c[0] = 'c0'
+        doc.a.c[1] = 'c1'
+
+        template = Template(doc)
+
+        self.assertDictEqual(template.new(b=1).to_dict(), {'a': {'b': 1, 'c': ['c0', 'c1']}})
+        self.assertDictEqual(template.new(b=2, c=[3, 4, 5]).to_dict(), {'a': {'b': 2, 'c': [3, 4, 5]}})
+
+# ################################################################################################################################
+
+    def test_interleaved_list(self):
+        doc = xml()
+        doc.a.b[0] = 'b0'
+        doc.a.c = placeholder('c')
+        doc.a.b[1] = placeholder('b1')
+        doc.a.d[0] = 'd0'
+        doc.a.d[1] = 'd1'
+
+        template = doc.to_template()
+        new = template.new(c='c', b1='b1')
+
+        # Elements are in the same positions as in the template
+        self.assertEquals(new.to_xml(), b'<a><b>b0</b><c>c</c><b>b1</b><d>d0</d><d>d1</d></a>')
+        self.assertEquals(new.a.b[1]._zato_value, 'b1')
+        self.assertEquals(new.a.b[1].path, '/a/b[1]')
+        self.assertEquals(len(new.a._zato_list_children['b']), 2)
+
+        # Lists that are not interleaved may still be given on input
+        self.assertEquals(template.new(c='c', b1='b1', d=['x']).to_xml(), b'<a><b>b0</b><c>c</c><b>b1</b><d>x</d></a>')
+
+        try:
+            template.new(c='c', b1='b1', b=['x', 'y'])
+        except ValueError as e:
+            self.assertEquals(e.args[0], 'Elements of list `b` are interleaved with other ones, it cannot be given on input')
+        else:
+            self.fail('Expected ValueError not raised')
+
+# ################################################################################################################################
+
+    def test_nested_lists(self):
+        doc = json()
+        doc.a[0].name = placeholder('name')
+        doc.a[0].b[0] = placeholder('b')
+
+        template = doc.to_template()
+        new = template.new(a=[{'name':'a0', 'b':[{'b':1}, {'b':2}]}, {'name':'a1', 'b':[3]}])
+
+        self.assertIsInstance(new, json)
+        self.assertDictEqual(new.to_dict(), {'a': [{'name':'a0', 'b':[1, 2]}, {'name':'a1', 'b':[3]}]})
+        self.assertEquals(new.to_json(), '{"a":[{"name":"a0","b":[1,2]},{"name":"a1","b":[3]}]}')
+
+# ################################################################################################################################
+
+    def test_template_frozen(self):
+        doc = Elem()
+        doc.a = placeholder('a')
+        template = doc.to_template()
+
+        doc.b = 'b'
+        doc.a = 'a'
+
+        self.assertDictEqual(template.new(a=1).to_dict(), {'a': 1})
+
+# ################################################################################################################################
+
+    def test_missing_value(self):
+        doc = Elem()
+        doc.a = placeholder('zzz')
+
+        try:
+            doc.to_template().new()
+        except ValueError as e:
+            self.assertEquals(e.args[0], 'No value for placeholder `zzz`')
+        else:
+            self.fail('Expected ValueError not raised')
+
+# ################################################################################################################################
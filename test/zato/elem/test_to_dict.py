@@ -11,6 +11,7 @@ https://zato.io
 """
 
 # stdlib
+import sys
 from unittest import TestCase
 from uuid import uuid4
 
@@ -1653,3 +1654,42 @@ class SubElements(ToDict):
         out = doc1.to_dict()
 
         self.assertDictEqual(expected, out)
+
+# ################################################################################################################################
+
+class Deep(ToDict):
+    """ Tests to_dict serialization of documents deeper than the recursion limit.
+    """
+    def test_deep(self):
+        doc = Elem()
+        depth = sys.getrecursionlimit() + 100
+
+        elem = doc.a
+        for idx in range(depth):
+            elem = elem.b
+        elem.c = 'ccc'
+
+        out = doc.to_dict()['a']
+        for idx in range(depth):
+            out = out['b']
+
+        self.assertDictEqual(out, {'c': 'ccc'})
+
+    def test_deep_list(self):
+        doc = Elem()
+        depth = sys.getrecursionlimit() + 100
+
+        elem = doc.a
+        for idx in range(depth):
+            elem.c[0] = idx
+            elem = elem.c[1]
+        elem.d = 'ddd'
+
+        out = doc.to_dict()['a']
+        for idx in range(depth):
+            self.assertEquals(out['c'][0], idx)
+            out = out['c'][1]
+
+        self.assertDictEqual(out, {'d': 'ddd'})
+
+# ################################################################################################################################
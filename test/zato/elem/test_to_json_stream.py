@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import os
+import sys
+import tempfile
+from io import BytesIO
+from json import loads
+from unittest import TestCase
+
+# ujson
+from ujson import dumps
+
+# Zato
+from zato.elem import Elem, default_ns, xml
+
+# ################################################################################################################################
+
+class _ChunkedFile(object):
+    """ Records each chunk written to it.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+# ################################################################################################################################
+
+class ToJSONStream(TestCase):
+    """ Tests how to_json_stream and iter_json methods work.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def _to_json_stream(self, doc, **kwargs):
+        out = BytesIO()
+        doc.to_json_stream(out, **kwargs)
+        return out.getvalue()
+
+    def _assert_same(self, doc, text_key='text', attr_prefix='#', include_ns=False):
+        expected = dumps(doc.to_dict(text_key, attr_prefix, include_ns)).encode('utf8')
+        self.assertEquals(self._to_json_stream(doc, text_key=text_key, attr_prefix=attr_prefix, include_ns=include_ns), expected)
+        self.assertEquals(b''.join(doc.iter_json(text_key, attr_prefix, include_ns)), expected)
+
+    def _get_soap_doc(self):
+        doc = xml()
+        doc.ns_map += default_ns.s12, default_ns.wsa, {'rem':'http://remoting.example.com'}
+
+        header = doc.s12_Envelope.s12_Header
+        header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+        header.wsa_Action._s12_mustUnderstand = '1'
+        header.wsa_MessageID = 'uuid:123'
+
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+        arg0.user = 'zażółć "gęślą" / jaźń'
+        arg0._rem_keep_alive = 'true'
+        arg0.rem_access[0] = 'no'
+        arg0.rem_access[0]._rem_type = '0'
+        arg0.rem_access[1]._rem_type = '1'
+        arg0.rem_access[1].access = '111'
+        arg0.rem_access[2] = 123
+        arg0.empty
+
+        return doc
+
+# ################################################################################################################################
+
+    def test_to_json_stream_defaults(self):
+        doc = Elem()
+        doc.a.b = 'bbb'
+        doc.a.c[0] = 1
+        doc.a.c[1].d = None
+        doc.a._e = 'eee'
+
+        self.assertEquals(self._to_json_stream(doc), b'{"a":{"#e":"eee","b":"bbb","c":[1,{"d":null}]}}')
+        self.assertEquals(self._to_json_stream(doc), doc.to_json().encode('utf8'))
+
+# ################################################################################################################################
+
+    def test_to_json_stream_ns(self):
+        doc = self._get_soap_doc()
+        self._assert_same(doc)
+        self._assert_same(doc, include_ns=True)
+        self._assert_same(doc, text_key='_text', attr_prefix='@')
+
+# ################################################################################################################################
+
+    def test_to_json_stream_incl_empty_text(self):
+        doc = xml(incl_empty_text=True)
+        doc.root.a = ''
+        doc.root.a._b = 'bbb'
+        doc.root.c._d = 'ddd'
+
+        self._assert_same(doc)
+        self._assert_same(doc.root.a)
+        self.assertEquals(self._to_json_stream(doc.root.a), b'{"a":{"text":"","#b":"bbb"}}')
+
+# ################################################################################################################################
+
+    def test_to_json_stream_serialize_non_root(self):
+        doc = self._get_soap_doc()
+        self._assert_same(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0)
+        self._assert_same(doc.s12_Envelope.s12_Header.wsa_Action, include_ns=True)
+
+# ################################################################################################################################
+
+    def test_to_json_stream_repeated_keys(self):
+        doc = xml()
+        doc.ns_map += {'x':'http://x.example.com', 'y':'http://y.example.com'}
+        doc.root.x_a = 'xxx'
+        doc.root.y_a = 'yyy'
+        doc.root.b = 'bbb'
+
+        # Without namespaces, latter elements overwrite former ones, as in dicts
+        self.assertEquals(self._to_json_stream(doc), b'{"root":{"a":"yyy","b":"bbb"}}')
+        self._assert_same(doc)
+        self._assert_same(doc, include_ns=True)
+
+        # Lists cannot be merged though
+        doc.root.c.x_d[0] = '1'
+        doc.root.c.y_d[0] = '2'
+
+        try:
+            self._to_json_stream(doc)
+        except ValueError as e:
+            self.assertTrue(e.args[0].startswith('Unexpected input (append)'))
+        else:
+            self.fail('Lists of the same name yet no ValueError raised')
+
+# ################################################################################################################################
+
+    def test_to_json_stream_file_name(self):
+        doc = self._get_soap_doc()
+        path = os.path.join(tempfile.mkdtemp(), 'doc.json')
+
+        try:
+            doc.to_json_stream(path)
+            with open(path, 'rb') as f:
+                self.assertEquals(f.read(), doc.to_json().encode('utf8'))
+        finally:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+
+# ################################################################################################################################
+
+    def test_to_json_stream_chunks(self):
+        doc = Elem()
+        for idx in range(5000):
+            doc.root.item[idx].value = idx
+
+        out = _ChunkedFile()
+        doc.to_json_stream(out, buffer_size=1024)
+
+        self.assertTrue(len(out.chunks) > 10)
+        self.assertTrue(all(len(chunk) >= 1024 for chunk in out.chunks[:-1]))
+        self.assertEquals(b''.join(out.chunks), doc.to_json().encode('utf8'))
+
+# ################################################################################################################################
+
+    def test_iter_json_http_chunked(self):
+        doc = Elem()
+        for idx in range(1000):
+            doc.root.item[idx] = 'zażółć {}'.format(idx)
+
+        chunks = list(doc.iter_json(chunk_size=1024, http_chunked=True))
+        self.assertTrue(len(chunks) > 3)
+        self.assertEquals(chunks[-1], b'0\r\n\r\n')
+
+        body = []
+        for chunk in chunks[:-1]:
+            size, data = chunk.split(b'\r\n', 1)
+            self.assertEquals(int(size, 16), len(data) - 2)
+            self.assertTrue(data.endswith(b'\r\n'))
+            body.append(data[:-2])
+
+        self.assertEquals(loads(b''.join(body).decode('utf8')), doc.to_dict())
+
+# ################################################################################################################################
+
+    def test_to_json_stream_deep(self):
+        doc = Elem()
+        depth = sys.getrecursionlimit() + 100
+
+        elem = doc.root
+        for idx in range(depth):
+            elem = elem.a
+        elem.b = 'bbb'
+
+        expected = b'{"root":' + b'{"a":' * depth + b'{"b":"bbb"}' + b'}' * depth + b'}'
+        self.assertEquals(self._to_json_stream(doc), expected)
+
+# ################################################################################################################################
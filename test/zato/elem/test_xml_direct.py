@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from io import BytesIO
+from random import Random
+from unittest import TestCase
+
+# lxml
+from lxml.etree import _Element
+
+# six
+from six import text_type
+
+# Zato
+from zato.elem import compare_xml, default_ns, xml, xml_backend
+from zato.elem._xml_writer import HasNamespaces, to_xml_string
+
+# ################################################################################################################################
+
+class direct_xml(xml):
+    __slots__ = ()
+    _zato_xml_backend = xml_backend.direct
+
+class cached_xml(xml):
+    __slots__ = ()
+    _zato_cache_output = True
+
+
+# ################################################################################################################################
+
+# Building blocks of generated documents
+_names = ('a', 'b', 'item', 'my_elem', 'x-y', 'résumé')
+_attr_names = ('_id', '_type', '_my_attr', '_x-y')
+_values = ('', 'abc', '  spaces  ', 'a & b', '<tag/>', ']]>', '"quoted"', "it's", 'tab\there', 'line\nbreak', 'cr\rhere',
+    'zażółć', '€', '\U0001f600', b'bytes')
+_kwargs = ({}, {'cleanup_ns':False}, {'encoding':'utf-8'}, {'encoding':'unicode'}, {'encoding':'ascii', 'xml_declaration':False},
+    {'encoding':'iso-8859-2', 'xml_declaration':True}, {'encoding':'utf-16'})
+
+def get_corpus(count, seed, ns=False):
+    """ Returns count documents of random shapes, names, values and attributes, the same ones for the same seed.
+    Elements and attributes are in namespaces only if ns is True.
+    """
+    rand = Random(seed)
+    out = []
+
+    for x in range(count):
+        doc = xml()
+        if rand.random() < 0.3:
+            doc.ns_map += {'p':'urn:p', 'q':'urn:q'}
+
+        names = _names + ('p_a', 'q_b') if ns else _names
+        attr_names = _attr_names + ('_p_attr',) if ns else _attr_names
+        elems = [getattr(doc, rand.choice(names))]
+
+        for y in range(rand.randint(0, 40)):
+            parent = rand.choice(elems)
+            name = rand.choice(names)
+            elem = getattr(parent, name)
+
+            # Lists of elements
+            if rand.random() < 0.3:
+                elem = elem[len(parent._zato_list_children.get(name, ()))]
+
+            if rand.random() < 0.7:
+                elem._zato_value = rand.choice(_values + (None,))
+
+            # Values that cannot be serialized
+            elif rand.random() < 0.01:
+                elem._zato_value = 123
+
+            for z in range(rand.choice((0, 0, 1, 3))):
+                setattr(elem, rand.choice(attr_names), rand.choice(_values) if rand.random() > 0.01 else None)
+
+            if ns and rand.random() < 0.05:
+                elem.ns = 'urn:default'
+
+            elems.append(elem)
+
+        out.append(doc)
+
+    return out
+
+
+# ################################################################################################################################
+
+# Namespaces declared by elements of generated documents with namespaces, including prefixes redeclared, namespaces
+# under more than one prefix, a namespace lxml has a prefix of its own for and the xml one
+_ns_maps = ({'p':'urn:p'}, {'q':'urn:q'}, {'p':'urn:p2'}, {'r':'urn:p'}, {'x':'http://www.w3.org/1999/XSL/Transform'},
+    default_ns.xml)
+_ns_names = _names + ('p_a', 'q_b', 'r_c', 'x_d')
+_ns_attr_names = _attr_names + ('_p_attr', '_q_attr', '_r_attr', '_x_attr', '_xml_lang')
+_default_nss = ('urn:default', 'urn:p', 'urn:q')
+
+def get_ns_corpus(count, seed, class_=xml):
+    """ Returns count documents of random shapes whose elements and attributes are in namespaces declared on any level,
+    the same ones for the same seed.
+    """
+    rand = Random(seed)
+    out = []
+
+    for x in range(count):
+        doc = class_()
+        for ns_map in rand.sample(_ns_maps, rand.randint(0, 3)):
+            doc.ns_map += ns_map
+
+        elems = [getattr(doc, rand.choice(_ns_names))]
+
+        for y in range(rand.randint(0, 30)):
+            parent = rand.choice(elems)
+            name = rand.choice(_ns_names)
+            elem = getattr(parent, name)
+
+            if rand.random() < 0.2:
+                elem = elem[len(parent._zato_list_children.get(name, ()))]
+
+            if rand.random() < 0.5:
+                elem._zato_value = rand.choice(_values)
+
+            for z in range(rand.choice((0, 1, 2))):
+                setattr(elem, rand.choice(_ns_attr_names), rand.choice(_values))
+
+            if rand.random() < 0.15:
+                elem.ns_map += rand.choice(_ns_maps)
+
+            if rand.random() < 0.1:
+                elem.ns = rand.choice(_default_nss)
+
+            elems.append(elem)
+
+        out.append(doc)
+
+    return out
+
+# ################################################################################################################################
+
+class DirectBackend(TestCase):
+    """ Tests the direct backend of to_xml.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def _get_doc(self, class_=xml):
+        doc = class_()
+
+        header = doc.Envelope.Header
+        header.Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+        header.Action._mustUnderstand = '1'
+        header.MessageID = 'uuid:123'
+
+        arg0 = doc.Envelope.Body.usrOrgRoleLogin.arg0
+        arg0.user = 'my-user & <co>'
+        arg0._keep_alive = 'true'
+        arg0.access[0] = 'no'
+        arg0.access[0]._type = '0'
+        arg0.access[1] = 'yes'
+        arg0.access[1]._type = '1'
+        arg0.access[1].access = '111'
+
+        other = arg0.other
+        other.a = 'zażółć'
+        other.b
+
+        return doc
+
+    def _get_ns_doc(self, class_=xml):
+        doc = class_()
+        doc.ns_map += default_ns.s12, default_ns.wsa, {'rem':'http://remoting.example.com'}
+
+        header = doc.s12_Envelope.s12_Header
+        header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+        header.wsa_Action._s12_mustUnderstand = '1'
+
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+        arg0.user = 'my-user'
+        arg0.rem_access.rem_type = '0'
+        arg0.other.ns = 'http://other.example.com'
+        arg0.other.a = 'a'
+
+        return doc
+
+    def _serialize(self, func, *args, **kwargs):
+        """ Returns output of func or, if it raises an exception, its class and arguments.
+        """
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            return e.__class__, e.args
+
+# ################################################################################################################################
+
+    def test_direct_corpus(self):
+        for idx, doc in enumerate(get_corpus(300, 1)):
+            root = doc._zato_children[0]
+            for elem in (root, root._zato_children[-1] if root._zato_children else root):
+                for kwargs in _kwargs:
+                    expected = self._serialize(elem.to_xml, backend=xml_backend.lxml, **kwargs)
+                    given = self._serialize(to_xml_string, elem, ns_free=True, **kwargs)
+                    self.assertEquals(expected, given, 'Document {}, {}, {}'.format(idx, elem.path, kwargs))
+
+# ################################################################################################################################
+
+    def test_direct_namespaces(self):
+
+        # Documents with namespaces are serialized by lxml
+        for idx, doc in enumerate(get_corpus(100, 2, True)):
+            for kwargs in _kwargs:
+                expected = self._serialize(doc.to_xml, backend=xml_backend.lxml, **kwargs)
+                given = self._serialize(doc.to_xml, backend=xml_backend.direct, **kwargs)
+                self.assertEquals(expected, given, 'Document {}, {}'.format(idx, kwargs))
+
+        doc = self._get_ns_doc()
+        self.assertRaises(HasNamespaces, to_xml_string, doc.s12_Envelope, ns_free=True)
+        self.assertEquals(doc.to_xml(backend=xml_backend.direct), doc.to_xml(backend=xml_backend.lxml))
+
+        # Unless output is cached, which only the direct backend can do
+        doc = self._get_ns_doc(cached_xml)
+        self.assertEquals(doc.to_xml(), doc.to_xml(backend=xml_backend.lxml))
+        self.assertIsNotNone(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access._zato_cache)
+
+# ################################################################################################################################
+
+    def test_direct_per_class(self):
+        doc = self._get_doc(direct_xml)
+        compare_xml(self._get_doc().to_xml(), doc.to_xml())
+        self.assertEquals(doc.to_xml(), doc.to_xml(backend=xml_backend.lxml))
+        self.assertEquals(doc.to_xml(), to_xml_string(doc.Envelope, ns_free=True))
+
+        # Elements of such documents use the direct backend too
+        self.assertIs(doc.Envelope._zato_xml_backend, xml_backend.direct)
+        self.assertIs(xml._zato_xml_backend, xml_backend.lxml)
+
+# ################################################################################################################################
+
+    def test_direct_unicode(self):
+        doc = self._get_doc()
+        result = doc.to_xml(backend=xml_backend.direct, encoding='unicode')
+
+        self.assertIsInstance(result, text_type)
+        self.assertIn('>zażółć<', result)
+        self.assertEquals(result, doc.to_xml(encoding='unicode'))
+        self.assertEquals(doc.to_xml(backend=xml_backend.direct, encoding=text_type), result)
+
+        try:
+            doc.to_xml(backend=xml_backend.direct, encoding='unicode', xml_declaration=True)
+        except ValueError as e:
+            self.assertEquals(e.args[0], 'Serialisation to unicode must not request an XML declaration')
+        else:
+            self.fail('Declaration in unicode yet no ValueError raised')
+
+# ################################################################################################################################
+
+    def test_direct_lxml_fallback(self):
+        doc = self._get_doc(direct_xml)
+
+        # lxml elements are always created by lxml
+        self.assertIsInstance(doc.to_xml(False), _Element)
+
+        # Same for options that only lxml supports
+        self.assertEquals(doc.to_xml(pretty_print=True), doc.to_xml(backend=xml_backend.lxml, pretty_print=True))
+
+# ################################################################################################################################
+
+    def test_direct_unknown_backend(self):
+        doc = self._get_doc()
+        try:
+            doc.to_xml(backend='abc')
+        except ValueError as e:
+            self.assertEquals(e.args[0], 'Unknown XML backend `abc`')
+        else:
+            self.fail('Unknown backend yet no ValueError raised')
+
+# ################################################################################################################################
+
+    def test_direct_no_root(self):
+        doc = direct_xml()
+        try:
+            doc.to_xml()
+        except ValueError as e:
+            self.assertEquals(e.args[0], 'No root node found')
+        else:
+            self.fail('No root yet no ValueError raised')
+
+# ################################################################################################################################
+
+class WriterNamespaces(TestCase):
+    """ Tests that namespaces are declared by the writer, which to_xml_stream and output caching use, the same way lxml
+    declares them, i.e. that prefixes, declarations and their placement are the same, byte for byte.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def _serialize(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            return e.__class__, e.args
+
+    def _stream(self, doc, **kwargs):
+        out = BytesIO()
+        doc.to_xml_stream(out, **kwargs)
+        return out.getvalue()
+
+    def _assert_same(self, doc, msg):
+        root = doc._zato_children[0]
+
+        for elem in (root, root._zato_children[-1] if root._zato_children else root):
+            for kwargs in _kwargs:
+                info = '{}, {}, {}'.format(msg, elem.path, kwargs)
+                expected = self._serialize(elem.to_xml, backend=xml_backend.lxml, **kwargs)
+                self.assertEquals(expected, self._serialize(to_xml_string, elem, **kwargs), info)
+
+                if kwargs.get('encoding') != 'unicode':
+                    self.assertEquals(expected, self._serialize(self._stream, elem, **kwargs), info)
+
+# ################################################################################################################################
+
+    def test_ns_corpus(self):
+        for idx, doc in enumerate(get_ns_corpus(200, 3)):
+            self._assert_same(doc, 'Document {}'.format(idx))
+
+# ################################################################################################################################
+
+    def test_ns_corpus_cached(self):
+        docs = get_ns_corpus(100, 4)
+        cached_docs = get_ns_corpus(100, 4, cached_xml)
+        rand = Random(5)
+
+        # Changes made to both documents, after which fragments cached so far are reused where they still can be
+        changes = (
+            lambda elem, value, ns_map: setattr(elem, '_zato_value', value),
+            lambda elem, value, ns_map: setattr(elem, rand.choice(_ns_attr_names), value),
+            lambda elem, value, ns_map: setattr(elem, rand.choice(_ns_names), value),
+            lambda elem, value, ns_map: setattr(elem, 'ns_map', ns_map),
+        )
+
+        for idx, (doc, cached_doc) in enumerate(zip(docs, cached_docs)):
+            for x in range(4):
+                self.assertEquals(self._serialize(doc.to_xml), self._serialize(cached_doc.to_xml), 'Document {}'.format(idx))
+
+                path = []
+                elem = doc._zato_children[0]
+                while elem._zato_children and rand.random() < 0.7:
+                    child_idx = rand.randrange(len(elem._zato_children))
+                    path.append(child_idx)
+                    elem = elem._zato_children[child_idx]
+
+                change = rand.choice(changes)
+                value = rand.choice(_values)
+                ns_map = rand.choice(_ns_maps)
+                state = rand.getstate()
+
+                for target in (doc, cached_doc):
+                    elem = target._zato_children[0]
+                    for child_idx in path:
+                        elem = elem._zato_children[child_idx]
+
+                    # Both documents get the same names
+                    rand.setstate(state)
+                    change(elem, value, ns_map)
+
+# ################################################################################################################################
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from io import BytesIO
+from unittest import skipIf, TestCase
+
+# six
+from six import PY3
+
+# lxml
+from lxml.etree import fromstring, iterparse, XMLParser, XMLSyntaxError
+
+# Zato
+from zato.elem import compare_xml, xml
+from zato.elem._xml import _PathMatcher, _RecordReader
+
+# ################################################################################################################################
+
+soap = b"""
+<s12:Envelope xmlns:s12="http://www.w3.org/2003/05/soap-envelope" xmlns:rem="http://remoting.example.com/">
+  <s12:Header>
+    <wsa:Action xmlns:wsa="http://www.w3.org/2005/08/addressing" s12:mustUnderstand="1">urn:hl7-org:v3</wsa:Action>
+  </s12:Header>
+  <s12:Body>
+    <rem:usrOrgRoleLogin>
+      <arg0 rem:is_req="true">
+        <user>my-user</user>
+        <rem:access rem:type="0">no</rem:access>
+        <role>my-role</role>
+        <rem:access rem:type="1">yes</rem:access>
+      </arg0>
+    </rem:usrOrgRoleLogin>
+  </s12:Body>
+</s12:Envelope>
+"""
+
+# ################################################################################################################################
+
+class FromXMLTestCase(TestCase):
+
+    def test_from_string(self):
+        doc = xml.from_string(soap)
+        compare_xml(soap, doc.to_xml())
+
+        self.assertEquals(doc.ns_map, {
+            's12':'http://www.w3.org/2003/05/soap-envelope', 'rem':'http://remoting.example.com/'})
+
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+        self.assertEquals(arg0.user._zato_value, 'my-user')
+        self.assertEquals(arg0._rem_is_req._zato_value, 'true')
+
+        # Repeated siblings become a list
+        self.assertEquals(len(arg0._zato_list_children['rem_access']), 2)
+        self.assertEquals(arg0.rem_access[0]._zato_value, 'no')
+        self.assertEquals(arg0.rem_access[1]._rem_type._zato_value, '1')
+        self.assertEquals(arg0.rem_access[1].path, '/s12:Envelope/s12:Body/rem:usrOrgRoleLogin/arg0/rem:access[1]')
+        self.assertTrue(arg0.has_list_child(arg0.rem_access[0]))
+        self.assertFalse(arg0.has_list_child(arg0.user))
+
+        # Namespaces declared below the root
+        action = doc.s12_Envelope.s12_Header.wsa_Action
+        self.assertEquals(action.ns.value, 'http://www.w3.org/2005/08/addressing')
+        self.assertEquals(action.ns_map['wsa'], 'http://www.w3.org/2005/08/addressing')
+        self.assertNotIn('wsa', doc.ns_map)
+
+    def test_from_file(self):
+        compare_xml(soap, xml.from_file(BytesIO(soap)).to_xml())
+
+    def test_from_lxml(self):
+        root = fromstring(soap)
+        compare_xml(soap, xml.from_lxml(root).to_xml())
+
+        # Namespaces of ancestors are known to elements from the middle of a document
+        body = root[1]
+        doc = xml.from_lxml(body)
+        self.assertEquals(doc.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[1]._rem_type._zato_value, '1')
+
+    def test_default_ns(self):
+        data = b'<a xmlns="urn:a"><b><c xmlns="urn:c">1</c><d xmlns="">2</d></b></a>'
+        doc = xml.from_string(data)
+        compare_xml(data, doc.to_xml())
+
+        self.assertEquals(doc.a.ns.value, 'urn:a')
+        self.assertEquals(doc.a.b.ns.value, 'urn:a')
+        self.assertEquals(doc.a.b.c.ns.value, 'urn:c')
+        self.assertEquals(doc.a.b.d.ns.value, None)
+
+    def test_prefixes_renamed(self):
+        data = b'<my_ns:a xmlns:my_ns="urn:a" xmlns:a_very_long_prefix="urn:b" xml:lang="en"><a_very_long_prefix:b/></my_ns:a>'
+        doc = xml.from_string(data)
+        compare_xml(data, doc.to_xml())
+
+        prefixes = dict((value, key) for key, value in doc.ns_map.items())
+        self.assertNotIn('_', prefixes['urn:a'])
+        self.assertNotIn('_', prefixes['urn:b'])
+
+    def test_prefixes_colliding_renamed(self):
+
+        # Names without a prefix that begin with one declared, followed by an underscore
+        for data in (
+            b'<a xmlns:p="urn:p"><p_x>1</p_x></a>',
+            b'<a xmlns:p="urn:p"><p:y/><p_x>1</p_x></a>',
+            b'<a xmlns:p="urn:p"><b p_x="1"><p:y p:z="2"/></b></a>',
+            b'<a xmlns:p="urn:p"><p_x xmlns="urn:d">1</p_x></a>',
+            b'<a xmlns:p="urn:p" xmlns:ns0="urn:q"><ns1_y/><p_x>1</p_x><p:z ns0_r="1"/></a>',
+        ):
+            doc = xml.from_string(data)
+            compare_xml(data, doc.to_xml())
+            self.assertEquals(xml.from_string(doc.to_xml()).to_xml(), doc.to_xml())
+
+        doc = xml.from_string(b'<a xmlns:p="urn:p"><p:y/><p_x>1</p_x></a>')
+        self.assertEquals(doc.a.p_x._zato_value, '1')
+        self.assertEquals(doc.to_xml(), b'<a xmlns:ns0="urn:p"><ns0:y/><p_x>1</p_x></a>')
+
+        # Records after the one names collided in are built with the same prefixes
+        data = b'<r xmlns:p="urn:p"><a><p_x>1</p_x></a><a><p:y/></a></r>'
+        records = list(xml.iter_records(BytesIO(data), '/r/a'))
+        self.assertEquals([record.to_xml() for record in records], [b'<a><p_x>1</p_x></a>', b'<a xmlns:ns0="urn:p"><ns0:y/></a>'])
+
+    def test_to_dict(self):
+        doc = xml.from_string(soap)
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+        self.assertEquals(arg0.to_dict(), {'arg0': {
+            '#is_req': 'true',
+            'user': 'my-user',
+            'role': 'my-role',
+            'access': [{'text':'no', '#type':'0'}, {'text':'yes', '#type':'1'}]}})
+
+    def test_mixed_content(self):
+        with self.assertRaises(ValueError) as ctx:
+            xml.from_string(b'<a>t<b>1</b>tail</a>')
+        self.assertEquals(ctx.exception.args[0], 'Mixed content is not supported, found text `tail` in `/a`')
+
+        # Whitespace between elements is not content
+        doc = xml.from_string(b'<a>\n  <b>1</b>\n  <c>2</c>\n</a>', XMLParser())
+        self.assertEquals(doc.a.c._zato_value, '2')
+
+
+# ################################################################################################################################
+
+orders = b"""<?xml version="1.0"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:my="urn:my">
+  <soap:Header><my:id>123</my:id></soap:Header>
+  <soap:Body>
+    <orders xmlns="urn:orders">
+      <order id="1"><my:sku>a</my:sku><qty>1</qty></order>
+      <order id="2"><my:sku>b</my:sku><qty>2</qty></order>
+      <other/>
+      <order id="3"><my:sku>c</my:sku><qty xmlns:q="urn:q" q:unit="kg">3</qty></order>
+    </orders>
+  </soap:Body>
+</soap:Envelope>
+"""
+
+class IterRecordsTestCase(TestCase):
+
+    def test_iter_records(self):
+        records = list(xml.iter_records(BytesIO(orders), '/soap:Envelope/soap:Body/orders/order'))
+        self.assertEquals(len(records), 3)
+
+        self.assertEquals([record.order._id._zato_value for record in records], ['1', '2', '3'])
+        self.assertEquals([record.order.my_sku._zato_value for record in records], ['a', 'b', 'c'])
+        self.assertEquals(records[2].order.qty._q_unit._zato_value, 'kg')
+
+        # Namespaces of enclosing elements are kept
+        compare_xml(
+            b'<order xmlns="urn:orders" xmlns:my="urn:my" id="1"><my:sku>a</my:sku><qty>1</qty></order>',
+            records[0].to_xml())
+
+        self.assertEquals(records[1].to_dict(), {'order': {'#id': '2', 'sku': 'b', 'qty': '2'}})
+
+    def test_ns_map(self):
+        path = '/s:Envelope/s:Body/o:orders/o:order'
+
+        ns_map = {'s':'http://schemas.xmlsoap.org/soap/envelope/', 'o':'urn:orders'}
+        self.assertEquals(len(list(xml.iter_records(BytesIO(orders), path, ns_map))), 3)
+
+        # Without ns_map, prefixes from the path are compared with ones from the document
+        self.assertEquals(len(list(xml.iter_records(BytesIO(orders), path))), 0)
+
+    def test_no_records(self):
+        self.assertEquals(list(xml.iter_records(BytesIO(orders), '/soap:Envelope/soap:Header/order')), [])
+
+    def test_memory_released(self):
+        # Elements records were built out of are cleared once they are processed and removed from the tree
+        # when the elements that follow them are
+        seen = []
+        events = iterparse(BytesIO(orders), events=('start-ns', 'start', 'end'), remove_blank_text=True)
+
+        def _events():
+            for event, value in events:
+                if event == 'end' and value.tag == '{urn:orders}order':
+                    seen.append(value)
+                yield event, value
+
+        reader = _RecordReader(xml, _PathMatcher('/soap:Envelope/soap:Body/orders/order'))
+
+        for record in reader.read(_events()):
+            for lxml_elem in seen[:-1]:
+                self.assertEquals(len(lxml_elem), 0)
+
+            for lxml_elem in seen[:-2]:
+                self.assertIsNone(lxml_elem.getparent())
+
+        self.assertEquals(len(seen), 3)
+
+# ################################################################################################################################
+
+class PushParserTestCase(TestCase):
+
+    def test_feed(self):
+        parser = xml.push_parser(depths=(3,))
+        records = []
+
+        for idx in range(0, len(orders), 7):
+            records.extend(parser.feed(orders[idx:idx+7]))
+        records.extend(parser.close())
+
+        self.assertEquals([record._zato_children[0]._zato_elem_name for record in records], ['order', 'order', 'other', 'order'])
+        self.assertEquals(records[3].order.qty._q_unit._zato_value, 'kg')
+        compare_xml(
+            b'<order xmlns="urn:orders" xmlns:my="urn:my" id="1"><my:sku>a</my:sku><qty>1</qty></order>',
+            records[0].to_xml())
+
+    def test_depths(self):
+        parser = xml.push_parser(depths=(1, 3))
+        records = parser.feed(orders) + parser.close()
+
+        # Elements at depth 3 are part of the Body, found at depth 1
+        self.assertEquals([record._zato_children[0]._zato_elem_name for record in records], ['soap_Header', 'soap_Body'])
+        self.assertEquals(len(records[1].soap_Body.orders._zato_list_children['order']), 3)
+
+    def test_documents_returned_as_soon_as_complete(self):
+        parser = xml.push_parser(depths=(3,))
+        idx = orders.index(b'</order>') + len(b'</order>')
+
+        self.assertEquals(parser.feed(orders[:idx - 1]), [])
+        self.assertEquals(len(parser.feed(orders[idx - 1:idx])), 1)
+
+    def test_not_well_formed(self):
+        parser = xml.push_parser()
+        parser.feed(orders[:100])
+        self.assertRaises(XMLSyntaxError, parser.close)
+
+    @skipIf(not PY3, 'asyncio is not available')
+    def test_asyncio(self):
+        import asyncio
+
+        loop = asyncio.new_event_loop()
+        reader = asyncio.StreamReader(loop=loop)
+        chunk_size = 16
+
+        # A stand-in for a socket, data arrives in chunks with the event loop running in between
+        def produce(idx=0):
+            if idx < len(orders):
+                reader.feed_data(orders[idx:idx+chunk_size])
+                loop.call_soon(produce, idx + chunk_size)
+            else:
+                reader.feed_eof()
+
+        parser = xml.push_parser(depths=(3,))
+        records = []
+        loop.call_soon(produce)
+
+        try:
+            while True:
+                data = loop.run_until_complete(reader.read(chunk_size))
+                if not data:
+                    break
+                records.extend(parser.feed(data))
+        finally:
+            loop.close()
+
+        records.extend(parser.close())
+
+        self.assertEquals([record.to_dict() for record in records], [
+            {'order': {'#id': '1', 'sku': 'a', 'qty': '1'}},
+            {'order': {'#id': '2', 'sku': 'b', 'qty': '2'}},
+            {'other': None},
+            {'order': {'#id': '3', 'sku': 'c', 'qty': {'text': '3', '#unit': 'kg'}}},
+        ])
+
+# ################################################################################################################################
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+from unittest import TestCase
+
+# lxml
+from lxml.etree import tostring
+
+# Zato
+from zato.elem import default_ns, xml
+
+# ################################################################################################################################
+
+class shadow_xml(xml):
+    __slots__ = ()
+    _zato_lxml_shadow = True
+
+# ################################################################################################################################
+
+def fill(doc):
+    doc.ns_map += default_ns.s12, default_ns.wsa, {'rem':'http://remoting.example.com'}
+
+    header = doc.s12_Envelope.s12_Header
+    header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+    header.wsa_Action._s12_mustUnderstand = '1'
+    header.wsa_MessageID = 'uuid:123'
+
+    arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+    arg0.user = 'my-user'
+    arg0.rem_access[0] = 'no'
+    arg0.rem_access[0]._rem_type = '0'
+    arg0.rem_access[1]._rem_type = '1'
+    arg0.rem_access[1].access = '111'
+
+    return doc
+
+# ################################################################################################################################
+
+class LXMLShadow(TestCase):
+    """ Tests lxml trees kept for documents and updated as documents change.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def _assert_same(self, doc, expected):
+        self.assertEquals(doc.to_xml(), expected.to_xml())
+        self.assertEquals(tostring(doc.to_xml(False)), expected.to_xml())
+        self.assertEquals(doc.to_xml(encoding='utf-8', xml_declaration=True),
+            expected.to_xml(encoding='utf-8', xml_declaration=True))
+        self.assertEquals(doc.to_xml(cleanup_ns=False), expected.to_xml(cleanup_ns=False))
+        self.assertEquals(doc.to_xml(), expected.to_xml())
+
+# ################################################################################################################################
+
+    def test_shadow_changes(self):
+        doc = fill(shadow_xml())
+        expected = fill(xml())
+
+        def change(func):
+            func(doc)
+            func(expected)
+            self._assert_same(doc, expected)
+
+        self._assert_same(doc, expected)
+
+        # Values
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Header, 'wsa_MessageID', 'uuid:456'))
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[1], '_zato_value', 'yes'))
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access.__setitem__(0, 'maybe'))
+
+        # Attributes
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Header.wsa_MessageID, '_rem_id', 'abc'))
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0, '_level', '2'))
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[0].__setitem__('@rem_type', '00'))
+
+        # New elements, including lists
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0, 'pwd', 'secret'))
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_access[2])
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.rem_item.__setitem__(0, 'a'))
+        change(lambda doc: doc.s12_Envelope.s12_Header.wsa_ReplyTo.wsa_Address)
+
+        # Namespaces
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin, 'ns', 'http://other.example.com'))
+        change(lambda doc: setattr(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0, 'ns_map', {'x':'http://x.example.com'}))
+        change(lambda doc: doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0.x_other)
+
+        # Whole subtrees, copied from other documents
+        change(lambda doc: setattr(
+            doc.s12_Envelope.s12_Body, 'copy', fill(doc.__class__()).s12_Envelope.s12_Body.rem_usrOrgRoleLogin))
+
+# ################################################################################################################################
+
+    def test_shadow_kept(self):
+        doc = fill(shadow_xml())
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+
+        expected = doc.to_xml()
+        shadow = doc._zato_shadow
+        lxml_root = shadow.root
+
+        # All elements refer to the same tree
+        self.assertIs(doc.s12_Envelope._zato_shadow, shadow)
+        self.assertIs(arg0.rem_access[1]._zato_shadow, shadow)
+        self.assertIs(doc.s12_Envelope._zato_shadow_elem, lxml_root)
+
+        # The tree itself is returned, without copying it
+        self.assertIs(doc.to_xml(False), lxml_root)
+        self.assertIs(doc.s12_Envelope.to_xml(False), lxml_root)
+        self.assertEquals(tostring(lxml_root), expected)
+
+        # Elements keep their own lxml elements, which are updated in place
+        arg0.user = 'my-user2'
+        arg0.rem_access[2] = 'new'
+        arg0._level = '3'
+
+        doc.to_xml()
+        self.assertIs(doc._zato_shadow, shadow)
+        self.assertIs(shadow.root, lxml_root)
+        self.assertIs(arg0.rem_access[2]._zato_shadow, shadow)
+        self.assertIs(arg0.user._zato_shadow_elem.getparent(), arg0._zato_shadow_elem)
+        self.assertEquals(arg0.user._zato_shadow_elem.text, 'my-user2')
+        self.assertEquals(arg0.rem_access[2]._zato_shadow_elem.text, 'new')
+        self.assertEquals(arg0._zato_shadow_elem.get('level'), '3')
+
+        # Namespaces changed through elements require a new tree
+        arg0.ns = 'http://other.example.com'
+        self.assertIsNone(shadow.root)
+
+        doc.to_xml()
+        self.assertIsNot(doc._zato_shadow, shadow)
+        self.assertIs(arg0.user._zato_shadow, doc._zato_shadow)
+
+        # So do other ways of cleaning up namespaces
+        shadow = doc._zato_shadow
+        doc.to_xml(cleanup_ns=False)
+        self.assertIsNot(doc._zato_shadow, shadow)
+
+# ################################################################################################################################
+
+    def test_shadow_invalid_value(self):
+        doc = shadow_xml()
+        doc.root.a = 'a'
+        doc.to_xml()
+
+        # lxml rejects the value only when the document is serialized, like it does when a new tree is built
+        doc.root.b = 123
+
+        try:
+            doc.to_xml()
+        except TypeError as e:
+            self.assertEquals(e.args[0], "Argument must be bytes or unicode, got 'int'")
+        else:
+            self.fail('Invalid value yet no TypeError raised')
+
+        doc.root.b = '123'
+        self.assertEquals(doc.to_xml(), b'<root><a>a</a><b>123</b></root>')
+
+# ################################################################################################################################
+
+    def test_shadow_not_used(self):
+        doc = fill(shadow_xml())
+        body = doc.s12_Envelope.s12_Body
+        doc.to_xml()
+
+        # Elements other than roots are serialized as before
+        self.assertIsNot(body.to_xml(False), body._zato_shadow_elem)
+        self.assertEquals(body.to_xml(), fill(xml()).s12_Envelope.s12_Body.to_xml())
+
+        # Same for documents of other classes
+        doc = fill(xml())
+        doc.to_xml()
+        self.assertIsNone(doc._zato_shadow)
+        self.assertIsNone(doc.s12_Envelope._zato_shadow)
+
+# ################################################################################################################################
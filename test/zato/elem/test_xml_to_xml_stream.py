@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+"""
+Copyright (C) 2016 Dariusz Suchojad <dsuch at zato.io>
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+
+Part of Zato - Open-Source ESB, SOA, REST, APIs and Cloud Integrations in Python
+https://zato.io
+"""
+
+# stdlib
+import sys
+from io import BytesIO
+from unittest import TestCase
+
+# lxml
+from lxml.etree import register_namespace
+
+# Zato
+from zato.elem import default_ns, xml
+
+# ################################################################################################################################
+
+class _ChunkedFile(object):
+    """ Records each chunk written to it.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+# ################################################################################################################################
+
+class ToXMLStream(TestCase):
+    """ Tests how to_xml_stream method works.
+    """
+    def setUp(self):
+        self.maxDiff = None
+
+    def _to_xml_stream(self, doc, *args, **kwargs):
+        out = BytesIO()
+        doc.to_xml_stream(out, *args, **kwargs)
+        return out.getvalue()
+
+    def _assert_same(self, doc, **kwargs):
+        self.assertEquals(self._to_xml_stream(doc, **kwargs), doc.to_xml(**kwargs))
+
+    def _get_soap_doc(self):
+        doc = xml()
+        doc.ns_map += default_ns.s12, default_ns.wsa, {'rem':'http://remoting.example.com',
+            'xsi':'http://www.w3.org/2001/XMLSchema-instance'}
+
+        header = doc.s12_Envelope.s12_Header
+        header.wsa_Action = 'urn:hl7-org:v3:MCCI_IN000002UV01'
+        header.wsa_Action._s12_mustUnderstand = '1'
+        header.wsa_MessageID = 'uuid:123'
+
+        arg0 = doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin.arg0
+        arg0._xsi_type = 'rem:Login'
+        arg0.user = 'my-user'
+        arg0.rem_access[0] = 'no'
+        arg0.rem_access[0]._rem_type = '0'
+        arg0.rem_access[1]._rem_type = '1'
+        arg0.rem_access[1].access = ''
+
+        other = arg0.other
+        other.ns = 'http://other.example.com'
+        other.a = 'aaa'
+        other.b.ns = 'http://www.w3.org/1999/XSL/Transform'
+
+        return doc
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_defaults(self):
+        doc = xml()
+        doc.root.ns = 'example.com'
+        doc.root.aaa = '111'
+        doc.root.bbb
+
+        self.assertEquals(
+            self._to_xml_stream(doc), b'<ns0:root xmlns:ns0="example.com"><ns0:aaa>111</ns0:aaa><ns0:bbb/></ns0:root>')
+        self._assert_same(doc)
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_ns(self):
+        doc = self._get_soap_doc()
+        self._assert_same(doc)
+        self._assert_same(doc, cleanup_ns=False)
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_ns_nested(self):
+        doc = xml()
+        doc.ns_map += {'x':'bar/x', 'rep':'bar/rep'}
+
+        root = doc.root
+        b = root.a.x_b[0]
+        b._foo = 'bar/foo1'
+        b.x_ccc = '111'
+        root.a.x_b[1]._foo = 'bar/foo2'
+        root.a.x_b[1].ns = 'bar/other'
+
+        self._assert_same(doc)
+        self._assert_same(doc, cleanup_ns=False)
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_register_namespace(self):
+        doc = xml()
+        doc.root.a.ns = 'urn:zato-elem-test-registered'
+        doc.root.a.b = 'b'
+        self._assert_same(doc)
+
+        # Prefixes registered with lxml after documents were serialized already are used from now on
+        register_namespace('zetr', 'urn:zato-elem-test-registered')
+        self.assertIn(b'<zetr:a', doc.to_xml())
+        self._assert_same(doc)
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_escape(self):
+        doc = xml()
+        doc.root.a = 'a & b < c > d "e" \'f\'\r\n\tg'
+        doc.root.a._b = 'a & b < c > d "e" \'f\'\r\n\tg'
+        doc.root.c = b'bytes'
+        doc.root.d = ''
+
+        self.assertEquals(self._to_xml_stream(doc), b'<root><a b="a &amp; b &lt; c &gt; d &quot;e&quot; \'f\'&#13;&#10;&#9;g">'
+            b'a &amp; b &lt; c &gt; d "e" \'f\'&#13;\n\tg</a><c>bytes</c><d></d></root>')
+        self._assert_same(doc)
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_encoding(self):
+        doc = xml()
+        doc.root.a = 'zażółć gęślą jaźń €'
+        doc.root.a._b = '€'
+
+        self._assert_same(doc)
+        self._assert_same(doc, encoding='utf-8')
+        self._assert_same(doc, encoding='iso-8859-2')
+        self._assert_same(doc, encoding='utf-16')
+        self._assert_same(doc, xml_declaration=True)
+        self._assert_same(doc, encoding='utf-8', xml_declaration=True)
+        self._assert_same(doc, encoding='iso-8859-2', xml_declaration=False)
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_serialize_non_root(self):
+        doc = self._get_soap_doc()
+        self._assert_same(doc.s12_Envelope.s12_Body.rem_usrOrgRoleLogin)
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_no_root(self):
+        doc = xml()
+        try:
+            self._to_xml_stream(doc)
+        except ValueError as e:
+            self.assertEquals(e.args[0], 'No root node found')
+        else:
+            self.fail('No root yet no ValueError raised')
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_invalid_value(self):
+        doc = xml()
+        doc.root.a = 123
+        try:
+            self._to_xml_stream(doc)
+        except TypeError as e:
+            self.assertEquals(e.args[0], "Argument must be bytes or unicode, got 'int'")
+        else:
+            self.fail('Invalid value yet no TypeError raised')
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_chunks(self):
+        doc = xml()
+        for idx in range(5000):
+            doc.root.item[idx] = str(idx)
+
+        out = _ChunkedFile()
+        doc.to_xml_stream(out, buffer_size=1024)
+
+        self.assertTrue(len(out.chunks) > 10)
+        self.assertTrue(all(len(chunk) >= 1024 for chunk in out.chunks[:-1]))
+        self.assertEquals(b''.join(out.chunks), doc.to_xml())
+
+# ################################################################################################################################
+
+    def test_to_xml_stream_deep(self):
+        doc = xml()
+        depth = sys.getrecursionlimit() + 100
+
+        elem = doc.root
+        for idx in range(depth):
+            elem = elem.a
+
+        expected = b'<root>' + b'<a>' * (depth - 1) + b'<a/>' + b'</a>' * (depth - 1) + b'</root>'
+        self.assertEquals(self._to_xml_stream(doc), expected)
+
+# ################################################################################################################################